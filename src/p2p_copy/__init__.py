@@ -5,7 +5,8 @@ import sys
 if hasattr(sys.stdout, "reconfigure"):  # on Python >= 3.7
     sys.stdout.reconfigure(line_buffering=True)
 
-__all__ = ["__version__", "send", "receive", "CompressMode"]
+__all__ = ["__version__", "send", "receive", "CompressMode", "run", "LoopKind", "GatherLayout", "TransferStats",
+           "EventLog"]
 try:
     __version__ = _v("p2p-copy")
 except Exception:
@@ -14,3 +15,7 @@ except Exception:
 # re-export
 from .api import send, receive
 from .compressor import CompressMode
+from .event_loop import run, LoopKind
+from .events import EventLog
+from .gather import GatherLayout
+from .stats import TransferStats
@@ -1,20 +1,54 @@
 from __future__ import annotations
 
 import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+from dataclasses import asdict
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, List, Tuple, BinaryIO, Dict
+from typing import Optional, List, Tuple, BinaryIO, Dict, Callable, Union, Awaitable
 
-from websockets.asyncio.client import connect
+from websockets.asyncio.connection import Connection
+from websockets.exceptions import ConnectionClosed, ConnectionClosedOK, WebSocketException
 
+from .capabilities import Settings, PROTOCOL_VERSION, local_capabilities, parse_capabilities, negotiate
+from .checkpoint import Checkpoint, RawChain, hash_tail, CHECKPOINT_EVERY
 from .compressor import CompressMode, Compressor
-from .io_utils import read_in_chunks, iter_manifest_entries, ensure_dir, compute_chain_up_to, CHUNK_SIZE
+from .direct import DirectListener, connect_direct
+from .events import EventLog, NO_EVENTS
+from .flow import CreditWindow, MAX_WINDOW
+from .gather import GatherLayout, GatherPlacement
+from .io_utils import read_in_chunks, iter_manifest_entries, ensure_dir, compute_chain_up_to, sync_file, CHUNK_SIZE, \
+    MIN_CHUNK, MAX_CHUNK, MAX_FRAME, max_chunk_for, chunk_size_for, resolve_inside
 from .protocol import (
-    Hello, Manifest, ManifestEntry, loads, EOF,
-    file_begin, FILE_EOF, pack_chunk, unpack_chunk,
+    Hello, Manifest, ManifestEntry, Capabilities, loads, EOF, DONE,
+    file_begin, FILE_EOF, pack_chunk, unpack_chunk, credit, window_request, nack, retransmit,
     encrypted_file_begin,
-    ReceiverManifest, ReceiverManifestEntry, EncryptedReceiverManifest
+    ReceiverManifest, ReceiverManifestEntry, EncryptedReceiverManifest,
+    SessionState, EncryptedSessionState, EncryptedSessionNonce
 )
 from .security import ChainedChecksum, SecurityHandler
+from .progress import ProgressCallback, ProgressReporter
+from .stats import TransferStats, FileStats
+from .tls import connect_relay
+from .tracing import Tracer, Span, NO_TRACER, CLIENT
+from .watchdog import LoopWatchdog
+
+
+# A data frame that arrives corrupted this many times in a row fails the transfer
+MAX_RETRANSMITS = 3
+
+# Bytes sent before the chunk size follows the measured throughput
+RATE_AFTER = 4 * CHUNK_SIZE
+
+
+class _Nacked(Exception):
+    """The receiver asked to send again from its position."""
+
+
+class _Unconfirmed(Exception):
+    """The connection was lost after the EOF, before the receiver's 'done' arrived."""
 
 
 # ----------------------------- sender --------------------------------
@@ -22,7 +56,19 @@ from .security import ChainedChecksum, SecurityHandler
 async def send(server: str, code: str, files: List[str],
                *, encrypt: bool = False,
                compress: CompressMode = CompressMode.auto,
-               resume: bool = False) -> int:
+               resume: bool = False,
+               spool: bool = False,
+               broadcast: int = 0,
+               gather: bool = False,
+               direct: bool = False,
+               reconnect: Optional[float] = None,
+               window: Optional[int] = None,
+               stats: Optional[TransferStats] = None,
+               progress: Optional[ProgressCallback] = None,
+               progress_interval: float = 0.5,
+               events: Optional[EventLog] = None,
+               stall_threshold: Optional[float] = None,
+               tracer: Optional[Tracer] = None) -> int:
     """
     Send one or more files or directories to a paired receiver via the relay server.
 
@@ -51,6 +97,56 @@ async def send(server: str, code: str, files: List[str],
         Enable resume of partial transfers. Default is False.
         If True, attempt to skip identical files and append
         incomplete files based on receiver feedback.
+    spool : bool, optional
+        Upload into the relay's store-and-forward spool. Default is False.
+        The receiver may connect later; requires a relay started with a
+        spool directory and cannot be combined with resume. Requires encrypt,
+        so the relay only stores ciphertext.
+    broadcast : int, optional
+        Send to this many receivers at once; each of them must join with
+        broadcast enabled. The files are read and uploaded only once.
+        Default is 0 (send to a single paired receiver). Cannot be combined
+        with resume or spool.
+    gather : bool, optional
+        Send to a receiver that gathers the files of many senders under the
+        same code. Default is False. Cannot be combined with spool or broadcast.
+    direct : bool, optional
+        After pairing, try to connect to the receiver directly and send the
+        data past the relay; falls back to the relay if no direct connection
+        can be made. The receiver needs to use the same setting. Requires
+        encrypt, as the direct connection has no TLS. Default is False.
+    reconnect : float, optional
+        If the connection is lost, keep reconnecting for this many seconds
+        and continue where the receiver stopped, mid-file, without re-reading
+        or re-hashing what it already has. The receiver follows automatically.
+        Cannot be combined with spool, broadcast, gather or direct. Default is
+        None (a lost connection fails the transfer).
+    window : int, optional
+        Flow control: send at most this many bytes of data ahead of what the
+        receiver has written, so a slow receiver holds the sender back instead
+        of filling the relay's buffers. 0 sizes the window automatically from
+        the measured round trip time and throughput. Cannot be combined with
+        spool or broadcast. Default is None (send as fast as the connection
+        takes the data).
+    stats : TransferStats, optional
+        Filled in with byte counts, per-file timings, time per stage and the
+        bottleneck stage. Default is None.
+    progress : ProgressCallback, optional
+        Called with a Progress (bytes and files done, throughput, ETA) every
+        progress_interval seconds and once at the end. Default is None.
+    progress_interval : float, optional
+        Seconds between progress reports. Default is 0.5.
+    events : EventLog, optional
+        Structured log for pairing, manifest, resume decisions, file start
+        and end, the end of the transfer and errors. Default is None.
+    stall_threshold : float, optional
+        While connected, report every time the event loop is blocked for
+        longer than this many seconds, with the stack of the blocking call,
+        and count it in stats. Default is None (no watchdog).
+    tracer : Tracer, optional
+        Record spans for connect, pairing, manifest, resume hashing and each
+        file. The trace id is sent in the hello and the manifest, so relay
+        and receiver add their spans to the same trace. Default is None.
 
     Returns
     -------
@@ -65,27 +161,56 @@ async def send(server: str, code: str, files: List[str],
 
     # Closures to break up functions for readability
 
+    def fail(msg: str) -> int:
+        print(f"[p2p_copy] send(): {msg}")
+        events.emit("error", message=msg, rc=3)
+        root.end(error=msg, rc=3)
+        return 3
+
     async def wait_for_receiver_ready():
+        nonlocal max_frame, peer_caps
         try:
             ready_frame = await asyncio.wait_for(ws.recv(), timeout=300)  # 300s Timeout
             if isinstance(ready_frame, str):
                 ready = loads(ready_frame)
                 if ready.get("type") != "ready":
-                    print("[p2p_copy] send(): unexpected frame after hello")
-                    return 3
+                    return fail("unexpected frame after hello")
+                # frames must fit the smallest message limit of relay and receiver
+                if isinstance(ready.get("max_frame"), int) and ready["max_frame"] > 0:
+                    max_frame = ready["max_frame"]
+                # receivers that exchange capabilities wait for the sender's before the manifest
+                peer_caps = isinstance(ready.get("caps"), int) and ready["caps"] > 0
             else:
-                print("[p2p_copy] send(): expected text frame after hello")
-                return 3
+                return fail("expected text frame after hello")
+        except asyncio.TimeoutError:
+            return fail("timeout waiting for ready")
+
+    async def exchange_capabilities():
+        nonlocal settings, compressor
+        mine = local_capabilities(encrypt, MAX_CHUNK)
+        offer = mine.to_json()
+        await ws.send(offer)
+        stats.bytes_wire += len(offer)
+        try:
+            o = {}
+            while o.get("type") in (None, "direct_offer"):  # a receiver offering a direct connection we do not use
+                raw = await asyncio.wait_for(ws.recv(), timeout=30)
+                o = loads(raw) if isinstance(raw, str) else {"type": "binary"}
         except asyncio.TimeoutError:
-            print("[p2p_copy] send(): timeout waiting for ready")
-            return 3
+            return fail("timeout waiting for the receiver's capabilities")
+        try:
+            settings = negotiate(mine, parse_capabilities(o))
+        except ValueError as e:
+            return fail(str(e))
+        if settings.codec == "none" and compress != CompressMode.off:
+            compressor = Compressor(mode=CompressMode.off)
+        events.emit("negotiated", **asdict(settings))
 
     async def wait_for_receiver_resume_manifest():
         try:
             raw = await asyncio.wait_for(ws.recv(), timeout=30)
         except asyncio.TimeoutError:
-            print("[p2p_copy] send(): timeout waiting for receiver_manifest")
-            return 3
+            return fail("timeout waiting for receiver_manifest")
         if isinstance(raw, str):
             o = loads(raw)
             t = o.get("type")
@@ -96,8 +221,7 @@ async def send(server: str, code: str, files: List[str],
                     o = loads(m_str)
                     t = o.get("type")
                 except Exception:
-                    print("[p2p_copy] send():  failed to decrypt encrypted receiver manifest")
-                    return 3
+                    return fail("failed to decrypt encrypted receiver manifest")
 
             if t == "receiver_manifest":
                 for e in o.get("entries", []):
@@ -107,95 +231,377 @@ async def send(server: str, code: str, files: List[str],
                         ch = bytes.fromhex(e["chain_hex"])
                         resume_map[p] = (sz, ch)
                     except Exception:
-                        print("[p2p_copy] send():  failed to read receiver manifest")
-                        return 3
+                        return fail("failed to read receiver manifest")
+
+    async def wait_for_spool_confirmation():
+        try:
+            raw = await asyncio.wait_for(ws.recv(), timeout=300)
+        except asyncio.TimeoutError:
+            return fail("timeout waiting for the relay to store the upload")
+        if not isinstance(raw, str) or loads(raw).get("type") != "spooled":
+            return fail("relay did not confirm the spooled upload")
 
     async def pairing_with_receiver():
+        nonlocal ws, manifest, retransmits
+        pairing = tracer.start("pairing", root)
         await ws.send(hello)
         if receiver_not_ready := await wait_for_receiver_ready():
             return receiver_not_ready
 
+        # Older receivers neither ask for frames again nor confirm the end with 'done'
+        retransmits = peer_caps and not (spool or broadcast)
+        manifest = Manifest(type="manifest", resume=resume, entries=entries, traceparent=root.traceparent,
+                            session=session, reconnect=reconnect or 0.0,
+                            window=(window or flow.window) if window is not None else 0,
+                            retransmit=retransmits).to_json()
+        if encrypt:  # Optionally encrypt the manifest
+            manifest = secure.build_encrypted_manifest(manifest)
+
+        # Optionally bypass the relay for the data
+        direct_ws = await connect_direct(ws) if direct else None
+        if direct_ws is not None:
+            connections.push_async_callback(direct_ws.close)
+            ws = direct_ws
+        events.emit("paired", seconds=time.perf_counter() - t_connected, direct=direct_ws is not None)
+        pairing.end(direct=direct_ws is not None)
+
+        # Agree on codec, checksum, cipher and limits with receivers that know how
+        if peer_caps and (not_negotiated := await exchange_capabilities()):
+            return not_negotiated
+
         # Send file infos to receiver
+        manifest_span = tracer.start("manifest", root, files=len(entries), resume=resume)
         await ws.send(manifest)
+        events.emit("manifest", files=len(entries), bytes=stats.bytes_total, resume=resume, encrypted=encrypt)
 
         # wait for receiver resume manifest (optionally encrypted)
         if resume and (no_response_manifest := await wait_for_receiver_resume_manifest()):
             return no_response_manifest
+        manifest_span.end(receiver_files=len(resume_map))
 
-    async def determine_file_resume_point():
+    async def determine_file_resume_point(file_span: Span):
+        # decided once per file, also when the transfer continues after a reconnect
+        if (known := resume_points.get(rel_p.as_posix())) is not None:
+            return known
+        append_from = 0
         hint = resume_map.get(rel_p.as_posix())
         if hint is not None:
             recv_size, recv_chain = hint
             if 0 < recv_size <= size:
-                hashed, local_chain = await compute_chain_up_to(abs_p, limit=recv_size)
+                with tracer.span("resume_hash", file_span, bytes=recv_size):
+                    hashed, local_chain = await compute_chain_up_to(abs_p, limit=recv_size)
                 if hashed == recv_size and local_chain == recv_chain:
-                    return recv_size
-                else:
-                    # mismatch -> overwrite from scratch
-                    return 0
-        return 0
-
-    async def send_file():
-        append_from = 0
-        # Determine resume point (optional)
-        if resume and (append_from := await determine_file_resume_point()) == size:
-            return  # Receiver already has identical file -> skip
-
-        # Open file and optionally seek resume point
-        with abs_p.open("rb") as fp:
-            if append_from:
-                await asyncio.to_thread(fp.seek, append_from, 0)
-
+                    append_from = recv_size
+                # else mismatch -> overwrite from scratch
+        events.emit("resume", path=rel_p.as_posix(), offset=append_from,
+                    action="skip" if append_from == size else "append" if append_from else "full")
+        if append_from == size:
+            stats.files_skipped += 1
+            stats.bytes_skipped += size
+        else:
+            stats.bytes_skipped += append_from
+        resume_points[rel_p.as_posix()] = append_from
+        return append_from
+
+    def pick_chunk_size() -> int:
+        # large chunks on fast links, small ones for small files and slow links
+        max_chunk = max_chunk_for(max_frame)
+        if settings is not None:
+            max_chunk = min(max_chunk, settings.max_chunk)
+        if flow is not None:
+            # a frame larger than the window would wait for everything in flight
+            max_chunk = min(max_chunk, max_chunk_for(max(2 * MIN_CHUNK, flow.window)))
+        rate = None
+        if stats.started is not None and stats.bytes_raw >= RATE_AFTER:
+            rate = stats.bytes_raw / max(1e-6, time.perf_counter() - stats.started)
+        return chunk_size_for(size, max_chunk, rate)
+
+    async def send_file(position: Optional[dict] = None):
+        if position is not None:
+            # Continue the file the receiver has open, from its chain state
+            file_stats, file_span, t_file = in_flight.get(rel_p.as_posix()) or (
+                FileStats(path=rel_p.as_posix(), size=size, append_from=position["offset"],
+                          compression=position["compression"]),
+                tracer.start("file", root, path=rel_p.as_posix(), size=size), time.perf_counter())
+            offset, seq = position["offset"], position["seq"]
+            chained_checksum = ChainedChecksum(bytes.fromhex(position["chain_hex"]))
+            compressor.set_compression(position["compression"])
+        else:
+            append_from = 0
+            file_span = tracer.start("file", root, path=rel_p.as_posix(), size=size)
+            # Determine resume point (optional)
+            if resume:
+                append_from = await determine_file_resume_point(file_span)
+                if append_from == size:
+                    file_span.end(skipped=True)
+                    return  # Receiver already has identical file -> skip
+
+            file_stats = FileStats(path=rel_p.as_posix(), size=size, append_from=append_from)
+            t_file = time.perf_counter()
             # Initialize per-transfer chain and sequence
+            offset, seq = append_from, 0
             chained_checksum = ChainedChecksum()
-            seq = 0
+        in_flight[rel_p.as_posix()] = (file_stats, file_span, t_file)
+        frame: Optional[bytes] = None
+        wire = 0
+        chunk_size = pick_chunk_size()
 
-            # Determine whether to use compression by compressing the first chunk
-            chunk = await asyncio.to_thread(fp.read, CHUNK_SIZE)
-            chunk = await Compressor.determine_compression(compressor, chunk)
-
-            # Build the complete file info header
-            file_info = file_begin(rel_p.as_posix(), size, compressor.compression_type, append_from=append_from)
-
-            # Optionally encrypt the file info
-            if encrypt:
-                enc_file_info = secure.encrypt_chunk(file_info.encode())
-                file_info = encrypted_file_begin(enc_file_info)
-
-            # Send file info header
-            await ws.send(file_info)
-
-            # Prepare the first frame, first chunk is optionally compressed and then encrypted
-            frame: bytes = pack_chunk(seq, chained_checksum.next_hash(chunk), secure.encrypt_chunk(chunk))
-            seq += 1
+        # Open file and optionally seek resume point
+        with abs_p.open("rb") as fp:
+            if offset:
+                await asyncio.to_thread(fp.seek, offset, 0)
 
             def next_frame():
                 """prepares the next frame of a file to send, optionally compresses and encrypts"""
+                t_compress = time.perf_counter()
                 compressed_chunk = compressor.compress(chunk)
+                t_encrypt = time.perf_counter()
                 enc_chunk = secure.encrypt_chunk(compressed_chunk)
-                return pack_chunk(seq, chained_checksum.next_hash(compressed_chunk), enc_chunk)
+                t_hash = time.perf_counter()
+                chain = chained_checksum.next_hash(compressed_chunk)
+                stats.add("compress", t_encrypt - t_compress)
+                stats.add("encrypt", t_hash - t_encrypt)
+                stats.add("hash", time.perf_counter() - t_hash)
+                file_stats.bytes_compressed += len(compressed_chunk)
+                return pack_chunk(seq, chain, enc_chunk)
+
+            if position is None:
+                # Determine whether to use compression by compressing the first chunk
+                t0 = time.perf_counter()
+                chunk = await asyncio.to_thread(fp.read, chunk_size)
+                t1 = time.perf_counter()
+                file_stats.bytes_raw = len(chunk)
+                stats.bytes_raw += len(chunk)
+                chunk = await Compressor.determine_compression(compressor, chunk)
+                stats.add("read", t1 - t0)
+                stats.add("compress", time.perf_counter() - t1)
+                file_stats.compression = compressor.compression_type
+                file_stats.bytes_compressed = len(chunk)
+
+                # Build the complete file info header
+                file_info = file_begin(rel_p.as_posix(), size, compressor.compression_type, append_from=append_from)
+
+                # Optionally encrypt the file info
+                if encrypt:
+                    enc_file_info = secure.encrypt_chunk(file_info.encode())
+                    file_info = encrypted_file_begin(enc_file_info)
+
+                # Send file info header
+                await ws.send(file_info)
+                wire = len(file_info)
+                events.emit("file_start", path=file_stats.path, size=size, compression=file_stats.compression,
+                            append_from=append_from, chunk=chunk_size)
+
+                # Prepare the first frame, first chunk is optionally compressed and then encrypted
+                t_encrypt = time.perf_counter()
+                enc_chunk = secure.encrypt_chunk(chunk)
+                t_hash = time.perf_counter()
+                frame = pack_chunk(seq, chained_checksum.next_hash(chunk), enc_chunk)
+                stats.add("encrypt", t_hash - t_encrypt)
+                stats.add("hash", time.perf_counter() - t_hash)
+                seq += 1
+            elif offset < size:
+                # The receiver has everything before offset, the next chunk starts there
+                chunk = await asyncio.to_thread(fp.read, chunk_size)
+                file_stats.bytes_raw += len(chunk)
+                stats.bytes_raw += len(chunk)
+                frame = await asyncio.to_thread(next_frame)
+                seq += 1
 
             # Send remaining chunks
-            async for chunk in read_in_chunks(fp):
+            t_read = time.perf_counter()
+            async for chunk in read_in_chunks(fp, chunk_size=chunk_size):
+                t_send = time.perf_counter()
+                stats.add("read", t_send - t_read)
+                file_stats.bytes_raw += len(chunk)
+                stats.bytes_raw += len(chunk)
                 # Next frame gets prepared in a parallel thread
-                next_frame_coro = asyncio.to_thread(next_frame)
+                next_frame_task = asyncio.create_task(asyncio.to_thread(next_frame))
                 # Send the current frame while next frame gets prepared
-                await ws.send(frame)
-                # Complete the next frame
-                frame: bytes = await next_frame_coro
+                try:
+                    waited = await send_frame(frame)
+                    wire += len(frame)
+                    stats.add("send_wait", time.perf_counter() - t_send - waited)
+                finally:
+                    # Complete the next frame
+                    frame: bytes = await next_frame_task
                 seq += 1
+                t_read = time.perf_counter()
 
         # Send the last frame
-        await ws.send(frame)
+        t_send = time.perf_counter()
+        waited = 0.0
+        if frame is not None:
+            waited = await send_frame(frame)
+            wire += len(frame)
         await ws.send(FILE_EOF)
+        stats.add("send_wait", time.perf_counter() - t_send - waited)
+
+        del in_flight[rel_p.as_posix()]
+        file_stats.seconds = time.perf_counter() - t_file
+        stats.files.append(file_stats)
+        stats.bytes_compressed += file_stats.bytes_compressed
+        stats.bytes_wire += wire + len(FILE_EOF)
+        events.emit("file_end", path=file_stats.path, bytes=file_stats.bytes_raw,
+                    compressed=file_stats.bytes_compressed, seconds=file_stats.seconds)
+        file_span.end(append_from=file_stats.append_from, compression=file_stats.compression,
+                      bytes=file_stats.bytes_raw, compressed=file_stats.bytes_compressed)
+
+    async def send_frame(frame: bytes) -> float:
+        if nacked is not None:
+            raise _Nacked()  # the receiver drops everything until the retransmit
+        # with flow control, a data frame waits for the receiver's credit
+        if flow is None:
+            await ws.send(frame)
+            return 0.0
+        waited = await flow.acquire(len(frame))
+        stats.add("credit_wait", waited)
+        if (wanted := flow.wanted()) is not None:
+            await ws.send(window_request(wanted))
+            events.emit("window", bytes=wanted, rtt=round(flow.min_rtt, 4), rate=round(flow.max_rate))
+        await ws.send(frame)
+        return waited
+
+    async def read_feedback(conn: Connection) -> Optional[ConnectionClosed]:
+        # reads what the receiver sends during the transfer, until its 'done' or the end of the connection
+        nonlocal nacked
+        try:
+            while True:
+                raw = await conn.recv()
+                o = loads(raw) if isinstance(raw, str) else {}
+                t = o.get("type")
+                if t == "credit" and flow is not None:
+                    if "window" in o:
+                        flow.open(int(o["window"]))
+                    if o.get("bytes"):
+                        flow.grant(int(o["bytes"]))
+                elif t == "nack":
+                    nacked = o
+                    got_nack.set()
+                elif t == "done":
+                    return None
+        except ConnectionClosed as e:
+            if flow is not None:
+                flow.close(e)  # a sender waiting for credit gets the error
+            return e
+
+    async def stop_reading_feedback():
+        feedback.cancel()
+        try:
+            await feedback
+        except asyncio.CancelledError:
+            pass
+
+    async def send_again() -> Optional[dict]:
+        # answer the nack; the receiver continues from its position, as after a reconnect
+        nonlocal nacked
+        o, nacked = nacked, None
+        got_nack.clear()
+        await ws.send(retransmit(int(o["id"])))
+        if (position := await read_session_state(o.get("state", ""))) is not None:
+            stats.retransmits += 1
+            events.emit("retransmit", path=position.get("path"), offset=position.get("offset"),
+                        seq=position.get("seq"))
+        return position
+
+    def continue_at(position: Optional[dict]) -> Tuple[int, Optional[dict]]:
+        # index of the first file to send, and the receiver's position in it
+        if position is None:
+            return 0, None
+        names = [rel.as_posix() for _, rel, _ in resolved_file_list]
+        if position.get("path") is not None:
+            return names.index(position["path"]), position
+        if position.get("last") is not None:
+            return names.index(position["last"]) + 1, None
+        return 0, None
+
+    async def read_session_state(raw: Union[str, bytes]) -> Optional[dict]:
+        try:
+            o = loads(raw)
+            if encrypt:
+                o = loads(secure.unseal(bytes.fromhex(o["hidden_state"])).decode())
+            if o.get("type") != "session_state":
+                return None
+            continue_at(o)  # the position must name a file of this transfer
+        except Exception:
+            return None
+        if encrypt:
+            # a fresh nonce chain, the old one may have been used past the receiver's position
+            seed = os.urandom(32)
+            await ws.send(EncryptedSessionNonce(type="enc_session_nonce",
+                                                hidden_nonce=secure.seal(seed).hex()).to_json())
+            secure.nonce_hasher.prev_chain = seed
+        return o
+
+    async def reconnect_to_receiver(lost: ConnectionClosed) -> Optional[dict]:
+        nonlocal ws
+        events.emit("connection_lost", message=str(lost))
+        t_lost = time.monotonic()
+        deadline = t_lost + reconnect
+        delay, attempts = 0.5, 0
+        while time.monotonic() < deadline:
+            attempts += 1
+            try:
+                ws = await connections.enter_async_context(
+                    connect_relay(server, max_size=MAX_FRAME, compression=None))
+                await ws.send(reconnect_hello)
+                ready = await asyncio.wait_for(ws.recv(), timeout=max(0.1, deadline - time.monotonic()))
+                if isinstance(ready, str) and loads(ready).get("type") == "ready":
+                    raw = await asyncio.wait_for(ws.recv(), timeout=30)
+                    if (position := await read_session_state(raw)) is not None:
+                        stats.reconnects += 1
+                        events.emit("reconnected", attempts=attempts, seconds=round(time.monotonic() - t_lost, 3),
+                                    path=position.get("path"), offset=position.get("offset"))
+                        return position
+            except (OSError, asyncio.TimeoutError, WebSocketException):
+                pass
+            # leave the waiting room, or the next attempt would be a duplicate sender
+            await ws.close()
+            # back off, but not past the deadline
+            await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+            delay = min(2 * delay, 8.0)
+        return None
+
+    async def wait_for_done():
+        # the 'done' comes along with credits and nacks
+        nack_task = asyncio.create_task(got_nack.wait())
+        await asyncio.wait((feedback, nack_task), return_when=asyncio.FIRST_COMPLETED)
+        nack_task.cancel()
+        if nacked is not None:
+            raise _Nacked()
+        # a receiver that closed cleanly after the EOF has everything
+        if (lost := feedback.result()) is not None and not isinstance(lost, ConnectionClosedOK):
+            # the receiver may have finished and will then not reconnect; do not wait for it
+            raise _Unconfirmed(lost)
 
     # End of Closures
 
+    events = (events or NO_EVENTS).bind(source="sender")
+    tracer = tracer or NO_TRACER
+    root = tracer.start("send", kind=CLIENT, server=server, encrypted=encrypt, resume=resume)
+    if spool and resume:
+        return fail("resume needs a connected receiver and cannot be used with spool")
+    if spool and not encrypt:
+        return fail("spool needs encrypt, the relay keeps the upload on its disk")
+    if broadcast and (resume or spool):
+        return fail("broadcast cannot be used with resume or spool")
+    if gather and (spool or broadcast):
+        return fail("gather cannot be used with spool or broadcast")
+    if direct and (spool or broadcast or gather):
+        return fail("direct needs a single paired receiver")
+    if direct and not encrypt:
+        return fail("direct needs encrypt, the direct connection has no TLS")
+    if reconnect is not None and (spool or broadcast or gather or direct):
+        return fail("reconnect needs a single paired receiver over the relay")
+    if window is not None and (spool or broadcast):
+        return fail("flow control needs a connected receiver and cannot be used with spool or broadcast")
+    if window is not None and not 0 <= window <= MAX_WINDOW:
+        return fail(f"window must be between 1 byte and {MAX_WINDOW // 2**20} MiB, or 0 for auto")
+
     # Build manifest entries from given file list
     resolved_file_list: List[Tuple[Path, Path, int]] = list(iter_manifest_entries(files))
     if not resolved_file_list:
-        print("[p2p_copy] send(): no legal files where passed")
-        return 3
+        return fail("no legal files where passed")
 
     entries: List[ManifestEntry] = [ManifestEntry(path=rel.as_posix(), size=size) for (_, rel, size) in
                                     resolved_file_list]
@@ -203,35 +609,121 @@ async def send(server: str, code: str, files: List[str],
     # Initialize security-handler, compressor
     secure = SecurityHandler(code, encrypt)
     compressor = Compressor(mode=compress)
-
-    hello = Hello(type="hello", code_hash_hex=secure.code_hash.hex(), role="sender").to_json()
-    manifest = Manifest(type="manifest", resume=resume, entries=entries).to_json()
-    if encrypt:  # Optionally encrypt the manifest
-        manifest = secure.build_encrypted_manifest(manifest)
+    stats = stats if stats is not None else TransferStats()
+    stats.files_total = len(entries)
+    stats.bytes_total = sum(e.size for e in entries)
+    events = events.bind(pair=secure.code_hash.hex()[:12])
+
+    root.set(files=len(entries), bytes=stats.bytes_total)
+    # Largest message the relay and the receiver accept, as the relay tells in 'ready'
+    max_frame = MAX_FRAME
+    # Whether the receiver exchanges capabilities, and the settings agreed on with it
+    peer_caps = False
+    settings: Optional[Settings] = None
+    # Credit-based flow control, if asked for
+    flow = CreditWindow(window) if window is not None else None
+    # A single receiver that exchanges capabilities can ask for corrupted frames again;
+    # it sends credits, nacks and 'done' during the transfer
+    retransmits = False
+    feedback: Optional[asyncio.Task] = None
+    nacked: Optional[dict] = None
+    got_nack = asyncio.Event()
+    # Reconnecting clients identify their session by a random id
+    session = os.urandom(16).hex() if reconnect is not None else ""
+    hello = Hello(type="hello", code_hash_hex=secure.code_hash.hex(), role="sender", spool=spool,
+                  broadcast=broadcast > 0, receivers=broadcast, gather=gather,
+                  traceparent=root.traceparent, session=session).to_json()
+    reconnect_hello = Hello(type="hello", code_hash_hex=secure.code_hash.hex(), role="sender",
+                            traceparent=root.traceparent, session=session, reconnect=True).to_json()
+    # Built once the receiver is known, as its retransmit setting depends on the receiver
+    manifest = ""
 
     # Connect to relay (disable WebSocket internal compression)
-    async with connect(server, max_size=2**21, compression=None) as ws:
-        # Stores info returned by the sender about what files are already present
-        resume_map: Dict[str, Tuple[int, bytes]] = {}
-        # Attempt to connect and optionally exchange info with receiver
-        if pairing_failed := await pairing_with_receiver():
-            return pairing_failed
-
-        # Transfer each file
-        for abs_p, rel_p, size in resolved_file_list:
-            await send_file()
-
-        # All done, send message to confirm the end of the copying process
-        await ws.send(EOF)
-        # Return non-error code
-        return 0
+    connecting = tracer.start("connect", root, server=server)
+    try:
+        async with connect_relay(server, max_size=MAX_FRAME, compression=None) as ws, AsyncExitStack() as connections, \
+                ProgressReporter(stats, progress, progress_interval), LoopWatchdog(stall_threshold, stats, events):
+            connecting.end()
+            # Stores info returned by the sender about what files are already present
+            resume_map: Dict[str, Tuple[int, bytes]] = {}
+            # Resume point per file, and stats, span and start time of the file being sent
+            resume_points: Dict[str, int] = {}
+            in_flight: Dict[str, Tuple[FileStats, Span, float]] = {}
+            # Attempt to connect and optionally exchange info with receiver
+            t_connected = time.perf_counter()
+            events.emit("connect", server=server)
+            if pairing_failed := await pairing_with_receiver():
+                return pairing_failed
+            stats.begin("sender")
+            stats.pairing_seconds = time.perf_counter() - t_connected
+
+            # Transfer each file; after a lost connection or a corrupted frame from where the receiver stopped
+            position: Optional[dict] = None
+            while True:
+                if (retransmits or flow is not None) and (feedback is None or feedback.done()):
+                    if flow is not None:
+                        # the receiver grants the window anew on every connection
+                        flow.reset()
+                    feedback = asyncio.create_task(read_feedback(ws))
+                try:
+                    if nacked is not None and (position := await send_again()) is None:
+                        return fail("receiver asked to send again from an unknown position")
+                    start, first_position = continue_at(position)
+                    for abs_p, rel_p, size in resolved_file_list[start:]:
+                        await send_file(first_position)
+                        first_position = None
+
+                    # All done, send message to confirm the end of the copying process
+                    await ws.send(EOF)
+                    if retransmits:
+                        await wait_for_done()
+                    break
+                except _Nacked:
+                    continue
+                except _Unconfirmed as e:
+                    return fail(f"completion unconfirmed, connection to relay lost after the last file: {e}")
+                except ConnectionClosed as e:
+                    if not session:
+                        raise
+                    if feedback is not None:
+                        await stop_reading_feedback()
+                        nacked = None  # the receiver reports its position on the new connection
+                        got_nack.clear()
+                    if (position := await reconnect_to_receiver(e)) is None:
+                        return fail(f"connection to relay lost, no reconnect within {reconnect:g} s: {e}")
+            if feedback is not None:
+                await stop_reading_feedback()
+            stats.bytes_wire += len(manifest) + len(EOF)
+            stats.end()
+            # A spooled upload is only done once the relay has stored it
+            if spool and (not_spooled := await wait_for_spool_confirmation()):
+                return not_spooled
+            events.emit("transfer_end", rc=0, files=len(stats.files), bytes=stats.bytes_raw,
+                        seconds=stats.elapsed, bottleneck=stats.bottleneck)
+            root.end(rc=0)
+            # Return non-error code
+            return 0
+    except ConnectionClosed as e:
+        return fail(f"connection to relay lost: {e}")
 
 
 # ----------------------------- receiver ------------------------------
 
 async def receive(server: str, code: str,
                   *, encrypt: bool = False,
-                  out: Optional[str] = None) -> int:
+                  out: Optional[str] = None,
+                  broadcast: bool = False,
+                  gather: int = 0,
+                  layout: GatherLayout = GatherLayout.subdirs,
+                  direct: bool = False,
+                  checkpoint_every: Optional[int] = CHECKPOINT_EVERY,
+                  max_frame: int = MAX_FRAME,
+                  stats: Optional[TransferStats] = None,
+                  progress: Optional[ProgressCallback] = None,
+                  progress_interval: float = 0.5,
+                  events: Optional[EventLog] = None,
+                  stall_threshold: Optional[float] = None,
+                  tracer: Optional[Tracer] = None) -> int:
     """
     Receive files from a paired sender via the relay server and write to the output directory.
 
@@ -253,6 +745,49 @@ async def receive(server: str, code: str,
         Sender needs to use the same setting.
     out : str, optional
         Output directory. Default is current directory.
+    broadcast : bool, optional
+        Join a one-to-many broadcast of a sender instead of pairing. Default is False.
+    gather : int, optional
+        Collect the files of this many senders that use the same code and
+        send with gather enabled, concurrently in one session. Default is 0
+        (receive from a single paired sender).
+    layout : GatherLayout, optional
+        Gather only: one subdirectory 'sender-<n>' per sender, or a merged
+        tree where conflicting files are renamed or fail the later sender.
+        Default is 'subdirs'.
+    direct : bool, optional
+        Listen for a direct connection from the sender and offer its addresses
+        through the relay; the relay is used if the sender cannot connect.
+        The sender needs to use the same setting. Requires encrypt, as the
+        direct connection has no TLS. Default is False.
+    checkpoint_every : int, optional
+        Every this many bytes of a file, sync it to disk and write a
+        checkpoint of its checksum chain next to it, so a later resume only
+        hashes what was written after the last checkpoint. Default is 64 MiB;
+        None disables checkpoints.
+    max_frame : int, optional
+        Largest WebSocket message to accept. The relay passes the limit on to
+        the sender, which sizes its chunks to fit; raise it for fast links
+        with a high latency, where larger frames cut the per-frame overhead.
+        Default is MAX_FRAME (2 MiB); broadcasts always use the default.
+    stats : TransferStats, optional
+        Filled in with byte counts, per-file timings, time per stage and the
+        bottleneck stage. Gathered streams add up into it. Default is None.
+    progress : ProgressCallback, optional
+        Called with a Progress (bytes and files done, throughput, ETA) every
+        progress_interval seconds and once at the end. Default is None.
+    progress_interval : float, optional
+        Seconds between progress reports. Default is 0.5.
+    events : EventLog, optional
+        Structured log for pairing, manifest, resume decisions, file start
+        and end, the end of the transfer and errors. Default is None.
+    stall_threshold : float, optional
+        While connected, report every time the event loop is blocked for
+        longer than this many seconds, with the stack of the blocking call,
+        and count it in stats. Default is None (no watchdog).
+    tracer : Tracer, optional
+        Record spans for connect, pairing, manifest, resume hashing and each
+        file, in the sender's trace once its manifest has arrived. Default is None.
 
     Returns
     -------
@@ -264,6 +799,202 @@ async def receive(server: str, code: str,
     - Supports resume if sender requests it.
     - Writes files to the output directory, preserving relative paths.
     - Info on whether to resume and compress is received from the sender
+    - Gathered streams share one event loop, the derived keys and a writer thread pool.
+    """
+
+    out_dir = Path(out or ".")
+    ensure_dir(out_dir)
+
+    events = (events or NO_EVENTS).bind(source="receiver")
+    if direct and (broadcast or gather):
+        print("[p2p_copy] receive(): direct needs a single paired sender")
+        events.emit("error", message="direct needs a single paired sender", rc=4)
+        return 4
+    if direct and not encrypt:
+        print("[p2p_copy] receive(): direct needs encrypt, the direct connection has no TLS")
+        events.emit("error", message="direct needs encrypt, the direct connection has no TLS", rc=4)
+        return 4
+    if max_frame < 2 * MIN_CHUNK or (broadcast and max_frame != MAX_FRAME):
+        msg = f"max_frame must be at least {2 * MIN_CHUNK // 1024} KiB, and the default for broadcast"
+        print(f"[p2p_copy] receive(): {msg}")
+        events.emit("error", message=msg, rc=4)
+        return 4
+
+    secure = SecurityHandler(code, encrypt)
+    stats = stats if stats is not None else TransferStats()
+    events = events.bind(pair=secure.code_hash.hex()[:12])
+    events.emit("connect", server=server)
+    tracer = tracer or NO_TRACER
+    root = tracer.start("receive", kind=CLIENT, server=server, encrypted=encrypt)
+    async with ProgressReporter(stats, progress, progress_interval), LoopWatchdog(stall_threshold, stats, events):
+        if gather:
+            rc = await _gather(server, secure, out_dir, gather, layout, checkpoint_every, max_frame, stats, events,
+                               tracer, root)
+        else:
+            rc = await _receive(server, secure, out_dir, broadcast, direct, checkpoint_every, max_frame, stats, events,
+                                tracer, root)
+    root.end(error=f"exit code {rc}" if rc else None, rc=rc)
+    return rc
+
+
+async def _receive(server: str, secure: SecurityHandler, out_dir: Path, broadcast: bool, direct: bool,
+                   checkpoint_every: Optional[int], max_frame: int, stats: TransferStats, events: EventLog, tracer: Tracer, root: Span) -> int:
+    """
+    Receive from a single sender, over the relay or a direct connection.
+
+    Returns
+    -------
+    int
+        Exit code: 0 on success, 4 on error.
+    """
+    # broadcasts are started by the relay, without a capability exchange
+    capabilities = None if broadcast else local_capabilities(secure.encrypt, max_chunk_for(max_frame))
+    hello = Hello(type="hello", code_hash_hex=secure.code_hash.hex(), role="receiver",
+                  broadcast=broadcast, max_frame=max_frame, caps=0 if broadcast else PROTOCOL_VERSION).to_json()
+
+    def place(rel: str) -> Path:
+        return resolve_inside(out_dir, rel)
+
+    async def reconnect_relay(session: str) -> Connection:
+        new_ws = await connections.enter_async_context(connect_relay(server, max_size=max_frame, compression=None))
+        await new_ws.send(Hello(type="hello", code_hash_hex=secure.code_hash.hex(), role="receiver",
+                                session=session, reconnect=True,
+                                max_frame=max_frame).to_json())
+        return new_ws
+
+    connecting = tracer.start("connect", root, server=server)
+    async with connect_relay(server, max_size=max_frame, compression=None) as ws, AsyncExitStack() as connections:
+        connecting.end()
+        await ws.send(hello)
+        if not direct:
+            return await _receive_stream(ws, secure, place, checkpoint_every=checkpoint_every, stats=stats,
+                                         events=events, tracer=tracer, span=root, capabilities=capabilities,
+                                         reconnect=None if broadcast else reconnect_relay)
+
+        listener = await DirectListener.start(ws, max_frame)
+        try:
+            # continue on the direct connection, or on the relay if the sender could not connect
+            try:
+                stream_ws, first_frame = await listener.accept(ws)
+            except ConnectionClosed as e:
+                print(f"[p2p_copy] receive(): connection lost: {e}")
+                events.emit("error", message=f"connection lost: {e}", rc=4)
+                return 4
+            return await _receive_stream(stream_ws, secure, place, first=first_frame,
+                                         checkpoint_every=checkpoint_every, stats=stats,
+                                         events=events.bind(direct=stream_ws is not ws), tracer=tracer, span=root,
+                                         capabilities=capabilities)
+        finally:
+            listener.close()
+
+
+async def _gather(server: str, secure: SecurityHandler, out_dir: Path, count: int, layout: GatherLayout,
+                  checkpoint_every: Optional[int], max_frame: int, stats: TransferStats, events: EventLog, tracer: Tracer, root: Span) -> int:
+    """
+    Receive from several senders concurrently under one code.
+
+    The relay announces every sender on the control connection; each one is then
+    received over its own connection, so framing and encryption stay per stream.
+    The spans of a stream move into the trace of its sender.
+
+    Returns
+    -------
+    int
+        Exit code: 0 if all streams succeeded, 4 otherwise.
+    """
+
+    placement = GatherPlacement(out_dir, layout)
+    code_hash = secure.code_hash.hex()
+    capabilities = local_capabilities(secure.encrypt, max_chunk_for(max_frame))
+
+    async def receive_one(stream: int) -> int:
+        hello = Hello(type="hello", code_hash_hex=code_hash, role="receiver", gather=True, stream=stream,
+                      max_frame=max_frame, caps=PROTOCOL_VERSION).to_json()
+        stream_span = tracer.start("stream", root, stream=stream)
+        try:
+            async with connect_relay(server, max_size=max_frame, compression=None) as ws:
+                await ws.send(hello)
+                rc = await _receive_stream(ws, secure.fork(), lambda rel: placement.place(stream, rel),
+                                           writer=writer, prefix=f"sender {stream}: ",
+                                           checkpoint_every=checkpoint_every, stats=stats,
+                                           events=events.bind(stream=stream), tracer=tracer, span=stream_span,
+                                           capabilities=capabilities)
+        except ConnectionClosed as e:
+            print(f"[p2p_copy] receive(): sender {stream}: connection lost: {e}")
+            events.emit("error", message=f"connection lost: {e}", rc=4, stream=stream)
+            rc = 4
+        stream_span.end(error=f"exit code {rc}" if rc else None, rc=rc)
+        return rc
+
+    tasks: List[asyncio.Task] = []
+    with ThreadPoolExecutor(thread_name_prefix="p2p_copy-writer") as writer:
+        async with connect_relay(server, max_size=max_frame, compression=None) as control:
+            await control.send(Hello(type="hello", code_hash_hex=code_hash, role="receiver", gather=True).to_json())
+            async for frame in control:
+                o = loads(frame) if isinstance(frame, str) else {}
+                if o.get("type") == "gather_join":
+                    tasks.append(asyncio.create_task(receive_one(int(o["stream"]))))
+                    if len(tasks) == count:
+                        break
+        results = await asyncio.gather(*tasks)
+    if len(results) < count:
+        msg = f"relay closed the gather session after {len(results)} of {count} senders"
+        print(f"[p2p_copy] receive(): {msg}")
+        events.emit("error", message=msg, rc=4)
+        return 4
+    return 0 if not any(results) else 4
+
+
+async def _receive_stream(ws: Connection, secure: SecurityHandler, place: Callable[[str], Path],
+                          *, writer: Optional[Executor] = None, prefix: str = "",
+                          first: Optional[Union[str, bytes]] = None,
+                          checkpoint_every: Optional[int] = None,
+                          stats: Optional[TransferStats] = None,
+                          events: EventLog = NO_EVENTS,
+                          tracer: Tracer = NO_TRACER,
+                          span: Optional[Span] = None,
+                          capabilities: Optional[Capabilities] = None,
+                          reconnect: Optional[Callable[[str], Awaitable[Connection]]] = None) -> int:
+    """
+    Receive one sender's stream from an open connection.
+
+    Parameters
+    ----------
+    ws : Connection
+        Connection to the relay on which the hello has been sent, or a direct connection to the sender.
+    secure : SecurityHandler
+        Security handler of this stream.
+    place : Callable[[str], Path]
+        Maps a relative path from the manifest to its destination.
+    writer : Executor, optional
+        Thread pool for file writes. Default is the loop's default executor.
+    prefix : str, optional
+        Prefix for error messages. Default is empty.
+    first : str or bytes, optional
+        A frame of the stream that has already been read from ws. Default is None.
+    checkpoint_every : int, optional
+        Bytes of a file between checkpoints. Default is None (no checkpoints).
+    stats : TransferStats, optional
+        Statistics to add this stream to. Default is None.
+    events : EventLog, optional
+        Event log of this stream. Default is no log.
+    tracer : Tracer, optional
+        Tracer for the spans of this stream. Default is no tracing.
+    span : Span, optional
+        Parent of the spans of this stream; joins the sender's trace when
+        the manifest arrives. Default is a new span of the tracer.
+    capabilities : Capabilities, optional
+        Capabilities of this side, if its hello announced the exchange; they
+        answer the sender's before the manifest. Default is None (no exchange).
+    reconnect : Callable[[str], Awaitable[Connection]], optional
+        Opens a new connection to the relay, with the hello sent, for the
+        session with this id. Used if the sender's manifest allows reconnects
+        and the connection is lost. Default is None (a lost connection fails).
+
+    Returns
+    -------
+    int
+        Exit code: 0 on success, 4 on error.
     """
 
     # Closures to break up functions for readability
@@ -272,9 +1003,19 @@ async def receive(server: str, code: str,
         if cur_fp is not None:
             cur_fp.close()
         if msg:
-            print(f"[p2p_copy] receive(): {msg}")
+            print(f"[p2p_copy] receive(): {prefix}{msg}")
+        events.emit("error", message=msg or "stream failed", rc=4)
         return 4
 
+    async def handle_capabilities(o: dict):
+        nonlocal settings
+        if settings is not None:
+            raise ValueError("Capabilities sent twice")
+        # answered also if they do not fit, so the sender can tell why
+        await ws.send(capabilities.to_json())
+        settings = negotiate(parse_capabilities(o), capabilities)
+        events.emit("negotiated", **asdict(settings))
+
     async def handle_enc_manifest(o: dict):
         try:
             nonce_hex = o.get("nonce")
@@ -287,20 +1028,42 @@ async def receive(server: str, code: str,
             raise ValueError(f"Failed to decrypt manifest: {e}")
 
     async def handle_manifest(o: dict):
+        nonlocal session, reconnect_seconds, resume_hashed, window, retransmits
         resume = o.get("resume", False)
+        retransmits = bool(o.get("retransmit", False))
+        if reconnect is not None and o.get("session"):
+            session, reconnect_seconds = str(o["session"]), float(o.get("reconnect", 0))
+        window = min(int(o.get("window", 0)), MAX_WINDOW)
+        entries = o.get("entries", [])
+        span.join(o.get("traceparent"))
+        stats.files_total += len(entries)
+        stats.bytes_total += sum(int(e.get("size", 0)) for e in entries)
+        events.emit("manifest", files=len(entries), bytes=sum(int(e.get("size", 0)) for e in entries), resume=resume)
+        manifest_span = tracer.start("manifest", span, files=len(entries), resume=resume)
         if resume:
-            entries = o.get("entries", [])
             reply_entries: List[ReceiverManifestEntry] = []
 
             for e in entries:
                 try:
                     rel = Path(e["path"])
-                    local_path = (out_dir / rel).resolve()
+                    local_path = place(rel.as_posix())
                     if local_path.is_file():
                         local_size = local_path.stat().st_size
                         if local_size > 0:
-                            hashed, chain_b = await compute_chain_up_to(local_path)
+                            # hash only what was written after the last checkpoint
+                            checkpoint = Checkpoint.load(local_path, rel.as_posix())
+                            raw_chain = checkpoint.chain() if checkpoint is not None else RawChain()
+                            with tracer.span("resume_hash", manifest_span, path=rel.as_posix(),
+                                             bytes=local_size - raw_chain.size, checkpoint=raw_chain.size):
+                                resume_hashed += local_size - raw_chain.size
+                                await hash_tail(local_path, raw_chain)
+                            hashed, chain_b = raw_chain.size, raw_chain.digest()
                             resume_known[rel.as_posix()] = (hashed, chain_b)
+                            if checkpoint_every and local_size >= checkpoint_every:
+                                resume_chains[rel.as_posix()] = raw_chain  # keeps up to a block in memory
+                            if hashed == int(e["size"]):  # the sender will skip this file
+                                stats.files_skipped += 1
+                                stats.bytes_skipped += hashed
                             reply_entries.append(
                                 ReceiverManifestEntry(
                                     path=rel.as_posix(),
@@ -311,6 +1074,9 @@ async def receive(server: str, code: str,
                 except Exception:
                     continue  # Skip bad entries
 
+            events.emit("resume", partial=len(reply_entries), complete=sum(
+                1 for e in entries if resume_known.get(e.get("path"), (None,))[0] == e.get("size")),
+                        hashed=resume_hashed)
             if encrypt:
                 clear = ReceiverManifest(type="receiver_manifest", entries=reply_entries).to_json().encode()
                 hidden = secure.encrypt_chunk(clear)
@@ -321,6 +1087,10 @@ async def receive(server: str, code: str,
                 await ws.send(reply)
             else:
                 await ws.send(ReceiverManifest(type="receiver_manifest", entries=reply_entries).to_json())
+            manifest_span.set(receiver_files=len(reply_entries))
+        manifest_span.end()
+        if window:
+            await ws.send(credit(window=window))  # the sender may now send this much ahead
 
     async def handle_enc_file(o: dict):
         try:
@@ -332,7 +1102,8 @@ async def receive(server: str, code: str,
             raise ValueError(f"Failed to decrypt file info: {e}")
 
     async def handle_file(o: dict):
-        nonlocal cur_fp, cur_expected_size, cur_seq_expected, bytes_written, compressor, chained_checksum
+        nonlocal cur_fp, cur_expected_size, cur_seq_expected, bytes_written, compressor, chained_checksum, file_stats, \
+            file_span, cur_offset, cur_dest, raw_chain, next_checkpoint
         if cur_fp is not None:
             raise ValueError("Got new file while previous still open")
         try:
@@ -343,7 +1114,7 @@ async def receive(server: str, code: str,
         except Exception:
             raise ValueError(f"Bad file header: {o}")
 
-        dest = (out_dir / Path(rel_path)).resolve()
+        dest = place(rel_path)
         ensure_dir(dest.parent)
 
         open_mode = "wb"
@@ -357,45 +1128,219 @@ async def receive(server: str, code: str,
                 expected_remaining = total_size
 
         cur_fp = dest.open(open_mode)
+        cur_dest = dest
+        # raw-bytes chain for checkpoints of large files, continued from the resume hashing when appending
+        raw_chain = None
+        if checkpoint_every and total_size >= checkpoint_every:
+            if open_mode == "wb":
+                raw_chain = RawChain()
+                Checkpoint.remove(dest)
+            elif (known := resume_chains.pop(rel_path, None)) is not None and known.size == append_from:
+                raw_chain = known
+            next_checkpoint = ((raw_chain.size if raw_chain else 0) // checkpoint_every + 1) * checkpoint_every
+        if resume_known.get(rel_path, (None,))[0] == total_size:
+            # counted as skipped, but the local copy differs and is sent again
+            stats.files_skipped -= 1
+            stats.bytes_skipped -= total_size
+        if open_mode == "ab":
+            stats.bytes_skipped += append_from
+        events.emit("file_start", path=rel_path, size=total_size, compression=compression,
+                    append_from=append_from if open_mode == "ab" else 0)
+        file_span = tracer.start("file", span, path=rel_path, size=total_size, compression=compression,
+                                 append_from=append_from if open_mode == "ab" else 0)
         cur_expected_size = expected_remaining
+        cur_offset = total_size - expected_remaining
         cur_seq_expected = 0
         bytes_written = 0
         compressor.set_decompression(compression)
         chained_checksum = ChainedChecksum()
+        file_stats = FileStats(path=rel_path, size=total_size, append_from=append_from if open_mode == "ab" else 0,
+                               compression=compression, seconds=time.perf_counter())
 
     async def handle_file_eof(o: dict):
-        nonlocal cur_fp
+        nonlocal cur_fp, last_done
         if cur_fp is None:
             raise ValueError("Got file_eof without open file")
         if cur_expected_size is not None and bytes_written != cur_expected_size:
             raise ValueError(f"Size mismatch: {bytes_written} != {cur_expected_size}")
         cur_fp.close()
         cur_fp = None
+        if checkpoint_every and file_stats.size >= checkpoint_every:
+            Checkpoint.remove(cur_dest)
+        last_done = file_stats.path
+        file_stats.seconds = time.perf_counter() - file_stats.seconds
+        stats.files.append(file_stats)
+        events.emit("file_end", path=file_stats.path, bytes=file_stats.bytes_raw,
+                    compressed=file_stats.bytes_compressed, seconds=file_stats.seconds)
+        file_span.end(bytes=file_stats.bytes_raw, compressed=file_stats.bytes_compressed)
+
+    def write_chunk(chunk: bytes):
+        cur_fp.write(chunk)
+        if raw_chain is not None:
+            raw_chain.update(chunk)
+
+    def write_checkpoint():
+        sync_file(cur_fp)
+        Checkpoint(file_stats.path, raw_chain.offset, raw_chain.chain.hex()).save(cur_dest)
 
     async def handle_chunk():
-        nonlocal bytes_written, cur_seq_expected
+        nonlocal bytes_written, cur_seq_expected, next_checkpoint, failed_tries
         if cur_fp is None:
             raise ValueError("Unexpected binary data without open file")
-        seq, chain, payload = unpack_chunk(frame)
-        if seq != cur_seq_expected:
-            raise ValueError(f"Sequence mismatch: {seq} != {cur_seq_expected}")
-
-        raw_payload = secure.decrypt_chunk(payload) if encrypt else payload
-        if chained_checksum.next_hash(raw_payload) != chain:
-            raise ValueError("Chained checksum mismatch")
-
+        t_decrypt = time.perf_counter()
+        try:
+            seq, chain, payload = unpack_chunk(frame)
+            if seq != cur_seq_expected:
+                raise ValueError(f"Sequence mismatch: {seq} != {cur_seq_expected}")
+            try:
+                raw_payload = secure.decrypt_chunk(payload) if encrypt else payload
+            except Exception:
+                raise ValueError("Failed to decrypt chunk")
+            t_hash = time.perf_counter()
+            prev_chain = chained_checksum.prev_chain
+            if chained_checksum.next_hash(raw_payload) != chain:
+                chained_checksum.prev_chain = prev_chain  # the chunk is not taken
+                raise ValueError("Chained checksum mismatch")
+        except ValueError as e:
+            # a corrupted frame costs one chunk, not the transfer
+            failed_tries += 1
+            if not retransmits or failed_tries > MAX_RETRANSMITS:
+                raise
+            await request_retransmit(str(e))
+            return
+        failed_tries = 0
+
+        t_decompress = time.perf_counter()
         chunk = compressor.decompress(raw_payload)
-        await asyncio.to_thread(cur_fp.write, chunk)
+        t_write = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(writer, write_chunk, chunk)
+        if raw_chain is not None and raw_chain.offset >= next_checkpoint:
+            # the chain only goes into the checkpoint once the data it covers is on disk
+            await asyncio.get_running_loop().run_in_executor(writer, write_checkpoint)
+            next_checkpoint = (raw_chain.offset // checkpoint_every + 1) * checkpoint_every
+
+        stats.add("decrypt", t_hash - t_decrypt)
+        stats.add("hash", t_decompress - t_hash)
+        stats.add("decompress", t_write - t_decompress)
+        stats.add("write", time.perf_counter() - t_write)
+        file_stats.bytes_raw += len(chunk)
+        file_stats.bytes_compressed += len(raw_payload)
+        stats.bytes_raw += len(chunk)
+        stats.bytes_compressed += len(raw_payload)
 
         bytes_written += len(chunk)
         cur_seq_expected += 1
+        if window:
+            await send_credit(credit(len(frame)))  # written, the sender may send as much more
+
+    async def handle_window(o: dict):
+        nonlocal window
+        if not window:
+            raise ValueError("Window request without flow control")
+        window = max(window, min(int(o.get("bytes", 0)), MAX_WINDOW))
+        events.emit("window", bytes=window)
+        await send_credit(credit(window=window))
+
+    async def request_retransmit(reason: str):
+        nonlocal nacks, nack_pending
+        nacks += 1
+        nack_pending = nacks
+        stats.retransmits += 1
+        events.emit("retransmit", path=file_stats.path, offset=cur_offset + bytes_written, seq=cur_seq_expected,
+                    reason=reason)
+        if window:
+            await send_credit(credit(len(frame)))
+        await ws.send(nack(nack_pending, session_state()))
+
+    async def skip_until_retransmit():
+        # drops what the sender sent before it saw the nack, crediting the data frames
+        nonlocal nack_pending, nonce_expected
+        if isinstance(frame, (bytes, bytearray)):
+            if window:
+                await send_credit(credit(len(frame)))
+        elif nonce_expected:
+            await handle_enc_session_nonce(frame)
+            nonce_expected = False
+        elif (o := loads(frame)).get("type") == "retransmit" and o.get("id") == nack_pending:
+            nack_pending = 0
+            nonce_expected = encrypt  # the sender starts a fresh nonce chain, as after a reconnect
+
+    async def send_credit(msg: str):
+        try:
+            await ws.send(msg)
+        except ConnectionClosed:
+            pass  # the sender may be done and gone; a lost connection shows on the next read
 
     async def handle_eof(o: dict):
+        if (session or retransmits) and cur_fp is None:
+            await ws.send(DONE)  # the sender waits for this before it ends, it may have to send again
         raise StopAsyncIteration  # Break the loop cleanly
 
+    async def handle_enc_session_nonce(raw: Union[str, bytes]):
+        try:
+            o = loads(raw)
+            if o.get("type") != "enc_session_nonce":
+                raise ValueError(o.get("type"))
+            secure.nonce_hasher.prev_chain = secure.unseal(bytes.fromhex(o["hidden_nonce"]))
+        except Exception as e:
+            raise ValueError(f"Failed to read session nonce: {e}")
+
+    def session_state() -> str:
+        # the position after the last chunk taken; the sender continues from there
+        state = SessionState(type="session_state", path=file_stats.path if cur_fp is not None else None,
+                             offset=cur_offset + bytes_written, seq=cur_seq_expected,
+                             chain_hex=chained_checksum.prev_chain.hex(), compression=compressor_type(),
+                             last=last_done).to_json()
+        if encrypt:
+            state = EncryptedSessionState(type="enc_session_state",
+                                          hidden_state=secure.seal(state.encode()).hex()).to_json()
+        return state
+
+    async def reconnect_to_sender(lost: Optional[ConnectionClosed]) -> Optional[Tuple[Connection, Union[str, bytes]]]:
+        nonlocal nack_pending, nonce_expected
+        # Report the position after the last chunk on disk
+        if cur_fp is not None:
+            await asyncio.get_running_loop().run_in_executor(writer, sync_file, cur_fp)
+        state = session_state()
+        events.emit("connection_lost", message=str(lost) if lost else "closed by relay",
+                    path=file_stats.path if cur_fp is not None else None, offset=cur_offset + bytes_written)
+        t_lost = time.monotonic()
+        deadline = t_lost + reconnect_seconds
+        delay, attempts = 0.5, 0
+        while time.monotonic() < deadline:
+            attempts += 1
+            new_ws: Optional[Connection] = None
+            try:
+                new_ws = await reconnect(session)
+                await new_ws.send(state)
+                if window:
+                    await new_ws.send(credit(window=window))  # nothing is in flight on the new connection
+                # the sender's first frame shows that it is paired and continues
+                first_frame = await asyncio.wait_for(new_ws.recv(), timeout=max(0.1, deadline - time.monotonic()))
+                if encrypt:
+                    await handle_enc_session_nonce(first_frame)
+                    first_frame = await new_ws.recv()
+                stats.reconnects += 1
+                events.emit("reconnected", attempts=attempts, seconds=round(time.monotonic() - t_lost, 3))
+                nack_pending, nonce_expected = 0, False  # the sender continues from the state just sent
+                return new_ws, first_frame
+            except (OSError, asyncio.TimeoutError, WebSocketException):
+                if new_ws is not None:
+                    await new_ws.close()  # leave the waiting room before the next attempt
+            # back off, but not past the deadline
+            await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+            delay = min(2 * delay, 8.0)
+        return None
+
+    def compressor_type() -> str:
+        return "zstd" if compressor.dctx is not None else "none"
+
     # Frame type dispatcher
     async def dispatch_frame():
-        if isinstance(frame, (bytes, bytearray)):
+        if nack_pending or nonce_expected:
+            await skip_until_retransmit()
+
+        elif isinstance(frame, (bytes, bytearray)):
             await handle_chunk()
 
         elif not isinstance(frame, str):
@@ -406,11 +1351,13 @@ async def receive(server: str, code: str,
             t = o.get("type")
 
             handlers = {
+                "capabilities": handle_capabilities if capabilities is not None else None,
                 "enc_manifest": handle_enc_manifest if encrypt else None,
                 "manifest": handle_manifest if not encrypt else None,
                 "enc_file": handle_enc_file if encrypt else None,
                 "file": handle_file if not encrypt else None,
                 "file_eof": handle_file_eof,
+                "window": handle_window,
                 "eof": handle_eof,
             }
             handler = handlers.get(t)
@@ -420,30 +1367,92 @@ async def receive(server: str, code: str,
 
     # End of Closures
 
-    out_dir = Path(out or ".")
-    ensure_dir(out_dir)
-
-    secure = SecurityHandler(code, encrypt)
-    hello = Hello(type="hello", code_hash_hex=secure.code_hash.hex(), role="receiver").to_json()
+    encrypt = secure.encrypt
 
     # Receiver state
     cur_fp: Optional[BinaryIO] = None
     cur_expected_size: Optional[int] = None
     cur_seq_expected = 0
+    cur_offset = 0
     bytes_written = 0
     chained_checksum = ChainedChecksum()
     compressor = Compressor()
+    last_done: Optional[str] = None
+    # Settings agreed on with the sender, if both exchange capabilities
+    settings: Optional[Settings] = None
+    # Id and reconnect time of the session, if the sender allows reconnects
+    session = ""
+    reconnect_seconds = 0.0
+    # Bytes of data frames the sender may have in flight, 0 without flow control
+    window = 0
+    # Whether the sender sends corrupted frames again, nacks sent, the one it has not answered yet,
+    # whether its fresh nonce comes next, and how often the current chunk arrived corrupted
+    retransmits = False
+    nacks = 0
+    nack_pending = 0
+    nonce_expected = False
+    failed_tries = 0
     resume_known: Dict[str, Tuple[int, bytes]] = {}
-
-    async with connect(server, max_size=2**21, compression=None) as ws:
-        await ws.send(hello)
-        try:
-            async for frame in ws:
-                await dispatch_frame()
-        except StopAsyncIteration:
-            pass  # Normal EOF
-        except ValueError as e:
-            return return_with_error_code(str(e))
+    resume_chains: Dict[str, RawChain] = {}
+    resume_hashed = 0
+    cur_dest: Optional[Path] = None
+    raw_chain: Optional[RawChain] = None
+    next_checkpoint = 0
+    stats = stats if stats is not None else TransferStats()
+    file_stats: Optional[FileStats] = None
+    span = span or tracer.start("stream")
+    file_span: Optional[Span] = None
+
+    t_connected = t_recv = time.perf_counter()
+    pairing = tracer.start("pairing", span)
+    paired = False
+    try:
+        if first is not None:
+            frame = first
+            paired = True
+            stats.begin("receiver")
+            events.emit("paired", seconds=time.perf_counter() - t_connected)
+            pairing.end()
+            stats.bytes_wire += len(frame)
+            await dispatch_frame()
+        while True:
+            lost: Optional[ConnectionClosed] = None
+            try:
+                async for frame in ws:
+                    t_frame = time.perf_counter()
+                    if paired:
+                        stats.add("recv_wait", t_frame - t_recv)
+                    else:  # first frame of the sender
+                        paired = True
+                        stats.begin("receiver")
+                        stats.pairing_seconds = max(stats.pairing_seconds, t_frame - t_connected)
+                        events.emit("paired", seconds=t_frame - t_connected)
+                        pairing.end()
+                    stats.bytes_wire += len(frame)
+                    await dispatch_frame()
+                    t_recv = time.perf_counter()
+            except ConnectionClosed as e:
+                if not session:
+                    raise
+                lost = e
+            if not session:
+                break
+            # The connection ended before eof: continue the session on a new one
+            if (resumed := await reconnect_to_sender(lost)) is None:
+                return return_with_error_code(f"connection lost, no reconnect within {reconnect_seconds:g} s")
+            ws, frame = resumed
+            stats.bytes_wire += len(frame)
+            await dispatch_frame()
+            t_recv = time.perf_counter()
+    except StopAsyncIteration:
+        stats.end()  # Normal EOF
+        events.emit("transfer_end", rc=0, files=len(stats.files), bytes=stats.bytes_raw,
+                    seconds=stats.elapsed, bottleneck=stats.bottleneck)
+    except ValueError as e:
+        return return_with_error_code(str(e))
+    except ConnectionClosed as e:
+        # keeps what has been written, so the transfer can be resumed
+        return return_with_error_code(f"connection lost: {e}")
 
     if cur_fp is not None:
         return return_with_error_code("Stream ended while file open")
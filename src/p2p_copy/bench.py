@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import socket
+import string
+import tempfile
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from websockets.asyncio.client import connect
+
+from .api import send, receive
+from .compressor import Compressor, CompressMode
+from .io_utils import CHUNK_SIZE, MAX_FRAME
+from .protocol import Hello, pack_chunk
+from .security import ChainedChecksum, SecurityHandler
+
+
+class DataProfile(str, Enum):
+    """
+    Enumeration of synthetic data profiles.
+    """
+
+    random = "random"
+    text = "text"
+    zeros = "zeros"
+
+
+class BenchStage(str, Enum):
+    """
+    Enumeration of the measured stages of a transfer.
+    """
+
+    disk = "disk"
+    compress = "compress"
+    checksum = "checksum"
+    encrypt = "encrypt"
+    pack = "pack"
+    websocket = "websocket"
+    pipeline = "pipeline"
+
+
+# Stages whose speed depends on the content of the data
+CONTENT_STAGES = {BenchStage.disk, BenchStage.compress, BenchStage.pipeline}
+
+
+@dataclass
+class BenchResult:
+    """
+    Throughput of one stage for one combination of settings.
+
+    Parameters
+    ----------
+    stage : str
+        The measured stage.
+    profile : str
+        The data profile, '-' for stages independent of the content.
+    chunk_size : int
+        Bytes per chunk.
+    level : int, optional
+        Zstandard level of the compress stage.
+    mib_per_s : float, optional
+        Throughput in MiB/s of uncompressed data, None if the stage was skipped.
+    ratio : float, optional
+        Compressed size divided by original size for the compress stage.
+    note : str, optional
+        Why a stage was skipped, or how it was measured.
+    """
+    stage: str
+    profile: str
+    chunk_size: int
+    level: Optional[int] = None
+    mib_per_s: Optional[float] = None
+    ratio: Optional[float] = None
+    note: str = ""
+
+
+def make_data(profile: DataProfile, size: int, seed: int = 0) -> bytes:
+    """
+    Generate reproducible data of a profile.
+
+    Parameters
+    ----------
+    profile : DataProfile
+        'random' is incompressible, 'text' is word-like and compresses about
+        like prose, 'zeros' compresses almost completely.
+    size : int
+        Number of bytes.
+    seed : int, optional
+        Seed of the generator. Default is 0.
+
+    Returns
+    -------
+    bytes
+    """
+    rng = random.Random(seed)
+    if profile == DataProfile.zeros:
+        return bytes(size)
+    if profile == DataProfile.random:
+        return rng.randbytes(size)
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 10))) for _ in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf-like word frequencies
+    words = rng.choices(vocabulary, weights, k=size // 5 + 1)
+    return " ".join(words).encode()[:size]
+
+
+def _chunks(data: bytes, chunk_size: int) -> List[bytes]:
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def _measure(fn: Callable[[bytes], object], chunks: Sequence[bytes]) -> float:
+    """Run fn over all chunks and return MiB/s of input."""
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        fn(chunk)
+    elapsed = time.perf_counter() - t0
+    return sum(map(len, chunks)) / 2**20 / elapsed
+
+
+def _bench_disk(data: bytes, chunk_size: int, directory: Optional[str]) -> BenchResult:
+    with tempfile.NamedTemporaryFile(dir=directory) as tmp:
+        tmp.write(data)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        note = "page cache"
+        if hasattr(os, "posix_fadvise"):
+            # drop the file from the page cache so reads hit the disk
+            os.posix_fadvise(tmp.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            note = "cold cache"
+        with open(tmp.name, "rb", buffering=0) as fp:
+            t0 = time.perf_counter()
+            while fp.read(chunk_size):
+                pass
+            elapsed = time.perf_counter() - t0
+    return BenchResult("disk", "", chunk_size, mib_per_s=len(data) / 2**20 / elapsed, note=note)
+
+
+def _bench_compress(chunks: Sequence[bytes], chunk_size: int, level: int) -> BenchResult:
+    compressor = Compressor(CompressMode.on, level=level)
+    compressed = 0
+
+    def compress(chunk: bytes) -> None:
+        nonlocal compressed
+        compressed += len(compressor.compress(chunk))
+
+    speed = _measure(compress, chunks)
+    return BenchResult("compress", "", chunk_size, level=level, mib_per_s=speed,
+                       ratio=compressed / max(1, sum(map(len, chunks))))
+
+
+def _bench_encrypt(chunks: Sequence[bytes], chunk_size: int) -> BenchResult:
+    try:
+        secure = SecurityHandler("bench", encrypt=True)
+    except ModuleNotFoundError:
+        return BenchResult("encrypt", "", chunk_size, note="needs p2p-copy[security]")
+    return BenchResult("encrypt", "", chunk_size, mib_per_s=_measure(secure.encrypt_chunk, chunks))
+
+
+def _bench_pack(chunks: Sequence[bytes], chunk_size: int) -> BenchResult:
+    chain = bytes(32)
+    return BenchResult("pack", "", chunk_size, mib_per_s=_measure(lambda c: pack_chunk(1, chain, c), chunks))
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+async def _bench_websocket(server: str, chunks: Sequence[bytes], chunk_size: int) -> BenchResult:
+    frames = [pack_chunk(seq, bytes(32), chunk) for seq, chunk in enumerate(chunks)]
+    if len(frames[0]) > MAX_FRAME:
+        return BenchResult("websocket", "", chunk_size, note=f"frames over {MAX_FRAME} bytes")
+    code_hash = os.urandom(32).hex()
+    async with connect(server, max_size=MAX_FRAME, compression=None) as receiver, \
+            connect(server, max_size=MAX_FRAME, compression=None) as sender:
+        await receiver.send(Hello(type="hello", code_hash_hex=code_hash, role="receiver").to_json())
+        await sender.send(Hello(type="hello", code_hash_hex=code_hash, role="sender").to_json())
+        await sender.recv()  # ready
+
+        async def drain():
+            for _ in frames:
+                await receiver.recv()
+
+        t0 = time.perf_counter()
+        draining = asyncio.create_task(drain())
+        for frame in frames:
+            await sender.send(frame)
+        await draining
+        elapsed = time.perf_counter() - t0
+    return BenchResult("websocket", "", chunk_size, mib_per_s=sum(map(len, chunks)) / 2**20 / elapsed,
+                       note="loopback via relay")
+
+
+async def _bench_pipeline(server: str, data: bytes, encrypt: bool, directory: Optional[str]) -> BenchResult:
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        src = Path(tmp) / "bench.bin"
+        src.write_bytes(data)
+        code = os.urandom(8).hex()
+        t0 = time.perf_counter()
+        recv_task = asyncio.create_task(receive(server=server, code=code, encrypt=encrypt, out=str(Path(tmp) / "out")))
+        rc_send = await send(server=server, code=code, files=[str(src)], encrypt=encrypt)
+        rc_recv = await recv_task
+        elapsed = time.perf_counter() - t0
+    if rc_send or rc_recv:
+        return BenchResult("pipeline", "", CHUNK_SIZE, note=f"transfer failed ({rc_send}/{rc_recv})")
+    return BenchResult("pipeline", "", CHUNK_SIZE, mib_per_s=len(data) / 2**20 / elapsed,
+                       note="send+receive" + (", encrypted" if encrypt else ""))
+
+
+async def run_bench(stages: Sequence[BenchStage] = tuple(BenchStage),
+                    profiles: Sequence[DataProfile] = tuple(DataProfile),
+                    chunk_sizes: Sequence[int] = (64 * 2**10, CHUNK_SIZE),
+                    levels: Sequence[int] = (3,),
+                    size: int = 32 * 2**20,
+                    encrypt: bool = False,
+                    directory: Optional[str] = None) -> List[BenchResult]:
+    """
+    Measure the throughput of each stage of a transfer separately.
+
+    Stages that depend on the content run once per data profile, the others
+    once per chunk size. The websocket and pipeline stages go through a relay
+    started in this process on localhost.
+
+    Parameters
+    ----------
+    stages : Sequence[BenchStage], optional
+        Stages to measure. Default is all.
+    profiles : Sequence[DataProfile], optional
+        Data profiles. Default is all.
+    chunk_sizes : Sequence[int], optional
+        Chunk sizes in bytes. Default is 64 KiB and 1 MiB. The pipeline always
+        uses the transfer chunk size of 1 MiB.
+    levels : Sequence[int], optional
+        Zstandard levels of the compress stage. Default is (3,).
+    size : int, optional
+        Bytes processed per measurement. Default is 32 MiB.
+    encrypt : bool, optional
+        Encrypt the pipeline transfer. Default is False.
+    directory : str, optional
+        Directory for temporary files, which decides the disk that is measured.
+
+    Returns
+    -------
+    List[BenchResult]
+    """
+    stages = list(stages)
+    results: List[BenchResult] = []
+    data = {p: make_data(p, size) for p in (profiles if CONTENT_STAGES.intersection(stages) else profiles[:1])}
+    neutral = data[profiles[0]]
+
+    for chunk_size in chunk_sizes:
+        for profile in profiles:
+            chunks = _chunks(data[profile], chunk_size)
+            if BenchStage.disk in stages:
+                results.append(_bench_disk(data[profile], chunk_size, directory))
+                results[-1].profile = profile.value
+            if BenchStage.compress in stages:
+                for level in levels:
+                    results.append(_bench_compress(chunks, chunk_size, level))
+                    results[-1].profile = profile.value
+        chunks = _chunks(neutral, chunk_size)
+        if BenchStage.checksum in stages:
+            results.append(BenchResult("checksum", "", chunk_size,
+                                       mib_per_s=_measure(ChainedChecksum().next_hash, chunks)))
+        if BenchStage.encrypt in stages:
+            results.append(_bench_encrypt(chunks, chunk_size))
+        if BenchStage.pack in stages:
+            results.append(_bench_pack(chunks, chunk_size))
+
+    if BenchStage.websocket in stages or BenchStage.pipeline in stages:
+        from p2p_copy_server import run_relay
+
+        port = _free_port()
+        server = f"ws://localhost:{port}"
+        relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+        try:
+            await asyncio.sleep(0.2)
+            if BenchStage.websocket in stages:
+                for chunk_size in chunk_sizes:
+                    results.append(await _bench_websocket(server, _chunks(neutral, chunk_size), chunk_size))
+            if BenchStage.pipeline in stages:
+                for profile in profiles:
+                    results.append(await _bench_pipeline(server, data[profile], encrypt, directory))
+                    results[-1].profile = profile.value
+        finally:
+            relay_task.cancel()
+
+    for result in results:
+        result.profile = result.profile or "-"
+        if result.mib_per_s is not None:
+            result.mib_per_s = round(result.mib_per_s, 1)
+        if result.ratio is not None:
+            result.ratio = round(result.ratio, 3)
+    return results
+
+
+def format_table(results: Sequence[BenchResult]) -> str:
+    """
+    Format results as a plain text table.
+
+    Parameters
+    ----------
+    results : Sequence[BenchResult]
+
+    Returns
+    -------
+    str
+    """
+    lines = [f"{'stage':<10} {'profile':<8} {'chunk':>9} {'level':>5} {'MiB/s':>9} {'ratio':>6}  note"]
+    lines.append("-" * len(lines[0]))
+    for r in results:
+        speed = f"{r.mib_per_s:.1f}" if r.mib_per_s is not None else "-"
+        ratio = f"{r.ratio:.3f}" if r.ratio is not None else ""
+        level = str(r.level) if r.level is not None else ""
+        lines.append(f"{r.stage:<10} {r.profile:<8} {r.chunk_size:>9} {level:>5} {speed:>9} {ratio:>6}  {r.note}")
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Sequence, Tuple
+
+from .protocol import Capabilities
+
+# Version of the capability exchange; a side that knows a newer one speaks the older one of its peer
+PROTOCOL_VERSION = 1
+# What this build supports, fastest first
+CODECS = ("zstd", "none")
+HASHES = ("sha256",)
+CIPHERS = ("aes-256-gcm",)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Settings both sides of a transfer agreed on.
+
+    Parameters
+    ----------
+    version : int
+        Version of the capability exchange both speak.
+    codec : str
+        Compression codec, 'none' if the sender must not compress.
+    hash : str
+        Algorithm of the chained checksum.
+    cipher : str
+        Cipher of the end-to-end encryption, empty if the transfer is not encrypted.
+    max_chunk : int
+        Largest chunk the sender may send.
+    streams : int
+        Connections the transfer may use.
+    cpus : int
+        CPU cores of the weaker side.
+    """
+    version: int
+    codec: str
+    hash: str
+    cipher: str
+    max_chunk: int
+    streams: int
+    cpus: int
+
+
+def local_capabilities(encrypt: bool, max_chunk: int) -> Capabilities:
+    """
+    Capabilities of this side.
+
+    Ciphers are only offered if the optional security libraries are installed.
+
+    Parameters
+    ----------
+    encrypt : bool
+        Whether this side encrypts the transfer.
+    max_chunk : int
+        Largest chunk this side handles.
+
+    Returns
+    -------
+    Capabilities
+    """
+    ciphers = CIPHERS if importlib.util.find_spec("cryptography") is not None else ()
+    return Capabilities(type="capabilities", version=PROTOCOL_VERSION, codecs=CODECS, hashes=HASHES, ciphers=ciphers,
+                        max_chunk=max_chunk, streams=1, cpus=os.cpu_count() or 1, encrypt=encrypt)
+
+
+def parse_capabilities(o: Dict[str, Any]) -> Capabilities:
+    """
+    Read the capabilities message of the peer.
+
+    Parameters
+    ----------
+    o : Dict[str, Any]
+        The parsed message.
+
+    Returns
+    -------
+    Capabilities
+
+    Raises
+    ------
+    ValueError
+        If it is not a capabilities message or a field is missing or malformed.
+    """
+    if o.get("type") != "capabilities":
+        raise ValueError(f"expected capabilities, got {o.get('type')!r}")
+    try:
+        caps = Capabilities(type="capabilities", version=int(o["version"]),
+                            codecs=_names(o["codecs"]), hashes=_names(o["hashes"]), ciphers=_names(o["ciphers"]),
+                            max_chunk=int(o["max_chunk"]), streams=int(o["streams"]), cpus=int(o["cpus"]),
+                            encrypt=bool(o["encrypt"]))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"bad capabilities: {e}")
+    if min(caps.version, caps.max_chunk, caps.streams, caps.cpus) < 1:
+        raise ValueError("bad capabilities: values must be positive")
+    return caps
+
+
+def _names(value: Any) -> Tuple[str, ...]:
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"expected a list of names: {value!r}")
+    return tuple(value)
+
+
+def negotiate(sender: Capabilities, receiver: Capabilities) -> Settings:
+    """
+    Pick the settings of a transfer from the capabilities of both sides.
+
+    Both sides call it with the same arguments and get the same result. Of
+    every list the sender's first entry the receiver supports is taken, and
+    of every limit the smaller one.
+
+    Parameters
+    ----------
+    sender : Capabilities
+        Capabilities of the sender.
+    receiver : Capabilities
+        Capabilities of the receiver.
+
+    Returns
+    -------
+    Settings
+
+    Raises
+    ------
+    ValueError
+        If the encryption setting differs, or there is no common checksum,
+        codec or, for encrypted transfers, cipher.
+    """
+    def first_common(offered: Sequence[str], supported: Sequence[str], what: str) -> str:
+        for name in offered:
+            if name in supported:
+                return name
+        raise ValueError(f"no common {what}: sender offers {', '.join(offered) or 'none'}, "
+                         f"receiver supports {', '.join(supported) or 'none'}")
+
+    if sender.encrypt != receiver.encrypt:
+        raise ValueError(f"encryption setting does not match: sender {'on' if sender.encrypt else 'off'}, "
+                         f"receiver {'on' if receiver.encrypt else 'off'}")
+    return Settings(
+        version=min(sender.version, receiver.version),
+        codec=first_common(sender.codecs, receiver.codecs, "codec"),
+        hash=first_common(sender.hashes, receiver.hashes, "checksum"),
+        cipher=first_common(sender.ciphers, receiver.ciphers, "cipher") if sender.encrypt else "",
+        max_chunk=min(sender.max_chunk, receiver.max_chunk),
+        streams=min(sender.streams, receiver.streams),
+        cpus=min(sender.cpus, receiver.cpus),
+    )
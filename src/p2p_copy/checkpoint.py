@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+from .io_utils import CHUNK_SIZE
+
+# Receiver checkpoints every this many bytes of a file by default
+CHECKPOINT_EVERY = 64 * 2**20
+
+
+class RawChain:
+    """
+    Chained checksum over the raw bytes of a file, fed in pieces of any size.
+
+    Gives the same chain as compute_chain_up_to(): one link per CHUNK_SIZE
+    block from the start of the file, the last block possibly shorter. Data
+    is buffered only while it does not end on a block boundary, so whatever
+    chunk size the sender picks, at most one block is held.
+
+    Parameters
+    ----------
+    offset : int, optional
+        Bytes covered by chain, a multiple of CHUNK_SIZE. Default is 0.
+    chain : bytes, optional
+        Chain state after offset bytes. Default is the empty start state.
+    """
+
+    def __init__(self, offset: int = 0, chain: bytes = b""):
+        if offset % CHUNK_SIZE:
+            raise ValueError(f"chain offset {offset} is not a multiple of {CHUNK_SIZE}")
+        self.offset = offset
+        self.chain = chain
+        self.pending = bytearray()
+
+    @property
+    def size(self) -> int:
+        """Bytes fed in so far, including the start offset."""
+        return self.offset + len(self.pending)
+
+    def _link(self, block) -> None:
+        self.chain = _sha256(self.chain, block)
+        self.offset += len(block)
+
+    def update(self, data: bytes) -> None:
+        """
+        Add the next bytes of the file.
+
+        Parameters
+        ----------
+        data : bytes
+            The bytes following the ones fed in so far.
+        """
+        view = memoryview(data)
+        if self.pending:
+            take = CHUNK_SIZE - len(self.pending)
+            self.pending += view[:take]
+            view = view[take:]
+            if len(self.pending) < CHUNK_SIZE:
+                return
+            self._link(self.pending)
+            self.pending = bytearray()
+        while len(view) >= CHUNK_SIZE:
+            self._link(view[:CHUNK_SIZE])
+            view = view[CHUNK_SIZE:]
+        self.pending += view
+
+    def digest(self) -> bytes:
+        """
+        Chain over all bytes fed in, as compute_chain_up_to() returns it.
+
+        Returns
+        -------
+        bytes
+        """
+        return _sha256(self.chain, self.pending) if self.pending else self.chain
+
+
+def _sha256(prev: bytes, block) -> bytes:
+    h = hashlib.sha256()
+    h.update(prev)
+    h.update(block)
+    return h.digest()
+
+
+async def hash_tail(path: Path, raw_chain: RawChain, limit: Optional[int] = None) -> RawChain:
+    """
+    Continue a chain over the rest of a file.
+
+    Parameters
+    ----------
+    path : Path
+        The file.
+    raw_chain : RawChain
+        Chain over the first raw_chain.size bytes of the file; it is updated.
+    limit : int, optional
+        Stop after this many bytes of the file. Default is the whole file.
+
+    Returns
+    -------
+    RawChain
+        The chain, for convenience.
+    """
+    with path.open("rb") as fp:
+        fp.seek(raw_chain.size)
+        remaining = (limit if limit is not None else path.stat().st_size) - raw_chain.size
+        while remaining > 0:
+            chunk = await asyncio.to_thread(fp.read, min(remaining, CHUNK_SIZE))
+            if not chunk:
+                break
+            raw_chain.update(chunk)
+            remaining -= len(chunk)
+    return raw_chain
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """
+    Durable position of a partially received file.
+
+    Everything up to offset was on disk when the checkpoint was written, so
+    a resume hashes only the bytes after it.
+
+    Parameters
+    ----------
+    path : str
+        Relative path of the file in the transfer.
+    offset : int
+        Bytes covered by the chain, a multiple of CHUNK_SIZE.
+    chain_hex : str
+        Raw-bytes chain after offset bytes, see RawChain.
+    """
+    path: str
+    offset: int
+    chain_hex: str
+
+    @staticmethod
+    def file_for(dest: Path) -> Path:
+        """The hidden checkpoint file kept next to a partial file."""
+        return dest.with_name(f".{dest.name}.p2p-checkpoint")
+
+    @classmethod
+    def load(cls, dest: Path, rel_path: str) -> Optional["Checkpoint"]:
+        """
+        Read the checkpoint of a partial file.
+
+        Returns
+        -------
+        Checkpoint or None
+            None if there is none, it is unreadable, belongs to another
+            path or lies beyond the end of the file.
+        """
+        try:
+            cp = cls(**json.loads(cls.file_for(dest).read_text()))
+            if cp.path != rel_path or cp.offset % CHUNK_SIZE or not 0 < cp.offset <= dest.stat().st_size:
+                return None
+            bytes.fromhex(cp.chain_hex)
+            return cp
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, dest: Path) -> None:
+        """
+        Write the checkpoint atomically; call it after the file data is synced.
+        """
+        target = self.file_for(dest)
+        tmp = target.with_name(target.name + ".tmp")
+        with tmp.open("w") as fp:
+            json.dump(asdict(self), fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, target)
+
+    @classmethod
+    def remove(cls, dest: Path) -> None:
+        """Delete the checkpoint of a file, once it is complete or written from scratch."""
+        cls.file_for(dest).unlink(missing_ok=True)
+
+    def chain(self) -> RawChain:
+        """The chain state to continue hashing from."""
+        return RawChain(self.offset, bytes.fromhex(self.chain_hex))
@@ -22,11 +22,13 @@ class Compressor:
     ----------
     mode : CompressMode, optional
         Compression mode. Default is 'auto'.
+    level : int, optional
+        Zstandard compression level. Default is 3.
     """
 
-    def __init__(self, mode: CompressMode = CompressMode.auto):
+    def __init__(self, mode: CompressMode = CompressMode.auto, level: int = 3):
         self.mode = mode
-        self.cctx: Optional[zstd.ZstdCompressor] = zstd.ZstdCompressor(level=3) if mode != CompressMode.off else None
+        self.cctx: Optional[zstd.ZstdCompressor] = zstd.ZstdCompressor(level=level) if mode != CompressMode.off else None
         self.dctx: Optional[zstd.ZstdDecompressor] = None
         self.use_compression: bool = mode == CompressMode.on
         self.compression_type: str = "zstd" if mode == CompressMode.on else "none"
@@ -110,3 +112,16 @@ class Compressor:
         """
 
         self.dctx = zstd.ZstdDecompressor() if compression_type == "zstd" else None
+
+    def set_compression(self, compression_type: str):
+        """
+        Continue compressing a file with the decision made for its first chunk.
+
+        Parameters
+        ----------
+        compression_type : str
+            The type of compression ('zstd' or 'none').
+        """
+
+        self.use_compression = compression_type == "zstd" and self.cctx is not None
+        self.compression_type = "zstd" if self.use_compression else "none"
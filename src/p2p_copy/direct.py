@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import os
+import socket
+from typing import List, Optional, Tuple, Union
+
+from websockets.asyncio.client import connect, ClientConnection
+from websockets.asyncio.server import serve, Server, ServerConnection
+
+from .io_utils import MAX_FRAME
+from .protocol import READY, DIRECT_FAILED, direct_offer, direct_hello, loads
+
+# Seconds the sender waits for the receiver's offer after READY,
+# and for each candidate address to connect and answer
+OFFER_TIMEOUT = 5.0
+CONNECT_TIMEOUT = 2.0
+
+
+def local_addresses(relay_ws: ClientConnection) -> List[str]:
+    """
+    Collect local IP addresses the peer might reach, best first.
+
+    The address used for the relay connection comes first, then the addresses
+    of the host name and finally loopback for peers on the same machine.
+
+    Parameters
+    ----------
+    relay_ws : ClientConnection
+        Connection to the relay.
+
+    Returns
+    -------
+    List[str]
+        Unique IP addresses.
+    """
+    addresses = []
+    sockname = relay_ws.transport.get_extra_info("sockname")
+    if sockname:
+        addresses.append(sockname[0])
+    try:
+        for info in socket.getaddrinfo(socket.gethostname(), None, proto=socket.IPPROTO_TCP):
+            addresses.append(info[4][0])
+    except OSError:
+        pass
+    addresses.append("127.0.0.1")
+    return [a for i, a in enumerate(addresses) if a not in addresses[:i] and not a.startswith("fe80:")]
+
+
+def _url(address: str, port: int) -> str:
+    return f"ws://[{address}]:{port}" if ":" in address else f"ws://{address}:{port}"
+
+
+class DirectListener:
+    """
+    Receiver side of the direct path: listen for the sender and offer the
+    addresses through the relay.
+
+    Use DirectListener.start() to create one.
+    """
+
+    def __init__(self):
+        self.token = os.urandom(16).hex()
+        self.servers: List[Server] = []
+        self.accepted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @classmethod
+    async def start(cls, relay_ws: ClientConnection, max_frame: int = MAX_FRAME) -> "DirectListener":
+        """
+        Listen on an ephemeral port of each local address and send the offer through the relay.
+
+        Only the offered addresses are bound, so the listener is not reachable
+        on other interfaces; addresses that cannot be bound are not offered.
+
+        Parameters
+        ----------
+        relay_ws : ClientConnection
+            Connection to the relay, on which the hello has been sent.
+        max_frame : int, optional
+            Largest message accepted from the sender. Default is MAX_FRAME.
+
+        Returns
+        -------
+        DirectListener
+        """
+        listener = cls()
+        candidates = []
+        for address in local_addresses(relay_ws):
+            try:
+                server = await serve(listener._handle, address, 0, max_size=max_frame, compression=None)
+            except OSError:
+                continue  # e.g. an address of the host name that no interface has
+            listener.servers.append(server)
+            candidates.append(_url(address, server.sockets[0].getsockname()[1]))
+        await relay_ws.send(direct_offer(candidates, listener.token))
+        return listener
+
+    async def _handle(self, ws: ServerConnection) -> None:
+        try:
+            raw = await asyncio.wait_for(ws.recv(), CONNECT_TIMEOUT)
+            token = loads(raw).get("token", "") if isinstance(raw, str) else ""
+        except Exception:
+            return
+        if not hmac.compare_digest(str(token), self.token) or self.accepted.done():
+            await ws.close(code=1008, reason="Bad direct token")
+            return
+        await ws.send(READY)
+        self.accepted.set_result(ws)
+        # keep the connection open until the transfer is done
+        await ws.wait_closed()
+
+    async def accept(self, relay_ws: ClientConnection) -> Tuple[Union[ClientConnection, ServerConnection],
+                                                                 Optional[Union[str, bytes]]]:
+        """
+        Wait until the sender either connected directly or continues through the relay.
+
+        Parameters
+        ----------
+        relay_ws : ClientConnection
+            Connection to the relay.
+
+        Returns
+        -------
+        Tuple[connection, Optional[frame]]
+            The connection to receive from, and a frame already read from the
+            relay that belongs to the transfer (sender without direct support).
+        """
+        relay_frame = asyncio.ensure_future(relay_ws.recv())
+        await asyncio.wait({self.accepted, relay_frame}, return_when=asyncio.FIRST_COMPLETED)
+        if self.accepted.done():
+            relay_frame.cancel()
+            return self.accepted.result(), None
+        frame = relay_frame.result()
+        if frame == DIRECT_FAILED:
+            return relay_ws, None
+        return relay_ws, frame
+
+    def close(self) -> None:
+        """
+        Stop listening and close a direct connection.
+        """
+        for server in self.servers:
+            server.close()
+
+
+async def connect_direct(relay_ws: ClientConnection) -> Optional[ClientConnection]:
+    """
+    Sender side of the direct path: try the receiver's candidate addresses.
+
+    Tells the receiver through the relay if no candidate works.
+
+    Parameters
+    ----------
+    relay_ws : ClientConnection
+        Connection to the relay, after READY.
+
+    Returns
+    -------
+    ClientConnection or None
+        The direct connection, or None to continue through the relay.
+    """
+    try:
+        raw = await asyncio.wait_for(relay_ws.recv(), OFFER_TIMEOUT)
+        offer = loads(raw) if isinstance(raw, str) else {}
+    except asyncio.TimeoutError:
+        print("[p2p_copy] send(): receiver did not offer a direct connection, using the relay")
+        return None
+    if offer.get("type") != "direct_offer":
+        print("[p2p_copy] send(): unexpected frame instead of direct_offer, using the relay")
+        return None
+
+    for url in offer.get("candidates", []):
+        try:
+            ws = await connect(url, max_size=MAX_FRAME, compression=None, open_timeout=CONNECT_TIMEOUT)
+        except Exception:
+            continue
+        try:
+            await ws.send(direct_hello(offer.get("token", "")))
+            if await asyncio.wait_for(ws.recv(), CONNECT_TIMEOUT) == READY:
+                return ws
+        except Exception:
+            pass
+        await ws.close()
+
+    print("[p2p_copy] send(): receiver is not reachable directly, using the relay")
+    await relay_ws.send(DIRECT_FAILED)
+    return None
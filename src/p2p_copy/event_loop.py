@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from enum import Enum
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopKind(str, Enum):
+    """
+    Enumeration of supported event loop implementations.
+    """
+
+    asyncio = "asyncio"
+    uvloop = "uvloop"
+
+
+def _import_uvloop():
+    """
+    Import uvloop if it is installed.
+
+    Returns
+    -------
+    module or None
+        The uvloop module, or None if it is unavailable.
+    """
+    try:
+        import uvloop
+        return uvloop
+    except ImportError:
+        return None
+
+
+def run(main: Coroutine[Any, Any, T], loop: LoopKind = LoopKind.asyncio) -> T:
+    """
+    Run a coroutine to completion on the selected event loop.
+
+    With ``loop='uvloop'`` the libuv-based loop is used, which lowers the
+    per-frame overhead for relays with many connections and for clients
+    sending many small frames. If uvloop is not installed (e.g. on Windows),
+    a note is printed and the standard asyncio loop is used instead.
+
+    Parameters
+    ----------
+    main : Coroutine
+        The coroutine to run, e.g. ``send(...)`` or ``run_relay(...)``.
+    loop : LoopKind, optional
+        Event loop implementation. Default is 'asyncio'.
+
+    Returns
+    -------
+    T
+        The result of the coroutine.
+    """
+    if LoopKind(loop) == LoopKind.uvloop:
+        uvloop = _import_uvloop()
+        if uvloop is None:
+            print("[p2p_copy] uvloop is not installed, using asyncio (pip install p2p-copy[uvloop])")
+        elif sys.version_info >= (3, 11):
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                return runner.run(main)
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            try:
+                return asyncio.run(main)
+            finally:
+                asyncio.set_event_loop_policy(None)
+    return asyncio.run(main)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import copy
+import json
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, TextIO, Union
+
+# Largest number of events written with one write() call
+BATCH = 1024
+
+
+class EventLog:
+    """
+    Structured event stream written as JSON lines.
+
+    emit() only puts the event on a queue; a writer thread serializes and
+    writes the events in batches, so logging never blocks the event loop.
+    Every line has 'ts' (Unix time), 'source' and 'event', plus the fields
+    given to emit() and bind().
+
+    Parameters
+    ----------
+    target : str, Path or TextIO
+        File to append to, '-' for stdout, or an open text stream.
+    source : str, optional
+        Value of the 'source' field, e.g. 'sender' or 'relay'. Default is 'p2p_copy'.
+    """
+
+    def __init__(self, target: Union[str, Path, TextIO], source: str = "p2p_copy"):
+        if isinstance(target, (str, Path)):
+            self._stream = sys.stdout if str(target) == "-" else open(target, "a", encoding="utf-8")
+            self._owns_stream = str(target) != "-"
+        else:
+            self._stream, self._owns_stream = target, False
+        self._fields: Dict[str, Any] = {"source": source}
+        self._queue: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name="p2p_copy-events", daemon=True)
+        self._writer.start()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        """
+        Queue an event; never blocks.
+
+        Parameters
+        ----------
+        event : str
+            Name of the event.
+        **fields
+            JSON-serializable fields; other values are written with str().
+        """
+        self._queue.put((time.time(), event, self._fields, fields))
+
+    def bind(self, **fields: Any) -> "EventLog":
+        """
+        Return a view of this log that adds fields to every event.
+
+        Parameters
+        ----------
+        **fields
+            Fields for all events of the view, e.g. source or pair.
+
+        Returns
+        -------
+        EventLog
+            Shares the queue and writer with this log.
+        """
+        view = copy.copy(self)
+        view._fields = {**self._fields, **fields}
+        return view
+
+    def close(self) -> None:
+        """
+        Write all queued events and stop the writer thread.
+        """
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self._owns_stream:
+            self._stream.close()
+
+    def __enter__(self) -> "EventLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _write_loop(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            while items[-1] is not None and len(items) < BATCH:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [json.dumps({"ts": round(ts, 6), **bound, "event": event, **fields}, default=str)
+                     for ts, event, bound, fields in filter(None, items)]
+            if lines:
+                self._stream.write("\n".join(lines) + "\n")
+                self._stream.flush()
+            if items[-1] is None:
+                return
+
+
+class _NoEvents(EventLog):
+    """Event log that discards everything, used when no log is configured."""
+
+    def __init__(self):
+        self._fields = {}
+
+    def emit(self, event: str, **fields: Any) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+NO_EVENTS: EventLog = _NoEvents()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from .io_utils import CHUNK_SIZE
+
+# Window of an auto-sized transfer before the first measurement
+AUTO_WINDOW = 8 * CHUNK_SIZE
+# Largest window a receiver grants, however much the sender asks for
+MAX_WINDOW = 256 * CHUNK_SIZE
+# Seconds over which the delivery rate is measured
+RATE_INTERVAL = 0.1
+
+
+def parse_window(value: str) -> int:
+    """
+    Read a window given as MiB or 'auto' on the command line.
+
+    Returns
+    -------
+    int
+        Bytes, 0 for auto-sizing.
+
+    Raises
+    ------
+    ValueError
+        If the value is neither 'auto' nor a positive number.
+    """
+    if value.strip().lower() == "auto":
+        return 0
+    mib = float(value)
+    if mib <= 0:
+        raise ValueError(f"window must be positive: {value!r}")
+    return max(1, int(mib * 2**20))
+
+
+class CreditWindow:
+    """
+    Sender side of the credit-based flow control.
+
+    The receiver grants the window in the beginning and, after writing a
+    data frame, credit for its size. The sender only sends a frame when it
+    has credit for it, so at most window bytes of data frames are in
+    flight: in socket buffers, at the relay and in the receiver's queue.
+    A frame is also sent when nothing is in flight, so windows smaller than
+    a frame still make progress.
+
+    With auto-sizing the window grows to twice the product of the largest
+    measured delivery rate and the smallest time from sending a frame to
+    its credit, like a TCP window sized to the bandwidth-delay product.
+    Using the minimum keeps a slow disk, which delays credits, from
+    inflating the window.
+
+    Parameters
+    ----------
+    window : int
+        Bytes the receiver is asked to grant; 0 sizes it automatically,
+        starting at AUTO_WINDOW.
+    """
+
+    def __init__(self, window: int):
+        self.auto = window == 0
+        self.window = window or AUTO_WINDOW
+        self.sent = 0  # data frame bytes sent
+        self.granted = 0  # credit received, including the window
+        self.opened = 0  # window the receiver has granted
+        self.min_rtt: Optional[float] = None
+        self.max_rate = 0.0
+        self.waits = 0
+        self._changed = asyncio.Event()
+        self._marks: Deque[Tuple[int, float]] = deque()  # (sent after frame, send time)
+        self._acked = 0  # bytes of data frames credited, i.e. written by the receiver
+        self._rate_mark: Optional[Tuple[int, float]] = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Bytes sent and not yet credited."""
+        return self.sent - self._acked
+
+    @property
+    def credit(self) -> int:
+        return self.granted - self.sent
+
+    async def acquire(self, size: int) -> float:
+        """
+        Wait until a frame of this size may be sent, and count it as sent.
+
+        Returns
+        -------
+        float
+            Seconds waited for credit.
+
+        Raises
+        ------
+        BaseException
+            The error the window was closed with, if the credits stopped.
+        """
+        if self.credit >= size or self.in_flight == 0:
+            self._sent(size)
+            return 0.0
+        t0 = time.perf_counter()
+        self.waits += 1
+        while self.credit < size and self.in_flight > 0:
+            if self._error is not None:
+                raise self._error
+            self._changed.clear()
+            await self._changed.wait()
+        self._sent(size)
+        return time.perf_counter() - t0
+
+    def _sent(self, size: int) -> None:
+        self.sent += size
+        if self.auto:
+            self._marks.append((self.sent, time.monotonic()))
+
+    def grant(self, size: int) -> None:
+        """
+        Add the credit the receiver returned for data frames it has written.
+
+        Parameters
+        ----------
+        size : int
+            Bytes written.
+        """
+        self.granted += size
+        self._acked += size
+        if self.auto:
+            self._measure()
+        self._changed.set()
+
+    def open(self, window: int) -> None:
+        """
+        Take the window the receiver grants, when the transfer starts or the window grows.
+
+        Parameters
+        ----------
+        window : int
+            Bytes the receiver allows in flight.
+        """
+        if window > self.opened:
+            self.granted += window - self.opened
+            self.opened = window
+            self._changed.set()
+
+    def _measure(self) -> None:
+        now = time.monotonic()
+        while self._marks and self._marks[0][0] <= self._acked:
+            _, t_sent = self._marks.popleft()
+            rtt = now - t_sent
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        if self._rate_mark is None:
+            self._rate_mark = (self._acked, now)
+        elif now - self._rate_mark[1] >= RATE_INTERVAL:
+            self.max_rate = max(self.max_rate, (self._acked - self._rate_mark[0]) / (now - self._rate_mark[1]))
+            self._rate_mark = (self._acked, now)
+
+    def wanted(self) -> Optional[int]:
+        """
+        A larger window to ask the receiver for, if auto-sizing needs one.
+
+        Returns
+        -------
+        int or None
+            Bytes, a multiple of CHUNK_SIZE, or None to keep the window.
+        """
+        if not self.auto or self.min_rtt is None or not self.max_rate:
+            return None
+        target = min(MAX_WINDOW, -(-int(2 * self.max_rate * self.min_rtt) // CHUNK_SIZE) * CHUNK_SIZE)
+        if target <= self.window * 5 // 4:
+            return None
+        self.window = target  # asked for once
+        return target
+
+    def close(self, error: BaseException) -> None:
+        """
+        No more credit will come, e.g. because the connection was lost; a waiting acquire() raises error.
+        """
+        self._error = error
+        self._changed.set()
+
+    def reset(self) -> None:
+        """
+        Start over on a new connection; the receiver grants the window again.
+        """
+        self.sent = self.granted = self.opened = self._acked = 0
+        self._marks.clear()
+        self._rate_mark = None
+        self._error = None
+        self._changed.set()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from enum import Enum
+from pathlib import Path
+from typing import Dict
+
+from .io_utils import resolve_inside
+
+
+class GatherLayout(str, Enum):
+    """
+    Where a gathering receiver puts the files of its senders.
+    """
+
+    subdirs = "subdirs"  # out/sender-<n>/<path>
+    merge_rename = "merge-rename"  # out/<path>, later senders' conflicting files get a suffix
+    merge_fail = "merge-fail"  # out/<path>, a later sender with a conflicting file fails
+
+
+class GatherPlacement:
+    """
+    Map the relative paths of concurrent sender streams to destination paths.
+
+    Parameters
+    ----------
+    out_dir : Path
+        Output directory of the gathering receiver.
+    layout : GatherLayout
+        Separate subdirectory per sender or one merged tree.
+    """
+
+    def __init__(self, out_dir: Path, layout: GatherLayout):
+        self.out_dir = out_dir
+        self.layout = layout
+        self.claimed: Dict[Path, int] = {}
+
+    def place(self, stream: int, rel_path: str) -> Path:
+        """
+        Return the destination of a file of one sender stream.
+
+        Parameters
+        ----------
+        stream : int
+            Stream number assigned by the relay.
+        rel_path : str
+            Relative path from the sender's manifest.
+
+        Returns
+        -------
+        Path
+            Resolved destination path.
+
+        Raises
+        ------
+        ValueError
+            If the path leads outside the sender's directory, or is already taken
+            by another sender and the layout is 'merge-fail'.
+        """
+        if self.layout == GatherLayout.subdirs:
+            return resolve_inside(self.out_dir / f"sender-{stream}", rel_path)
+
+        dest = resolve_inside(self.out_dir, rel_path)
+        owner = self.claimed.setdefault(dest, stream)
+        if owner == stream:
+            return dest
+        if self.layout == GatherLayout.merge_fail:
+            raise ValueError(f"{rel_path} was already received from sender {owner}")
+        renamed = dest.with_name(f"{dest.stem}.sender-{stream}{dest.suffix}")
+        self.claimed.setdefault(renamed, stream)
+        return renamed
@@ -1,12 +1,74 @@
 from __future__ import annotations
 
 import asyncio
+import os
 from pathlib import Path
-from typing import Iterator, Tuple, BinaryIO, List, AsyncIterable
+from typing import Iterator, Tuple, BinaryIO, List, AsyncIterable, Optional
 
 from p2p_copy.security import ChainedChecksum
 
-CHUNK_SIZE = 1 << 20  # 1 MiB
+CHUNK_SIZE = 1 << 20  # 1 MiB, also the block size of the resume checksums
+# Bounds of the chunk size the sender picks per file
+MIN_CHUNK = 1 << 16  # 64 KiB
+MAX_CHUNK = 1 << 24  # 16 MiB
+# Largest WebSocket message clients and relay accept by default
+MAX_FRAME = 1 << 21  # 2 MiB
+# Seconds of data a chunk should hold at the measured throughput
+FRAME_SECONDS = 0.01
+
+
+def _pow2_floor(n: int) -> int:
+    return 1 << (max(n, 1).bit_length() - 1)
+
+
+def max_chunk_for(max_frame: int) -> int:
+    """
+    Largest chunk whose frames fit into messages of max_frame bytes.
+
+    Half of max_frame, as a power of two, leaves room for frame header,
+    compression overhead on incompressible data and the GCM tag.
+
+    Parameters
+    ----------
+    max_frame : int
+        Largest message the path accepts.
+
+    Returns
+    -------
+    int
+        Bytes, at most MAX_CHUNK.
+    """
+    return min(MAX_CHUNK, _pow2_floor(max_frame // 2))
+
+
+def chunk_size_for(file_size: int, max_chunk: int, rate: Optional[float] = None) -> int:
+    """
+    Chunk size for a file, adapted to its size and to the throughput so far.
+
+    Fast links get large chunks, which cut the per-frame overhead; slow
+    links and small files get small ones, which keep memory and the latency
+    of the first frame low, and let a small file go out in a few frames so
+    reading and sending overlap.
+
+    Parameters
+    ----------
+    file_size : int
+        Size of the file.
+    max_chunk : int
+        Largest chunk the path allows, see max_chunk_for().
+    rate : float, optional
+        Throughput of the transfer so far in bytes per second. Default is
+        None (not measured yet, CHUNK_SIZE).
+
+    Returns
+    -------
+    int
+        A power of two between MIN_CHUNK and max_chunk, or max_chunk if it is
+        smaller than MIN_CHUNK.
+    """
+    target = int(rate * FRAME_SECONDS) if rate else CHUNK_SIZE
+    target = min(target, file_size // 4)
+    return max(min(_pow2_floor(target), max_chunk), min(MIN_CHUNK, max_chunk))
 
 
 async def read_in_chunks(fp: BinaryIO, *, chunk_size: int = CHUNK_SIZE) -> AsyncIterable[bytes]:
@@ -74,6 +136,19 @@ async def compute_chain_up_to(path: Path, limit: int | None = None) -> Tuple[int
     return hashed, c.prev_chain
 
 
+def sync_file(fp: BinaryIO) -> None:
+    """
+    Flush a file and wait until its data is on disk.
+
+    Parameters
+    ----------
+    fp : BinaryIO
+        The open file.
+    """
+    fp.flush()
+    os.fsync(fp.fileno())
+
+
 def iter_manifest_entries(paths: List[str]) -> Iterator[Tuple[Path, Path, int]]:
     """
     Yield manifest entries for files in the given paths (files or directories).
@@ -118,6 +193,34 @@ def iter_manifest_entries(paths: List[str]) -> Iterator[Tuple[Path, Path, int]]:
                     yield sub.resolve(), rel, sub.stat().st_size
 
 
+def resolve_inside(base: Path, rel_path: str) -> Path:
+    """
+    Resolve a relative path from a manifest below a directory.
+
+    Parameters
+    ----------
+    base : Path
+        The directory the path must stay in.
+    rel_path : str
+        Relative path sent by the peer.
+
+    Returns
+    -------
+    Path
+        Resolved destination path.
+
+    Raises
+    ------
+    ValueError
+        If the path leads outside base, e.g. through '..' or an absolute path.
+    """
+    root = base.resolve()
+    dest = (root / Path(rel_path)).resolve()
+    if not dest.is_relative_to(root) or dest == root:
+        raise ValueError(f"{rel_path} is outside the output directory")
+    return dest
+
+
 def ensure_dir(p: Path) -> None:
     """
     Ensure the directory exists, creating parents if needed.
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Frames of these modules decide the pipeline stage of an allocation; the most
+# recent matching frame wins. Worker threads only show the thread pool when
+# they run a builtin such as fp.read, which is disk I/O in this package.
+STAGE_MODULES: Tuple[Tuple[str, str], ...] = (
+    ("p2p_copy/compressor.py", "compress"),
+    ("p2p_copy/security.py", "crypto"),
+    ("p2p_copy/protocol.py", "framing"),
+    ("p2p_copy/io_utils.py", "disk"),
+    ("p2p_copy_server/spool.py", "spool"),
+    ("websockets/", "network"),
+    ("concurrent/futures/thread.py", "disk"),
+    ("asyncio/", "event loop"),
+)
+
+# Frames kept per allocation
+NFRAMES = 16
+
+
+def _stage(traceback: tracemalloc.Traceback) -> str:
+    for frame in reversed(traceback):
+        filename = frame.filename.replace("\\", "/")
+        for module, stage in STAGE_MODULES:
+            if module in filename:
+                return stage
+    return "other"
+
+
+class Profiler:
+    """
+    CPU and memory profile of a send, receive or relay run.
+
+    cProfile records the event loop thread and, separately, every thread
+    started while profiling, such as the asyncio.to_thread workers. With
+    memory profiling, tracemalloc traces allocations and a sampling thread
+    records the live bytes per pipeline stage (see STAGE_MODULES) and the
+    largest allocation sites at the peak.
+
+    Use as a context manager around run(); on exit three files are written:
+
+    - ``<prefix>-loop.prof``: pstats of the event loop thread
+    - ``<prefix>-threads.prof``: pstats of all other threads, merged
+    - ``<prefix>.txt``: top functions of both and the memory report
+
+    The .prof files can be read with ``python -m pstats`` or snakeviz. From
+    Python 3.12 on cProfile sees all threads at once, so the loop file holds
+    all of them.
+
+    Parameters
+    ----------
+    prefix : str or Path
+        Path prefix of the output files.
+    memory : bool, optional
+        Trace allocations; slows the transfer down noticeably. Default is True.
+    sample_interval : float, optional
+        Seconds between memory samples. Default is 0.5.
+    top : int, optional
+        Number of functions and allocation sites in the text report. Default is 25.
+    """
+
+    def __init__(self, prefix: str | Path, memory: bool = True, sample_interval: float = 0.5, top: int = 25):
+        self.prefix = Path(prefix)
+        self.memory = memory
+        self.sample_interval = sample_interval
+        self.top = top
+        self.stage_peaks: Dict[str, int] = {}
+        self.peak_sites: List[tracemalloc.Statistic] = []
+        self._peak_total = 0
+        self.traced_peak = 0
+        self._loop_profile = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.files: List[Path] = []
+
+    def __enter__(self) -> "Profiler":
+        if self.memory:
+            tracemalloc.start(NFRAMES)
+            self._sampler = threading.Thread(target=self._sample_loop, name="p2p_copy-profiler", daemon=True)
+            self._sampler.start()
+        if sys.version_info < (3, 12):
+            # before 3.12 a profiler only sees the thread that enabled it
+            threading.setprofile(self._profile_new_thread)
+        self._loop_profile.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._loop_profile.disable()
+        threading.setprofile(None)
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sample()
+            self.traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.files = self.write()
+
+    def _profile_new_thread(self, frame, event, arg) -> None:
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        per_stage: Dict[str, int] = {}
+        for stat in snapshot.statistics("traceback"):
+            stage = _stage(stat.traceback)
+            per_stage[stage] = per_stage.get(stage, 0) + stat.size
+        for stage, size in per_stage.items():
+            self.stage_peaks[stage] = max(size, self.stage_peaks.get(stage, 0))
+        if (total := sum(per_stage.values())) > self._peak_total:
+            self._peak_total = total
+            self.peak_sites = snapshot.statistics("lineno")[:self.top]
+
+    def _stats(self, profiles: List[cProfile.Profile]) -> Optional[pstats.Stats]:
+        profiles = [p for p in profiles if p.getstats()]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def write(self) -> List[Path]:
+        """
+        Write the profile files; called on exit.
+
+        Returns
+        -------
+        List[Path]
+            The files written.
+        """
+        self.prefix.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            thread_profiles = list(self._thread_profiles)
+        report = io.StringIO()
+        written = []
+        for name, stats in (("loop", self._stats([self._loop_profile])),
+                            ("threads", self._stats(thread_profiles))):
+            report.write(f"== CPU, {'event loop thread' if name == 'loop' else 'other threads'} ==\n")
+            if stats is None:
+                report.write("no samples\n\n")
+                continue
+            path = self.prefix.with_name(f"{self.prefix.name}-{name}.prof")
+            stats.dump_stats(path)
+            written.append(path)
+            stats.stream = report
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+
+        if self.memory:
+            # samples miss short-lived buffers, the traced peak does not
+            report.write(f"== Memory, traced peak {self.traced_peak / 2**20:.2f} MiB; "
+                         f"sampled peak live bytes per stage ==\n")
+            for stage, size in sorted(self.stage_peaks.items(), key=lambda item: -item[1]):
+                report.write(f"  {stage:<12}{size / 2**20:10.2f} MiB\n")
+            report.write(f"\n== Memory, largest allocation sites at peak ({self._peak_total / 2**20:.2f} MiB) ==\n")
+            for stat in self.peak_sites:
+                frame = stat.traceback[0]
+                report.write(f"  {stat.size / 2**20:10.2f} MiB {stat.count:8} blocks  {frame.filename}:{frame.lineno}\n")
+
+        path = self.prefix.with_name(self.prefix.name + ".txt")
+        path.write_text(report.getvalue())
+        written.append(path)
+        return written
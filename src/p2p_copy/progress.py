@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, TextIO
+
+from .stats import TransferStats
+
+
+@dataclass(frozen=True)
+class Progress:
+    """
+    Snapshot of a running transfer, passed to progress callbacks.
+
+    Parameters
+    ----------
+    bytes_done : int
+        File bytes transferred, plus bytes the receiver already had (resume).
+    bytes_total : int
+        Size of all files in the manifest; 0 until the manifest is known.
+    files_done : int
+        Files transferred or skipped.
+    files_total : int
+        Number of files in the manifest.
+    throughput : float
+        Current file bytes per second, smoothed over the last intervals.
+    eta : float, optional
+        Estimated seconds until done, None while unknown.
+    done : bool
+        True for the final report.
+    """
+    bytes_done: int
+    bytes_total: int
+    files_done: int
+    files_total: int
+    throughput: float
+    eta: Optional[float]
+    done: bool = False
+
+    @property
+    def fraction(self) -> float:
+        """Share of the bytes done, between 0 and 1."""
+        return min(1.0, self.bytes_done / self.bytes_total) if self.bytes_total else 0.0
+
+
+ProgressCallback = Callable[[Progress], None]
+
+
+class ProgressReporter:
+    """
+    Call a progress callback at a fixed interval while a transfer runs.
+
+    The transfer only updates counters in its TransferStats; the reporter
+    reads them from its own task, so the per-chunk path never calls the
+    callback. Use as an async context manager around the transfer; a final
+    report with done=True is made on exit.
+
+    Parameters
+    ----------
+    stats : TransferStats
+        The counters of the transfer.
+    callback : ProgressCallback, optional
+        Called with a Progress at most once per interval. None disables reporting.
+    interval : float, optional
+        Seconds between reports. Default is 0.5.
+    """
+
+    # Weight of the newest interval in the smoothed throughput
+    SMOOTHING = 0.3
+
+    def __init__(self, stats: TransferStats, callback: Optional[ProgressCallback], interval: float = 0.5):
+        self.stats = stats
+        self.callback = callback
+        self.interval = interval
+        self.throughput = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._last_bytes = 0
+        self._last_time = 0.0
+
+    async def __aenter__(self) -> "ProgressReporter":
+        if self.callback is not None:
+            self._last_time = time.perf_counter()
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if exc_info[0] is None:
+            self._report(done=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._report():
+                return
+
+    def snapshot(self, done: bool = False) -> Progress:
+        """
+        Compute the current progress and update the smoothed throughput.
+
+        Parameters
+        ----------
+        done : bool, optional
+            Mark the snapshot as the final one. Default is False.
+
+        Returns
+        -------
+        Progress
+        """
+        stats = self.stats
+        now = time.perf_counter()
+        if now > self._last_time:
+            rate = (stats.bytes_raw - self._last_bytes) / (now - self._last_time)
+            self.throughput = rate if not self.throughput else (
+                self.SMOOTHING * rate + (1 - self.SMOOTHING) * self.throughput)
+        self._last_bytes, self._last_time = stats.bytes_raw, now
+
+        bytes_done = stats.bytes_raw + stats.bytes_skipped
+        remaining = max(0, stats.bytes_total - bytes_done)
+        eta = 0.0 if done else (remaining / self.throughput if self.throughput > 0 and stats.bytes_total else None)
+        return Progress(bytes_done=bytes_done, bytes_total=stats.bytes_total,
+                        files_done=len(stats.files) + stats.files_skipped, files_total=stats.files_total,
+                        throughput=self.throughput, eta=eta, done=done)
+
+    def _report(self, done: bool = False) -> bool:
+        try:
+            self.callback(self.snapshot(done))
+            return True
+        except Exception as e:
+            print(f"[p2p_copy] progress callback failed, no more progress reports: {e!r}")
+            return False
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if n < 1024 or unit == "TiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n:.0f} B"
+        n /= 1024
+
+
+def _format_eta(seconds: float) -> str:
+    # hours are not wrapped at a day, long transfers show e.g. 25:00:00
+    minutes, s = divmod(int(seconds), 60)
+    h, m = divmod(minutes, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
+
+def progress_line(p: Progress) -> str:
+    """
+    Format a Progress as a one-line status.
+
+    Parameters
+    ----------
+    p : Progress
+
+    Returns
+    -------
+    str
+        e.g. '42% 1.2 GiB/3.0 GiB  3/10 files  85.3 MB/s  ETA 0:00:21'.
+    """
+    eta = "-:--:--" if p.eta is None else _format_eta(p.eta)
+    return (f"{p.fraction:4.0%} {_format_bytes(p.bytes_done)}/{_format_bytes(p.bytes_total)}  "
+            f"{p.files_done}/{p.files_total} files  {p.throughput / 1e6:.1f} MB/s  ETA {eta}")
+
+
+def terminal_progress(stream: TextIO = sys.stderr) -> ProgressCallback:
+    """
+    Create a callback that draws a progress line on a terminal.
+
+    On a terminal the line is redrawn in place, otherwise one line is written per report.
+
+    Parameters
+    ----------
+    stream : TextIO, optional
+        Where to write. Default is stderr.
+
+    Returns
+    -------
+    ProgressCallback
+    """
+    tty = stream.isatty()
+
+    def show(p: Progress) -> None:
+        if tty:
+            stream.write("\r\x1b[K" + progress_line(p) + ("\n" if p.done else ""))
+        else:
+            stream.write(progress_line(p) + "\n")
+        stream.flush()
+
+    return show
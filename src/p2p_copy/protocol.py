@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass, asdict
-from typing import Literal, Sequence, Any, Dict, Tuple
+from typing import Literal, Optional, Sequence, Any, Dict, Tuple
 import json, struct
 
 
@@ -55,13 +55,71 @@ class Hello:
         Hex-encoded hash of the shared code.
     role : Literal["sender", "receiver"]
         The role of this client.
+    spool : bool, optional
+        Sender only: ask the relay to store the upload until a receiver connects. Default is False.
+    broadcast : bool, optional
+        Take part in a one-to-many broadcast instead of a pair. Default is False.
+    receivers : int, optional
+        Broadcasting sender only: number of receivers to wait for. Default is 0.
+    gather : bool, optional
+        Take part in a many-to-one gather session. Default is False.
+    stream : int, optional
+        Gathering receiver only: the announced sender stream this connection
+        receives. Default is 0 (the session's control connection).
+    traceparent : str, optional
+        Sender only: W3C traceparent of the sender's trace, so the relay can
+        add its spans to it. Default is empty (no tracing).
+    session : str, optional
+        Id of a reconnectable session; the relay keeps the code for it while
+        the pair is broken. Default is empty (no reconnect).
+    reconnect : bool, optional
+        This connection continues a broken session. Default is False.
+    max_frame : int, optional
+        Receiver only: largest WebSocket message it accepts. The relay tells
+        the sender the smaller of this and its own limit. Default is 0
+        (the default limit, MAX_FRAME).
+    caps : int, optional
+        Receiver only: version of the capability exchange it speaks; the
+        relay passes it on in ready. Default is 0 (no exchange, the sender
+        goes straight to the manifest).
     """
     type: Literal["hello"]
     code_hash_hex: str
     role: Literal["sender", "receiver"]
+    spool: bool = False
+    broadcast: bool = False
+    receivers: int = 0
+    gather: bool = False
+    stream: int = 0
+    traceparent: str = ""
+    session: str = ""
+    reconnect: bool = False
+    max_frame: int = 0
+    caps: int = 0
 
     def to_json(self) -> str:
-        return dumps({"type": "hello", "code_hash_hex": self.code_hash_hex, "role": self.role})
+        msg: Dict[str, Any] = {"type": "hello", "code_hash_hex": self.code_hash_hex, "role": self.role}
+        if self.spool:
+            msg["spool"] = True
+        if self.broadcast:
+            msg["broadcast"] = True
+            if self.role == "sender":
+                msg["receivers"] = self.receivers
+        if self.gather:
+            msg["gather"] = True
+            if self.stream:
+                msg["stream"] = self.stream
+        if self.traceparent:
+            msg["traceparent"] = self.traceparent
+        if self.session:
+            msg["session"] = self.session
+            if self.reconnect:
+                msg["reconnect"] = True
+        if self.max_frame:
+            msg["max_frame"] = self.max_frame
+        if self.caps:
+            msg["caps"] = self.caps
+        return dumps(msg)
 
 
 @dataclass(frozen=True)
@@ -93,17 +151,46 @@ class Manifest:
         List of file entries.
     resume : bool, optional
         Whether to enable resume. Default is False.
+    traceparent : str, optional
+        W3C traceparent of the sender's trace, for the receiver's spans.
+        Default is empty (no tracing).
+    session : str, optional
+        Id of the session, if both sides reconnect after losing the
+        connection. Default is empty (no reconnect).
+    reconnect : float, optional
+        Seconds both sides keep trying to reconnect. Default is 0.
+    window : int, optional
+        Bytes of data frames the receiver is asked to allow in flight,
+        granting credit as it writes them. Default is 0 (no flow control).
+    retransmit : bool, optional
+        The receiver may ask for a corrupted data frame again with a nack,
+        and confirms the end with done. Default is False.
     """
     type: Literal["manifest"]
     entries: Sequence[ManifestEntry]
     resume: bool = False
+    traceparent: str = ""
+    session: str = ""
+    reconnect: float = 0.0
+    window: int = 0
+    retransmit: bool = False
 
     def to_json(self) -> str:
-        return dumps({
+        msg: Dict[str, Any] = {
             "type": "manifest",
             "resume": self.resume,
             "entries": [asdict(e) for e in self.entries]
-        })
+        }
+        if self.traceparent:
+            msg["traceparent"] = self.traceparent
+        if self.session:
+            msg["session"] = self.session
+            msg["reconnect"] = self.reconnect
+        if self.window:
+            msg["window"] = self.window
+        if self.retransmit:
+            msg["retransmit"] = True
+        return dumps(msg)
 
 
 @dataclass(frozen=True)
@@ -197,6 +284,130 @@ class EncryptedReceiverManifest:
         })
 
 
+@dataclass(frozen=True)
+class SessionState:
+    """
+    Receiver's position in a session, sent when it reconnects.
+
+    Everything up to this position has been written and flushed; the sender
+    continues right after it, with the chain state instead of re-reading or
+    re-hashing anything.
+
+    Parameters
+    ----------
+    type : Literal["session_state"]
+        Message type.
+    path : str, optional
+        File that was being received, None between files.
+    offset : int, optional
+        Bytes of that file on disk.
+    seq : int, optional
+        Next expected chunk sequence number of the file.
+    chain_hex : str, optional
+        Chained checksum after the last chunk received.
+    compression : str, optional
+        Compression of the file, 'zstd' or 'none'.
+    last : str, optional
+        Last file received completely, None if there is none yet.
+    """
+    type: Literal["session_state"]
+    path: Optional[str] = None
+    offset: int = 0
+    seq: int = 0
+    chain_hex: str = ""
+    compression: str = "none"
+    last: Optional[str] = None
+
+    def to_json(self) -> str:
+        return dumps(asdict(self))
+
+
+@dataclass(frozen=True)
+class EncryptedSessionState:
+    """
+    Session state sealed with the transfer key, so that the relay can neither
+    read nor forge the position.
+
+    Parameters
+    ----------
+    type : Literal["enc_session_state"]
+        Message type.
+    hidden_state : str
+        Hex-encoded sealed SessionState.
+    """
+    type: Literal["enc_session_state"]
+    hidden_state: str
+
+    def to_json(self) -> str:
+        return dumps({"type": "enc_session_state", "hidden_state": self.hidden_state})
+
+
+@dataclass(frozen=True)
+class EncryptedSessionNonce:
+    """
+    Sender's reply to an encrypted session state: a fresh random start of the
+    nonce chain, so that no nonce of the broken connection is used again.
+
+    Parameters
+    ----------
+    type : Literal["enc_session_nonce"]
+        Message type.
+    hidden_nonce : str
+        Hex-encoded sealed 32-byte nonce chain seed.
+    """
+    type: Literal["enc_session_nonce"]
+    hidden_nonce: str
+
+    def to_json(self) -> str:
+        return dumps({"type": "enc_session_nonce", "hidden_nonce": self.hidden_nonce})
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    """
+    What one side of a transfer supports, exchanged in the clear after ready.
+
+    The sender sends its capabilities first, the receiver answers with its
+    own, and both pick the same settings from the two, see negotiate().
+
+    Parameters
+    ----------
+    type : Literal["capabilities"]
+        Message type.
+    version : int
+        Version of the capability exchange.
+    codecs : Tuple[str, ...]
+        Compression codecs, preferred first.
+    hashes : Tuple[str, ...]
+        Algorithms of the chained checksum, preferred first.
+    ciphers : Tuple[str, ...]
+        Ciphers for end-to-end encryption, preferred first.
+    max_chunk : int
+        Largest chunk the side handles, in bytes.
+    streams : int
+        Connections the side can use for one transfer.
+    cpus : int
+        CPU cores of the side.
+    encrypt : bool
+        Whether the side encrypts this transfer.
+    """
+    type: Literal["capabilities"]
+    version: int
+    codecs: Tuple[str, ...]
+    hashes: Tuple[str, ...]
+    ciphers: Tuple[str, ...]
+    max_chunk: int
+    streams: int
+    cpus: int
+    encrypt: bool
+
+    def to_json(self) -> str:
+        msg = asdict(self)
+        for key in ("codecs", "hashes", "ciphers"):
+            msg[key] = list(msg[key])
+        return dumps(msg)
+
+
 # --- file control ----------------------------------------------------
 
 def file_begin(path: str, size: int, compression: str = "none", append_from: int = 0) -> str:
@@ -257,10 +468,173 @@ def encrypted_file_begin(hidden_file_info: bytes) -> str:
 
 READY = dumps({"type": "ready"})
 
+
+def ready(max_frame: int, caps: int = 0) -> str:
+    """
+    Tell a paired sender to start, and how large its frames may be.
+
+    Parameters
+    ----------
+    max_frame : int
+        Largest message the relay and the receiver accept.
+    caps : int, optional
+        Version of the capability exchange the receiver speaks. Default is
+        0 (the receiver expects the manifest right away).
+
+    Returns
+    -------
+    str
+        JSON string of the ready message.
+    """
+    msg: Dict[str, Any] = {"type": "ready", "max_frame": max_frame}
+    if caps:
+        msg["caps"] = caps
+    return dumps(msg)
+
+
 FILE_EOF = dumps({"type": "file_eof"})
 
 EOF = dumps({"type": "eof"})
 
+SPOOLED = dumps({"type": "spooled"})
+
+# Receiver got 'eof' of a reconnectable session, or of one with retransmits
+DONE = dumps({"type": "done"})
+
+
+def credit(size: int = 0, window: int = 0) -> str:
+    """
+    Grant the sender credit for data frames, sent by the receiver.
+
+    Parameters
+    ----------
+    size : int, optional
+        Bytes of data frames written since the last credit. Default is 0.
+    window : int, optional
+        The whole window granted, when it opens or grows. Default is 0.
+
+    Returns
+    -------
+    str
+        JSON string of the credit message.
+    """
+    msg: Dict[str, Any] = {"type": "credit"}
+    if size:
+        msg["bytes"] = size
+    if window:
+        msg["window"] = window
+    return dumps(msg)
+
+
+def window_request(size: int) -> str:
+    """
+    Ask the receiver for a larger window, sent by an auto-sizing sender.
+
+    Parameters
+    ----------
+    size : int
+        Bytes the window should have.
+
+    Returns
+    -------
+    str
+        JSON string of the window message.
+    """
+    return dumps({"type": "window", "bytes": size})
+
+
+def nack(nack_id: int, state: str) -> str:
+    """
+    Ask the sender to send again from the receiver's position, after a corrupted data frame.
+
+    Parameters
+    ----------
+    nack_id : int
+        Number of the request; the sender's retransmit answers it.
+    state : str
+        JSON of the receiver's SessionState, or of its EncryptedSessionState.
+
+    Returns
+    -------
+    str
+        JSON string of the nack message.
+    """
+    return dumps({"type": "nack", "id": nack_id, "state": state})
+
+
+def retransmit(nack_id: int) -> str:
+    """
+    Mark where the sender starts over for a nack; the receiver drops the frames before it.
+
+    Parameters
+    ----------
+    nack_id : int
+        Number of the nack.
+
+    Returns
+    -------
+    str
+        JSON string of the retransmit message.
+    """
+    return dumps({"type": "retransmit", "id": nack_id})
+
+
+def gather_join(stream: int) -> str:
+    """
+    Announce a new sender stream to a gathering receiver.
+
+    Parameters
+    ----------
+    stream : int
+        Stream number assigned by the relay.
+
+    Returns
+    -------
+    str
+        JSON string of the gather_join message.
+    """
+    return dumps({"type": "gather_join", "stream": stream})
+
+
+def direct_offer(candidates: Sequence[str], token: str) -> str:
+    """
+    Offer a direct connection to the sender, sent by the receiver through the relay.
+
+    Parameters
+    ----------
+    candidates : Sequence[str]
+        WebSocket URLs on which the receiver listens, best first.
+    token : str
+        Hex token the sender has to present on the direct connection.
+
+    Returns
+    -------
+    str
+        JSON string of the direct_offer message.
+    """
+    return dumps({"type": "direct_offer", "candidates": list(candidates), "token": token})
+
+
+def direct_hello(token: str) -> str:
+    """
+    First message of the sender on a direct connection.
+
+    Parameters
+    ----------
+    token : str
+        Token from the receiver's direct_offer.
+
+    Returns
+    -------
+    str
+        JSON string of the direct_hello message.
+    """
+    return dumps({"type": "direct_hello", "token": token})
+
+
+DIRECT_FAILED = dumps({"type": "direct_failed"})
+
+
 # --- chunked framing -------------------------------------------------
 
 # Binary frames: [ seq: uint64_be | chain: 32 bytes | payload... ]
@@ -1,3 +1,4 @@
+import copy
 import hashlib
 import os
 
@@ -68,6 +69,20 @@ class SecurityHandler:
         else:
             self.code_hash = hashlib.sha256(code.encode()).digest()
 
+    def fork(self) -> "SecurityHandler":
+        """
+        Create a handler for another stream with the same code, without deriving the keys again.
+
+        Returns
+        -------
+        SecurityHandler
+            A handler sharing code hash and cipher, with its own nonce chain.
+        """
+        other = copy.copy(self)
+        if self.encrypt:
+            other.nonce_hasher = ChainedChecksum()
+        return other
+
     def encrypt_chunk(self, chunk: bytes) -> bytes:
         """
         Encrypt a chunk if encryption is enabled.
@@ -104,6 +119,44 @@ class SecurityHandler:
             return self.cipher.decrypt(self.nonce_hasher.next_hash(), chunk, None)
         return chunk
 
+    def seal(self, data: bytes) -> bytes:
+        """
+        Encrypt and authenticate data with a random nonce, outside the nonce chain.
+
+        Parameters
+        ----------
+        data : bytes
+            The data to seal.
+
+        Returns
+        -------
+        bytes
+            32-byte nonce followed by the ciphertext.
+        """
+        nonce = os.urandom(32)
+        return nonce + self.cipher.encrypt(nonce, data, None)
+
+    def unseal(self, sealed: bytes) -> bytes:
+        """
+        Open data sealed with seal().
+
+        Parameters
+        ----------
+        sealed : bytes
+            Nonce and ciphertext.
+
+        Returns
+        -------
+        bytes
+            The data.
+
+        Raises
+        ------
+        cryptography.exceptions.InvalidTag
+            If the data was not sealed with the same code or was modified.
+        """
+        return self.cipher.decrypt(sealed[:32], sealed[32:], None)
+
     def build_encrypted_manifest(self, manifest: str) -> str:
         """
         Build an encrypted manifest for secure transmission.
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Any
+
+# Stages of the sender and of the receiver, in pipeline order
+SEND_STAGES = ("read", "compress", "encrypt", "hash", "credit_wait", "send_wait")
+RECEIVE_STAGES = ("recv_wait", "decrypt", "hash", "decompress", "write")
+
+# What it means when a stage takes the most time
+STAGE_HINTS = {
+    "read": "disk read",
+    "compress": "compression, try --compress off",
+    "encrypt": "encryption",
+    "hash": "chained checksum",
+    "credit_wait": "receiver writes, or a flow control window too small, try a larger --window",
+    "send_wait": "network, relay or receiver",
+    "recv_wait": "network, relay or sender",
+    "decrypt": "decryption",
+    "decompress": "decompression",
+    "write": "disk write",
+}
+
+
+@dataclass
+class FileStats:
+    """
+    Statistics of one transferred file.
+
+    Parameters
+    ----------
+    path : str
+        Relative path from the manifest.
+    size : int
+        Size of the complete file.
+    append_from : int
+        Offset the transfer resumed from, 0 for a complete transfer.
+    compression : str
+        'zstd' or 'none'.
+    bytes_raw : int
+        File bytes transferred.
+    bytes_compressed : int
+        Bytes after compression (before encryption).
+    seconds : float
+        Time from the file header to the last frame.
+    """
+    path: str
+    size: int
+    append_from: int = 0
+    compression: str = "none"
+    bytes_raw: int = 0
+    bytes_compressed: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class TransferStats:
+    """
+    Statistics of a transfer, filled in by send() or receive().
+
+    Stage times are summed over all chunks. On the sender compression,
+    encryption and hashing of the next chunk overlap with sending the current
+    one, so the stage times can add up to more than the elapsed time; the
+    stage with the largest time is the bottleneck.
+
+    Parameters
+    ----------
+    role : str
+        'sender' or 'receiver'; set by send() or receive().
+    bytes_raw : int
+        File bytes transferred.
+    bytes_compressed : int
+        Bytes after compression (before encryption).
+    bytes_wire : int
+        WebSocket payload bytes from sender to receiver, without WebSocket
+        and TLS headers.
+    bytes_total : int
+        Size of all files in the manifest.
+    files_total : int
+        Number of files in the manifest.
+    bytes_skipped : int
+        Bytes the receiver already had when resuming.
+    files_skipped : int
+        Files the receiver already had completely when resuming.
+    pairing_seconds : float
+        Time from connecting to the relay until the transfer started.
+    stages : Dict[str, float]
+        Seconds spent per stage, see SEND_STAGES and RECEIVE_STAGES.
+    files : List[FileStats]
+        Per-file statistics, in transfer order.
+    loop_lag_max : float
+        Largest event loop lag in seconds, measured with a stall threshold only.
+    loop_stalls : int
+        Number of times the event loop lag exceeded the stall threshold.
+    reconnects : int
+        Number of times a lost connection was re-established and the
+        transfer continued.
+    retransmits : int
+        Number of corrupted data frames after which the sender went back
+        to the receiver's position.
+    """
+    role: str = ""
+    bytes_raw: int = 0
+    bytes_compressed: int = 0
+    bytes_wire: int = 0
+    bytes_total: int = 0
+    files_total: int = 0
+    bytes_skipped: int = 0
+    files_skipped: int = 0
+    pairing_seconds: float = 0.0
+    stages: Dict[str, float] = field(default_factory=dict)
+    files: List[FileStats] = field(default_factory=list)
+    loop_lag_max: float = 0.0
+    loop_stalls: int = 0
+    reconnects: int = 0
+    retransmits: int = 0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    def begin(self, role: str) -> None:
+        """
+        Start timing; several streams may share one TransferStats.
+
+        Parameters
+        ----------
+        role : str
+            'sender' or 'receiver'.
+        """
+        self.role = role
+        for stage in SEND_STAGES if role == "sender" else RECEIVE_STAGES:
+            self.stages.setdefault(stage, 0.0)
+        if self.started is None:
+            self.started = time.perf_counter()
+
+    def end(self) -> None:
+        """
+        Stop timing.
+        """
+        self.finished = time.perf_counter()
+
+    def add(self, stage: str, seconds: float) -> None:
+        """
+        Add time to a stage.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        seconds : float
+            Time spent.
+        """
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from begin() to end(), or until now while running."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """File bytes per second."""
+        return self.bytes_raw / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        """Compressed size divided by raw size."""
+        return self.bytes_compressed / self.bytes_raw if self.bytes_raw else 1.0
+
+    @property
+    def bottleneck(self) -> Optional[str]:
+        """The stage with the most time, or None before any data was transferred."""
+        if not self.bytes_raw or not self.stages:
+            return None
+        return max(self.stages, key=self.stages.__getitem__)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert to a JSON-serializable dict, including elapsed time and bottleneck.
+
+        Returns
+        -------
+        Dict[str, Any]
+        """
+        d = asdict(self)
+        del d["started"], d["finished"]
+        d.update(elapsed=self.elapsed, throughput=self.throughput, bottleneck=self.bottleneck)
+        return d
+
+    def summary(self) -> str:
+        """
+        Human-readable summary of throughput, stage times and bottleneck.
+
+        Returns
+        -------
+        str
+        """
+        lines = [f"{len(self.files)} files, {self.bytes_raw / 2**20:.1f} MiB in {self.elapsed:.2f} s "
+                 f"({self.throughput / 1e6:.1f} MB/s), compressed {self.compression_ratio:.0%}, "
+                 f"on wire {self.bytes_wire / 2**20:.1f} MiB, pairing {self.pairing_seconds:.2f} s"]
+        lines += [f"  {stage:<11}{seconds:8.3f} s" for stage, seconds in self.stages.items()]
+        if self.loop_lag_max or self.loop_stalls:
+            lines.append(f"  event loop: max lag {self.loop_lag_max * 1000:.1f} ms, {self.loop_stalls} stalls")
+        if self.reconnects:
+            lines.append(f"  reconnected {self.reconnects} times")
+        if self.retransmits:
+            lines.append(f"  sent again after {self.retransmits} corrupted frames")
+        if (stage := self.bottleneck) is not None:
+            lines.append(f"  bottleneck: {stage} ({STAGE_HINTS.get(stage, stage)})")
+        return "\n".join(lines)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import ssl
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+from websockets.asyncio.client import connect, ClientConnection
+
+
+class SessionCachingContext(ssl.SSLContext):
+    """
+    Client SSL context that resumes TLS sessions per server host name.
+
+    asyncio creates TLS connections through wrap_bio() without a session
+    argument, so the cached session of the host is injected there.
+    """
+
+    sessions: Dict[Optional[str], ssl.SSLSession]
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname, session=session)
+
+    def remember(self, ws: ClientConnection) -> None:
+        """
+        Keep the TLS session of a connection for the next connection to the same host.
+
+        Parameters
+        ----------
+        ws : ClientConnection
+            A TLS connection that has received data, so TLS 1.3 tickets have arrived.
+        """
+        ssl_object = ws.transport.get_extra_info("ssl_object") if ws.transport else None
+        session = getattr(ssl_object, "session", None)
+        if session is not None and (session.has_ticket or session.id):
+            self.sessions[ssl_object.server_hostname] = session
+
+
+_client_context: Optional[SessionCachingContext] = None
+
+
+def client_context() -> SessionCachingContext:
+    """
+    Return the process-wide client SSL context, creating it on first use.
+
+    It verifies certificates like ssl.create_default_context(), requires at
+    least TLS 1.2 (TLS 1.3 is negotiated when the relay supports it) and
+    resumes sessions across transfers of this process.
+
+    Returns
+    -------
+    SessionCachingContext
+    """
+    global _client_context
+    if _client_context is None:
+        ctx = SessionCachingContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.load_default_certs(ssl.Purpose.SERVER_AUTH)
+        ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+        ctx.options |= ssl.OP_NO_COMPRESSION
+        ctx.sessions = {}
+        _client_context = ctx
+    return _client_context
+
+
+@asynccontextmanager
+async def connect_relay(server: str, **kwargs) -> AsyncIterator[ClientConnection]:
+    """
+    Connect to the relay, resuming an earlier TLS session for wss:// URLs.
+
+    Parameters
+    ----------
+    server : str
+        The WebSocket server URL (ws:// or wss://).
+    **kwargs
+        Passed to websockets' connect().
+
+    Yields
+    ------
+    ClientConnection
+    """
+    ctx = client_context() if urlsplit(server).scheme == "wss" else None
+    async with connect(server, ssl=ctx, **kwargs) as ws:
+        try:
+            yield ws
+        finally:
+            if ctx is not None:
+                ctx.remember(ws)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+# OTLP status codes
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+def new_trace_id() -> str:
+    """Random 16-byte trace id in hex."""
+    return os.urandom(16).hex()
+
+
+def parse_traceparent(value: Any) -> Optional[Tuple[str, str]]:
+    """
+    Read a W3C traceparent as sent in hello and manifest.
+
+    Parameters
+    ----------
+    value : Any
+        e.g. '00-<32 hex trace id>-<16 hex span id>-01'.
+
+    Returns
+    -------
+    Tuple[str, str], optional
+        Trace id and span id, None if the value is not a valid traceparent.
+    """
+    if not isinstance(value, str):
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """
+    One timed phase of a transfer.
+
+    Created with Tracer.start(); the trace id is taken from the parent span
+    unless the span has its own, so a receiver can move its spans into the
+    sender's trace with join() once the manifest has arrived.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"] = None, kind: int = INTERNAL,
+                 trace_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None,
+                 start_ns: Optional[int] = None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        self._trace_id = trace_id if trace_id is not None or parent is not None else new_trace_id()
+        self._remote_parent: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self._trace_id or self.parent.trace_id
+
+    @property
+    def parent_id(self) -> str:
+        return self._remote_parent or (self.parent.span_id if self.parent is not None else "")
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent of this span, for hello and manifest."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def join(self, traceparent: Any) -> None:
+        """
+        Make this span a child of a span in another process.
+
+        Parameters
+        ----------
+        traceparent : Any
+            The traceparent of the remote span; invalid values are ignored.
+        """
+        if (parsed := parse_traceparent(traceparent)) is not None:
+            self._trace_id, self._remote_parent = parsed
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes."""
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[str] = None, **attributes: Any) -> None:
+        """
+        End the span; later calls are ignored.
+
+        Parameters
+        ----------
+        error : str, optional
+            Mark the span as failed with this message.
+        **attributes
+            Attributes to add.
+        """
+        if self.end_ns is not None:
+            return
+        self.attributes.update(attributes)
+        self.error = error
+        self.end_ns = time.time_ns()
+        self.tracer._finished.append(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Tracer:
+    """
+    Collects spans and appends them to a file in the OTLP JSON format.
+
+    Each flush() appends one line holding an OTLP ExportTraceServiceRequest,
+    the format of the OpenTelemetry collector's file exporter, so sender,
+    relay and receiver may write to the same file or to separate files that
+    are concatenated. Sender and receiver flush when closed, the relay after
+    every pair.
+
+    Parameters
+    ----------
+    path : str or Path
+        File to append to.
+    service : str, optional
+        The service.name resource attribute. Default is 'p2p-copy'.
+    """
+
+    def __init__(self, path: Union[str, Path], service: str = "p2p-copy"):
+        self.path = Path(path)
+        self.service = service
+        self._finished: List[Span] = []
+
+    def start(self, name: str, parent: Optional[Span] = None, kind: int = INTERNAL,
+              traceparent: Any = None, start_ns: Optional[int] = None, **attributes: Any) -> Span:
+        """
+        Start a span.
+
+        Parameters
+        ----------
+        name : str
+            Name of the phase.
+        parent : Span, optional
+            Parent span in this process. Without a parent the span starts a new trace.
+        kind : int, optional
+            OTLP span kind. Default is INTERNAL.
+        traceparent : Any, optional
+            Parent span in another process, see Span.join().
+        start_ns : int, optional
+            Start time in ns since the epoch, if the phase began earlier. Default is now.
+        **attributes
+            Attributes of the span.
+
+        Returns
+        -------
+        Span
+        """
+        span = Span(self, name, parent, kind, attributes=attributes, start_ns=start_ns)
+        span.join(traceparent)
+        return span
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Context manager for start() and end(); an exception marks the span as failed.
+        """
+        span = self.start(name, parent, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=repr(e))
+            raise
+        span.end()
+
+    def flush(self) -> None:
+        """
+        Append the ended spans to the file.
+        """
+        if not self._finished:
+            return
+        spans, self._finished = self._finished, []
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service)]},
+            "scopeSpans": [{"scope": {"name": "p2p_copy"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as fp:
+            fp.write(json.dumps(request, separators=(",", ":")) + "\n")
+
+    def close(self) -> None:
+        """
+        Flush the remaining spans.
+        """
+        self.flush()
+
+    def __enter__(self) -> "Tracer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _NoTracer(Tracer):
+    """Tracer that drops all spans, used when tracing is off."""
+
+    def __init__(self):
+        self._finished = []
+
+    def start(self, name: str, parent: Optional[Span] = None, kind: int = INTERNAL,
+              traceparent: Any = None, start_ns: Optional[int] = None, **attributes: Any) -> Span:
+        return _NO_SPAN
+
+    def flush(self) -> None:
+        pass
+
+
+NO_TRACER: Tracer = _NoTracer()
+
+
+class _NoSpan(Span):
+    """Span of NO_TRACER; records nothing."""
+
+    def __init__(self):
+        super().__init__(NO_TRACER, "", trace_id="0" * 32)
+        self.span_id = "0" * 16
+
+    @property
+    def traceparent(self) -> str:
+        return ""
+
+    def join(self, traceparent: Any) -> None:
+        pass
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def end(self, error: Optional[str] = None, **attributes: Any) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
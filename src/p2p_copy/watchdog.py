@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .events import EventLog, NO_EVENTS
+from .stats import TransferStats
+
+# Innermost frames kept of a stalled stack
+STACK_LIMIT = 12
+
+
+@dataclass(frozen=True)
+class Stall:
+    """
+    One period in which the event loop did not run.
+
+    Parameters
+    ----------
+    seconds : float
+        How long the loop was blocked, beyond the heartbeat interval.
+    stack : str
+        Stack of the loop thread during the stall, empty if it ended before
+        the monitor thread could take it.
+    """
+    seconds: float
+    stack: str
+
+
+class LoopWatchdog:
+    """
+    Detect callbacks that block the event loop.
+
+    A heartbeat task sleeps for a short interval and measures how late it
+    wakes up (the loop lag). A monitor thread notices when the heartbeat is
+    overdue by more than the threshold and takes the stack of the loop thread
+    while it is still blocked, so the report points at the blocking call.
+    Every stall is printed, counted in TransferStats and written to the event
+    log as 'loop_stall'.
+
+    Use as an async context manager around the code to watch. With a
+    threshold of None the watchdog does nothing.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Lag in seconds that counts as a stall. None disables the watchdog.
+    stats : TransferStats, optional
+        Receives the largest lag and the number of stalls.
+    events : EventLog, optional
+        Receives a 'loop_stall' event per stall.
+    interval : float, optional
+        Heartbeat interval in seconds. Default is a quarter of the threshold,
+        at most 0.1.
+    """
+
+    def __init__(self, threshold: Optional[float], stats: Optional[TransferStats] = None,
+                 events: EventLog = NO_EVENTS, interval: Optional[float] = None):
+        self.threshold = threshold
+        self.stats = stats
+        self.events = events
+        self.interval = interval or (min(0.1, threshold / 4) if threshold else 0.1)
+        self.lag_max = 0.0
+        self.stalls: List[Stall] = []
+        self._beat = 0.0
+        self._stack: Optional[str] = None
+        self._loop_thread = 0
+        self._task: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def __aenter__(self) -> "LoopWatchdog":
+        if self.threshold is None:
+            return self
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._monitor = threading.Thread(target=self._watch, name="p2p_copy-watchdog", daemon=True)
+        self._monitor.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._monitor.join()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - self._beat - self.interval)
+            self._beat = now
+            stack, self._stack = self._stack, None
+            if lag > self.lag_max:
+                self.lag_max = lag
+                if self.stats is not None:
+                    self.stats.loop_lag_max = lag
+            if lag > self.threshold:
+                self._report(Stall(lag, stack or ""))
+
+    def _watch(self) -> None:
+        overdue = self.threshold + self.interval
+        while not self._stop.wait(self.interval / 2):
+            if self._stack is None and time.perf_counter() - self._beat > overdue:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+
+    def _report(self, stall: Stall) -> None:
+        self.stalls.append(stall)
+        if self.stats is not None:
+            self.stats.loop_stalls += 1
+        self.events.emit("loop_stall", seconds=round(stall.seconds, 4), stack=stall.stack)
+        print(f"[p2p_copy] event loop blocked for {stall.seconds:.3f} s"
+              + (f", in:\n{stall.stack.rstrip()}" if stall.stack else ""))
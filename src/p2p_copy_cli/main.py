@@ -1,12 +1,21 @@
 from __future__ import annotations
 
-import asyncio
+import json
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
 from typing import List, Optional
 
 import typer
 from p2p_copy import send as api_send, receive as api_receive
-from p2p_copy import CompressMode
-from p2p_copy_server import run_relay
+from p2p_copy import CompressMode, LoopKind, GatherLayout, TransferStats, EventLog, run
+from p2p_copy.flow import parse_window
+from p2p_copy.bench import run_bench, format_table, BenchStage, DataProfile
+from p2p_copy.profiling import Profiler
+from p2p_copy.progress import terminal_progress
+from p2p_copy.tracing import Tracer
+from p2p_copy_server import run_relay, RateLimits, PairingLimits, SpoolLimits, BroadcastLimits, SlowReceiverPolicy, TlsOptions
+from p2p_copy_server import NetworkEmulation, LinkProfile, ChaosPlan
 
 import sys
 
@@ -16,6 +25,20 @@ if hasattr(sys.stdout, "reconfigure"):  # on Python >= 3.7
 app = typer.Typer(add_completion=False, help="p2p-copy — chunked file transfer over WSS.")
 
 
+@contextmanager
+def _profiled(prefix: Optional[str]):
+    """Profile the enclosed run if a prefix is given and report the written files."""
+    if not prefix:
+        yield
+        return
+    profiler = Profiler(prefix)
+    try:
+        with profiler:
+            yield
+    finally:
+        print(f"[p2p_copy] profile written to {', '.join(map(str, profiler.files))}")
+
+
 @app.command(help="""
 Send one or more files or directories to a paired receiver via the relay server.
 
@@ -41,6 +64,35 @@ $ p2p-copy send wss://relay.example.com:443 mycode /path/to/dir --compress on --
 Send multiple specified files with encryption:
 
 $ p2p-copy send ws://localhost:8765 mycode *.txt --encrypt
+
+Upload now and let the receiver fetch it later (relay needs --spool-dir):
+
+$ p2p-copy send wss://relay.example.com:443 mycode /path/to/dir --spool --encrypt
+
+Send to three receivers at once (each runs receive with --broadcast):
+
+$ p2p-copy send wss://relay.example.com:443 mycode /path/to/dir --broadcast 3
+
+Keep a large transfer going over a flaky link, reconnecting for up to 10 minutes:
+
+$ p2p-copy send wss://relay.example.com:443 mycode big.img --reconnect 600
+
+Keep at most 16 MiB ahead of a receiver with a slow disk, or size the window automatically:
+
+$ p2p-copy send wss://relay.example.com:443 mycode big.img --window 16
+$ p2p-copy send wss://relay.example.com:443 mycode big.img --window auto
+
+Deliver results to a collector that runs receive with --gather:
+
+$ p2p-copy send wss://relay.example.com:443 mycode results/ --gather
+
+Send past the relay when the receiver is reachable (receiver also uses --direct):
+
+$ p2p-copy send wss://relay.example.com:443 mycode /path/to/dir --direct --encrypt
+
+Show progress and ETA, and where the time went at the end:
+
+$ p2p-copy send wss://relay.example.com:443 mycode /path/to/dir --progress --stats
 """)
 def send(
         server: str = typer.Argument(..., help="Relay WS(S) URL, e.g. wss://relay.example:443 or ws://localhost:8765"),
@@ -50,6 +102,22 @@ def send(
         compress: CompressMode = typer.Option(CompressMode.auto, help="Enable Compression"),
         resume: bool = typer.Option(False,
                                     help="resume previous copy progress, skips existing and completes partial files"),
+        spool: bool = typer.Option(False, help="Let the relay store the upload until the receiver connects; needs --encrypt"),
+        broadcast: int = typer.Option(0, min=0, help="Send to this many receivers at once"),
+        gather: bool = typer.Option(False, help="Send to a receiver that gathers from many senders"),
+        direct: bool = typer.Option(False, help="Try a direct connection to the receiver, fall back to the relay; needs --encrypt"),
+        reconnect: Optional[float] = typer.Option(None, min=0,
+                                                  help="Reconnect for up to SECONDS after losing the connection"),
+        window: Optional[str] = typer.Option(None, help="Flow control: MiB sent ahead of the receiver's writes, "
+                                                        "or 'auto' to size it from RTT and bandwidth"),
+        stats: bool = typer.Option(False, help="Print throughput, time per stage and the bottleneck when done"),
+        progress: bool = typer.Option(False, help="Show bytes, files, throughput and ETA while running"),
+        progress_interval: float = typer.Option(0.5, min=0.05, help="Seconds between progress updates"),
+        event_log: Optional[str] = typer.Option(None, help="Append JSON-lines events to this file, '-' for stdout"),
+        profile: Optional[str] = typer.Option(None, help="Write CPU and memory profiles to files with this path prefix"),
+        stall_threshold: Optional[float] = typer.Option(None, help="Report event loop stalls longer than SECONDS"),
+        trace: Optional[str] = typer.Option(None, help="Append OTLP JSON trace spans to this file"),
+        loop: LoopKind = typer.Option(LoopKind.asyncio, help="Event loop implementation"),
 ):
     """
     Send one or more files or directories to a paired receiver via the relay server.
@@ -68,6 +136,36 @@ def send(
         Compression mode. Default is 'auto'.
     resume : bool, optional
         Enable resume of partial transfers. Default is False.
+    spool : bool, optional
+        Upload into the relay's spool instead of waiting for the receiver; needs encrypt. Default is False.
+    broadcast : int, optional
+        Number of broadcast receivers to send to. Default is 0 (single receiver).
+    gather : bool, optional
+        Send to a gathering receiver. Default is False.
+    direct : bool, optional
+        Send past the relay if the receiver is reachable; needs encrypt. Default is False.
+    reconnect : float, optional
+        Seconds to keep reconnecting after a lost connection, continuing
+        mid-file. Default is None (no reconnect).
+    window : str, optional
+        Flow control window in MiB, or 'auto'. Default is None (no flow control).
+    stats : bool, optional
+        Print transfer statistics at the end. Default is False.
+    progress : bool, optional
+        Show a progress line on stderr. Default is False.
+    progress_interval : float, optional
+        Seconds between progress updates. Default is 0.5.
+    event_log : str, optional
+        File for the JSON-lines event log, '-' for stdout. Default is None (no log).
+    profile : str, optional
+        Path prefix for <prefix>-loop.prof, <prefix>-threads.prof and <prefix>.txt.
+        Default is None (no profiling).
+    stall_threshold : float, optional
+        Report event loop stalls longer than this many seconds. Default is None (off).
+    trace : str, optional
+        File to append OTLP JSON trace spans to. Default is None (no tracing).
+    loop : LoopKind, optional
+        Event loop implementation. Default is 'asyncio'.
 
     Returns
     -------
@@ -79,10 +177,30 @@ def send(
     - Supports resuming by comparing checksums of partial files.
     - Uses chunked streaming for large files.
     """
-    raise SystemExit(asyncio.run(api_send(
-        files=files, code=code, server=server, encrypt=encrypt,
-        compress=compress, resume=resume,
-    )))
+    try:
+        window_bytes = parse_window(window) if window is not None else None
+    except ValueError:
+        raise typer.BadParameter("--window expects MiB or 'auto'")
+    transfer_stats = TransferStats()
+    events = EventLog(event_log) if event_log else None
+    tracer = Tracer(trace, service="p2p-copy-sender") if trace else None
+    try:
+        with _profiled(profile):
+            rc = run(api_send(
+                files=files, code=code, server=server, encrypt=encrypt,
+                compress=compress, resume=resume, spool=spool, broadcast=broadcast, gather=gather,
+                direct=direct, reconnect=reconnect, window=window_bytes, stats=transfer_stats,
+                progress=terminal_progress() if progress else None, progress_interval=progress_interval,
+                events=events, stall_threshold=stall_threshold, tracer=tracer,
+            ), loop=loop)
+    finally:
+        if events is not None:
+            events.close()
+        if tracer is not None:
+            tracer.close()
+    if stats:
+        print(transfer_stats.summary())
+    raise SystemExit(rc)
 
 
 @app.command(help="""
@@ -104,12 +222,36 @@ $ p2p-copy receive wss://relay.example.com:443 mycode
 Receive to a specific directory with encryption:
 
 $ p2p-copy receive ws://localhost:8765 mycode --out /tmp/downloads --encrypt
+
+Join a broadcast started with send --broadcast:
+
+$ p2p-copy receive wss://relay.example.com:443 mycode --broadcast
+
+Collect the results of 500 senders into one subdirectory each:
+
+$ p2p-copy receive wss://relay.example.com:443 mycode --out results --gather 500
 """)
 def receive(
         server: str = typer.Argument(..., help="Relay WS(S) URL, e.g. wss://relay.example:443 or ws://localhost:8765"),
         code: str = typer.Argument(..., help="Shared passphrase/code"),
         encrypt: bool = typer.Option(False, help="Enable end-to-end encryption"),
         out: Optional[str] = typer.Option(".", "--out", help="Output directory"),
+        broadcast: bool = typer.Option(False, help="Join a one-to-many broadcast"),
+        gather: int = typer.Option(0, min=0, help="Receive concurrently from this many senders using --gather"),
+        layout: GatherLayout = typer.Option(GatherLayout.subdirs, help="Output layout for gathered senders"),
+        direct: bool = typer.Option(False, help="Accept a direct connection from the sender, fall back to the relay; needs --encrypt"),
+        checkpoint_mb: float = typer.Option(64.0, min=0,
+                                            help="Checkpoint large files every this many MiB for fast resume, 0 disables"),
+        max_frame_mb: float = typer.Option(2.0, min=0.125,
+                                           help="Largest frame to accept in MiB; the sender sizes its chunks to fit"),
+        stats: bool = typer.Option(False, help="Print throughput, time per stage and the bottleneck when done"),
+        progress: bool = typer.Option(False, help="Show bytes, files, throughput and ETA while running"),
+        progress_interval: float = typer.Option(0.5, min=0.05, help="Seconds between progress updates"),
+        event_log: Optional[str] = typer.Option(None, help="Append JSON-lines events to this file, '-' for stdout"),
+        profile: Optional[str] = typer.Option(None, help="Write CPU and memory profiles to files with this path prefix"),
+        stall_threshold: Optional[float] = typer.Option(None, help="Report event loop stalls longer than SECONDS"),
+        trace: Optional[str] = typer.Option(None, help="Append OTLP JSON trace spans to this file"),
+        loop: LoopKind = typer.Option(LoopKind.asyncio, help="Event loop implementation"),
 ):
     """
     Receive files from a sender via the relay server.
@@ -124,6 +266,35 @@ def receive(
         Enable end-to-end encryption. Default is False.
     out : str, optional
         Output directory. Default is current directory.
+    broadcast : bool, optional
+        Join a one-to-many broadcast. Default is False.
+    gather : int, optional
+        Number of senders to gather from. Default is 0 (single sender).
+    layout : GatherLayout, optional
+        Subdirectory per sender or merged tree. Default is 'subdirs'.
+    direct : bool, optional
+        Offer a direct connection to the sender; needs encrypt. Default is False.
+    checkpoint_mb : float, optional
+        MiB between checkpoints of a file's checksum chain; 0 disables. Default is 64.
+    max_frame_mb : float, optional
+        Largest WebSocket message to accept, in MiB. Default is 2.
+    stats : bool, optional
+        Print transfer statistics at the end. Default is False.
+    progress : bool, optional
+        Show a progress line on stderr. Default is False.
+    progress_interval : float, optional
+        Seconds between progress updates. Default is 0.5.
+    event_log : str, optional
+        File for the JSON-lines event log, '-' for stdout. Default is None (no log).
+    profile : str, optional
+        Path prefix for <prefix>-loop.prof, <prefix>-threads.prof and <prefix>.txt.
+        Default is None (no profiling).
+    stall_threshold : float, optional
+        Report event loop stalls longer than this many seconds. Default is None (off).
+    trace : str, optional
+        File to append OTLP JSON trace spans to. Default is None (no tracing).
+    loop : LoopKind, optional
+        Event loop implementation. Default is 'asyncio'.
 
     Returns
     -------
@@ -135,9 +306,27 @@ def receive(
     - Supports resume if sender requests it.
     - Writes files to the output directory, preserving relative paths.
     """
-    raise SystemExit(asyncio.run(api_receive(
-        code=code, server=server, encrypt=encrypt, out=out,
-    )))
+    transfer_stats = TransferStats()
+    events = EventLog(event_log) if event_log else None
+    tracer = Tracer(trace, service="p2p-copy-receiver") if trace else None
+    try:
+        with _profiled(profile):
+            rc = run(api_receive(
+                code=code, server=server, encrypt=encrypt, out=out, broadcast=broadcast,
+                gather=gather, layout=layout, direct=direct,
+                checkpoint_every=int(checkpoint_mb * 2**20) or None, max_frame=int(max_frame_mb * 2**20),
+                stats=transfer_stats,
+                progress=terminal_progress() if progress else None, progress_interval=progress_interval,
+                events=events, stall_threshold=stall_threshold, tracer=tracer,
+            ), loop=loop)
+    finally:
+        if events is not None:
+            events.close()
+        if tracer is not None:
+            tracer.close()
+    if stats:
+        print(transfer_stats.summary())
+    raise SystemExit(rc)
 
 
 @app.command("run-relay-server", help="""
@@ -159,6 +348,10 @@ $ p2p-copy run-relay-server localhost 8765 --no-tls
 Run with TLS on a public host:
 
 $ p2p-copy run-relay-server 0.0.0.0 443 --tls --certfile cert.pem --keyfile key.pem
+
+Limit every pair to 200 Mbit/s and share a 1 Gbit/s uplink fairly:
+
+$ p2p-copy run-relay-server 0.0.0.0 443 --certfile cert.pem --keyfile key.pem --pair-mbit 200 --uplink-mbit 1000
 """)
 def run_relay_server(
         server_host: str = typer.Argument(..., help="Host/Interface to bind"),
@@ -166,6 +359,42 @@ def run_relay_server(
         tls: bool = typer.Option(True, "--tls/--no-tls", help="Enable WSS/TLS"),
         certfile: Optional[str] = typer.Option(None, help="TLS cert file (PEM)"),
         keyfile: Optional[str] = typer.Option(None, help="TLS key file (PEM)"),
+        tls_min_version: str = typer.Option("1.2", help="Lowest accepted TLS version (1.2 or 1.3)"),
+        tls_ciphers: Optional[str] = typer.Option(None, help="OpenSSL cipher preference string for TLS 1.2"),
+        tls_tickets: int = typer.Option(2, min=0,
+                                        help="TLS 1.3 session tickets per handshake for resumption, 0 disables"),
+        pair_mbit: Optional[float] = typer.Option(None, help="Rate limit per sender/receiver pair in Mbit/s"),
+        ip_mbit: Optional[float] = typer.Option(None, help="Rate limit per source IP in Mbit/s"),
+        uplink_mbit: Optional[float] = typer.Option(None,
+                                                    help="Total relay bandwidth in Mbit/s, shared fairly between pairs"),
+        ip_weight: List[str] = typer.Option([], help="Fair-share weight of a source IP as IP=WEIGHT, repeatable"),
+        wait_timeout: Optional[float] = typer.Option(None, help="Seconds a client may wait for its peer"),
+        max_waiting: Optional[int] = typer.Option(None, help="Maximum number of clients waiting for a peer"),
+        ping_interval: Optional[float] = typer.Option(20.0, help="Seconds between keepalive pings, 0 disables"),
+        max_frame_mb: float = typer.Option(2.0, min=0.125, help="Largest frame to relay in MiB, told to senders"),
+        reconnect_grace: float = typer.Option(60.0, min=0,
+                                              help="Seconds the code of a broken reconnecting session is kept"),
+        spool_dir: Optional[str] = typer.Option(None, help="Enable store-and-forward uploads in this directory"),
+        spool_max_mb: Optional[float] = typer.Option(None, help="Maximum size of one spooled upload in MiB"),
+        spool_total_mb: Optional[float] = typer.Option(None, help="Maximum size of all spooled uploads in MiB"),
+        spool_ttl: float = typer.Option(24 * 3600.0, help="Seconds a spooled upload is kept"),
+        broadcast_queue: int = typer.Option(16, min=1, help="Frames buffered per broadcast receiver"),
+        slow_receiver: SlowReceiverPolicy = typer.Option(SlowReceiverPolicy.wait,
+                                                         help="What to do with broadcast receivers that fall behind"),
+        event_log: Optional[str] = typer.Option(None, help="Append JSON-lines events to this file, '-' for stdout"),
+        profile: Optional[str] = typer.Option(None, help="Write CPU and memory profiles to files with this path prefix"),
+        stall_threshold: Optional[float] = typer.Option(None, help="Report event loop stalls longer than SECONDS"),
+        trace: Optional[str] = typer.Option(None, help="Append OTLP JSON trace spans to this file"),
+        emulate: Optional[str] = typer.Option(
+            None, help="Emulate a network path for every pair: a preset (lan, broadband, dsl, lte, wan, satellite, "
+                       "flaky) and/or mbit=,latency=,jitter=,loss=,stall-every=,stall= (for testing only)"),
+        emulate_to_sender: Optional[str] = typer.Option(
+            None, help="Path from receiver to sender, if it differs from --emulate; same format"),
+        emulate_seed: int = typer.Option(0, help="Seed of emulated jitter, loss and stalls"),
+        chaos: Optional[str] = typer.Option(
+            None, help="Inject faults into pairs in pairing order, e.g. 'drop@4M,none,pause@1M:2s' or "
+                       "'seed=7,pairs=10,max=64M'; kinds drop, truncate, pause, corrupt (for testing only)"),
+        loop: LoopKind = typer.Option(LoopKind.asyncio, help="Event loop implementation"),
 ):
     """
     Run the relay server.
@@ -182,6 +411,64 @@ def run_relay_server(
         Path to TLS certificate file (PEM).
     keyfile : str, optional
         Path to TLS key file (PEM).
+    tls_min_version : str, optional
+        Lowest accepted TLS version. Default is '1.2'.
+    tls_ciphers : str, optional
+        Cipher preferences for TLS 1.2. Default is OpenSSL's.
+    tls_tickets : int, optional
+        Session tickets per TLS 1.3 handshake. Default is 2.
+    pair_mbit : float, optional
+        Rate limit per pair in Mbit/s.
+    ip_mbit : float, optional
+        Rate limit per source IP in Mbit/s.
+    uplink_mbit : float, optional
+        Total bandwidth shared between pairs by weighted fair queuing, in Mbit/s.
+    ip_weight : List[str], optional
+        Fair-share weights as IP=WEIGHT entries.
+    wait_timeout : float, optional
+        Seconds a client may wait for its peer. Default is unlimited.
+    max_waiting : int, optional
+        Maximum number of waiting clients. Default is unlimited.
+    ping_interval : float, optional
+        Keepalive interval in seconds; unresponsive connections are reaped. Default is 20.
+    max_frame_mb : float, optional
+        Largest WebSocket message to accept, in MiB. Senders size their
+        chunks to fit it and the receiver's limit. Default is 2.
+    reconnect_grace : float, optional
+        Seconds a broken session keeps its code for its clients to reconnect. Default is 60.
+    spool_dir : str, optional
+        Directory for store-and-forward uploads. Default is None (spool disabled).
+    spool_max_mb : float, optional
+        Quota per spooled upload in MiB. Default is unlimited.
+    spool_total_mb : float, optional
+        Quota for all spooled uploads in MiB. Default is unlimited.
+    spool_ttl : float, optional
+        Seconds after which spooled uploads expire. Default is 24 hours.
+    broadcast_queue : int, optional
+        In-memory queue per broadcast receiver, in frames. Default is 16.
+    slow_receiver : SlowReceiverPolicy, optional
+        'wait' slows the sender down, 'drop' disconnects the receiver, 'spool'
+        buffers its frames in the spool directory. Default is 'wait'.
+    event_log : str, optional
+        File for the JSON-lines event log, '-' for stdout. Default is None (no log).
+    profile : str, optional
+        Path prefix for <prefix>-loop.prof, <prefix>-threads.prof and <prefix>.txt.
+        Default is None (no profiling).
+    stall_threshold : float, optional
+        Report event loop stalls longer than this many seconds. Default is None (off).
+    trace : str, optional
+        File to append OTLP JSON trace spans to. Default is None (no tracing).
+    emulate : str, optional
+        Network profile applied from sender to receiver, and in the other
+        direction unless emulate_to_sender is given. Default is None (off).
+    emulate_to_sender : str, optional
+        Network profile from receiver to sender. Default is emulate.
+    emulate_seed : int, optional
+        Seed for the random parts of the emulation. Default is 0.
+    chaos : str, optional
+        Fault schedule, see ChaosPlan.parse(). Default is None (no faults).
+    loop : LoopKind, optional
+        Event loop implementation. Default is 'asyncio'.
 
     Returns
     -------
@@ -194,15 +481,125 @@ def run_relay_server(
     - Configures production logging if host is not localhost.
     """
     try:
-        asyncio.run(run_relay(
-            host=server_host,
-            port=server_port,
-            use_tls=tls,
-            certfile=certfile,
-            keyfile=keyfile,
-        ))
+        weights = {ip: float(w) for ip, w in (entry.rsplit("=", 1) for entry in ip_weight)}
+    except ValueError:
+        raise typer.BadParameter("--ip-weight expects IP=WEIGHT")
+    try:
+        rate_limits = RateLimits(pair_mbit=pair_mbit, ip_mbit=ip_mbit, uplink_mbit=uplink_mbit, ip_weights=weights)
+    except ValueError as e:
+        raise typer.BadParameter(f"--ip-weight: {e}")
+    pairing = PairingLimits(wait_timeout=wait_timeout, max_waiting=max_waiting,
+                            ping_interval=ping_interval or None, reconnect_grace=reconnect_grace)
+    spool = SpoolLimits(
+        directory=spool_dir,
+        max_bytes=int(spool_max_mb * 2**20) if spool_max_mb else None,
+        max_total_bytes=int(spool_total_mb * 2**20) if spool_total_mb else None,
+        ttl=spool_ttl,
+    ) if spool_dir else None
+    try:
+        to_receiver = LinkProfile.parse(emulate) if emulate else None
+        to_sender = LinkProfile.parse(emulate_to_sender) if emulate_to_sender else to_receiver
+        chaos_plan = ChaosPlan.parse(chaos) if chaos else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    emulation = NetworkEmulation(to_receiver=to_receiver, to_sender=to_sender, seed=emulate_seed)
+    if emulation.enabled:
+        print(f"[p2p_copy] emulating network to receiver: {to_receiver}, to sender: {to_sender}")
+    if chaos_plan is not None:
+        print(f"[p2p_copy] injecting faults: {chaos_plan}")
+    events = EventLog(event_log) if event_log else None
+    tracer = Tracer(trace, service="p2p-copy-relay") if trace else None
+    try:
+        with _profiled(profile):
+            run(run_relay(
+                host=server_host,
+                port=server_port,
+                use_tls=tls,
+                certfile=certfile,
+                keyfile=keyfile,
+                rate_limits=rate_limits,
+                pairing=pairing,
+                spool=spool,
+                broadcast=BroadcastLimits(queue_frames=broadcast_queue, policy=slow_receiver),
+                tls_options=TlsOptions(min_version=tls_min_version, ciphers=tls_ciphers, session_tickets=tls_tickets),
+                events=events, stall_threshold=stall_threshold, tracer=tracer, emulation=emulation,
+                chaos=chaos_plan, max_frame=int(max_frame_mb * 2**20),
+            ), loop=loop)
     except KeyboardInterrupt:
         pass
+    finally:
+        if events is not None:
+            events.close()
+        if tracer is not None:
+            tracer.close()
+
+
+@app.command(help="""
+Measure the throughput of each stage of a transfer on this machine.
+
+Disk read, compression, chained checksum, encryption and frame packing are
+measured separately over the given chunk sizes, compression levels and data
+profiles. The WebSocket loopback and the full send/receive pipeline run
+against a relay started in this process. Compare the MiB/s column to see
+which stage limits transfers; use --json to compare machines.
+
+
+Examples
+
+Measure all stages with the defaults:
+
+$ p2p-copy bench
+
+Compare compression levels on text-like data:
+
+$ p2p-copy bench --stage compress --data text --level 1 --level 3 --level 9
+
+Measure the disk holding /data and save the results:
+
+$ p2p-copy bench --dir /data --json bench-host1.json
+""")
+def bench(
+        stage: List[BenchStage] = typer.Option(list(BenchStage), help="Stage to measure, repeatable"),
+        data: List[DataProfile] = typer.Option(list(DataProfile), help="Data profile, repeatable"),
+        chunk_size: List[int] = typer.Option([64 * 2**10, 2**20], min=1, help="Chunk size in bytes, repeatable"),
+        level: List[int] = typer.Option([3], help="Zstandard level of the compress stage, repeatable"),
+        size_mb: float = typer.Option(32.0, min=1.0, help="MiB of data per measurement"),
+        encrypt: bool = typer.Option(False, help="Encrypt the pipeline transfer"),
+        directory: Optional[str] = typer.Option(None, "--dir", help="Directory for temporary files (the disk to measure)"),
+        json_out: Optional[str] = typer.Option(None, "--json", help="Also write the results as JSON to this file"),
+        loop: LoopKind = typer.Option(LoopKind.asyncio, help="Event loop implementation"),
+):
+    """
+    Run the per-stage microbenchmarks and print the results.
+
+    Parameters
+    ----------
+    stage : List[BenchStage], optional
+        Stages to measure. Default is all.
+    data : List[DataProfile], optional
+        Data profiles ('random', 'text', 'zeros'). Default is all.
+    chunk_size : List[int], optional
+        Chunk sizes in bytes. Default is 64 KiB and 1 MiB.
+    level : List[int], optional
+        Zstandard levels of the compress stage. Default is 3.
+    size_mb : float, optional
+        MiB of data processed per measurement. Default is 32.
+    encrypt : bool, optional
+        Encrypt the pipeline transfer. Default is False.
+    directory : str, optional
+        Directory for temporary files. Default is the system temp directory.
+    json_out : str, optional
+        Path of a JSON file for the results. Default is None.
+    loop : LoopKind, optional
+        Event loop implementation. Default is 'asyncio'.
+    """
+    results = run(run_bench(
+        stages=stage, profiles=data, chunk_sizes=chunk_size, levels=level,
+        size=int(size_mb * 2**20), encrypt=encrypt, directory=directory,
+    ), loop=loop)
+    print(format_table(results))
+    if json_out:
+        Path(json_out).write_text(json.dumps([asdict(r) for r in results], indent=2))
 
 
 if __name__ == "__main__":
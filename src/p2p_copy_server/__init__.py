@@ -3,6 +3,14 @@ import sys
 if hasattr(sys.stdout, "reconfigure"):  # on Python >= 3.7
     sys.stdout.reconfigure(line_buffering=True)
 
-__all__ = ["run_relay"]
+__all__ = ["run_relay", "RateLimits", "PairingLimits", "SpoolLimits", "BroadcastLimits", "SlowReceiverPolicy", "TlsOptions",
+           "NetworkEmulation", "LinkProfile", "ChaosPlan", "Fault", "FaultKind"]
 
 from .relay import run_relay
+from .scheduler import RateLimits
+from .pairing import PairingLimits
+from .spool import SpoolLimits
+from .broadcast import BroadcastLimits, SlowReceiverPolicy
+from .tls import TlsOptions
+from .emulation import NetworkEmulation, LinkProfile
+from .chaos import ChaosPlan, Fault, FaultKind
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import List, Optional, Set, Union
+
+from websockets.asyncio.server import ServerConnection
+
+from .spool import Spool
+
+
+class SlowReceiverPolicy(str, Enum):
+    """
+    What the relay does when a broadcast receiver falls behind.
+    """
+
+    wait = "wait"  # the sender slows down to the slowest receiver
+    drop = "drop"  # the slow receiver is disconnected
+    spool = "spool"  # frames for the slow receiver overflow to disk
+
+
+@dataclass(frozen=True)
+class BroadcastLimits:
+    """
+    Settings for one-to-many broadcasts.
+
+    Parameters
+    ----------
+    queue_frames : int, optional
+        Frames buffered in memory per receiver. Default is 16.
+    policy : SlowReceiverPolicy, optional
+        Handling of receivers whose queue is full. Default is 'wait'.
+    max_receivers : int, optional
+        Maximum number of receivers per broadcast. Default is 256.
+    grace : float, optional
+        Seconds a full queue may stay full before the 'drop' or 'spool' policy
+        applies, so short hiccups are absorbed. Default is 2.
+    """
+    queue_frames: int = 16
+    policy: SlowReceiverPolicy = SlowReceiverPolicy.wait
+    max_receivers: int = 256
+    grace: float = 2.0
+
+
+class Subscriber:
+    """
+    One receiver of a broadcast with its own bounded frame queue.
+
+    Parameters
+    ----------
+    ws : ServerConnection
+        The receiver connection.
+    queue_frames : int
+        Capacity of the in-memory queue.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, ws: ServerConnection, queue_frames: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_frames))
+        self.overflow: Optional[Spool] = None
+        self.failed = False
+        self.id = next(self._ids)
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._forward())
+
+    async def _forward(self) -> None:
+        try:
+            while (frame := await self.queue.get()) is not None:
+                await self.ws.send(frame)
+            if self.overflow is not None:
+                await self.overflow.replay(self.ws)
+        except Exception:
+            self.failed = True
+        finally:
+            if self.overflow is not None:
+                self.overflow.path.unlink(missing_ok=True)
+            # nothing reads the queue any more, free a publisher waiting for room in it
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+
+class BroadcastGroup:
+    """
+    One sender and many receivers sharing a code hash.
+
+    The sender's frames are read once and fanned out to all receivers.
+
+    Parameters
+    ----------
+    limits : BroadcastLimits
+        Queue size, slow-receiver policy and receiver limit.
+    spool_dir : Path, optional
+        Directory for overflow files, required for the 'spool' policy.
+    """
+
+    def __init__(self, limits: BroadcastLimits, spool_dir: Optional[Path] = None):
+        self.limits = limits
+        self.spool_dir = spool_dir
+        self.subscribers: List[Subscriber] = []
+        self.sender: Optional[ServerConnection] = None
+        self.expected = 0
+        self.started = False
+        self._changed = asyncio.Event()
+        self._dropped: Set[asyncio.Task] = set()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def add_receiver(self, ws: ServerConnection) -> Optional[Subscriber]:
+        """
+        Subscribe a receiver before the broadcast starts.
+
+        Parameters
+        ----------
+        ws : ServerConnection
+            The receiver connection.
+
+        Returns
+        -------
+        Subscriber or None
+            None if the broadcast already started or is full.
+        """
+        if self.started or len(self.subscribers) >= self.limits.max_receivers:
+            return None
+        sub = Subscriber(ws, self.limits.queue_frames)
+        self.subscribers.append(sub)
+        self._notify()
+        return sub
+
+    def remove_receiver(self, sub: Subscriber) -> None:
+        """
+        Unsubscribe a receiver that left before the broadcast started.
+
+        Parameters
+        ----------
+        sub : Subscriber
+            The receiver to remove.
+        """
+        if not self.started and sub in self.subscribers:
+            self.subscribers.remove(sub)
+            self._notify()
+
+    @property
+    def empty(self) -> bool:
+        return self.sender is None and not self.subscribers
+
+    async def wait_ready(self, timeout: Optional[float]) -> bool:
+        """
+        Wait until the sender and all expected receivers are connected.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait. None waits without limit.
+
+        Returns
+        -------
+        bool
+            True if the broadcast can start.
+        """
+        async def ready():
+            while len(self.subscribers) < self.expected:
+                await self._changed.wait()
+
+        try:
+            await asyncio.wait_for(ready(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.started = True
+        for sub in self.subscribers:
+            sub.start()
+        return True
+
+    async def publish(self, frame: Union[str, bytes]) -> bool:
+        """
+        Hand one frame to every receiver according to the slow-receiver policy.
+
+        Parameters
+        ----------
+        frame : str or bytes
+            The frame from the sender.
+
+        Returns
+        -------
+        bool
+            False once no receiver is left.
+        """
+        for sub in list(self.subscribers):
+            if sub.failed:
+                self.subscribers.remove(sub)
+            elif sub.overflow is not None:
+                await sub.overflow.append(frame)
+            elif self.limits.policy == SlowReceiverPolicy.wait:
+                await sub.queue.put(frame)
+            elif await self._put_within_grace(sub, frame):
+                continue
+            elif self.limits.policy == SlowReceiverPolicy.drop:
+                self.subscribers.remove(sub)
+                sub.task.cancel()
+                # do not hold up the others while the close handshake waits for the slow receiver
+                task = asyncio.create_task(sub.ws.close(code=1013, reason="Receiver too slow for broadcast"))
+                self._dropped.add(task)
+                task.add_done_callback(self._dropped.discard)
+            else:
+                sub.overflow = Spool(self.spool_dir / f"broadcast-{id(self)}-{sub.id}.overflow")
+                await sub.overflow.append(frame)
+        return bool(self.subscribers)
+
+    async def _put_within_grace(self, sub: Subscriber, frame: Union[str, bytes]) -> bool:
+        try:
+            await asyncio.wait_for(sub.queue.put(frame), self.limits.grace)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """
+        Signal the end of the stream and wait for the receivers to catch up.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for slow receivers. Default is 30.
+        """
+        for sub in self.subscribers:
+            if sub.overflow is not None:
+                await sub.overflow.finish()
+            await sub.queue.put(None)
+        tasks = [sub.task for sub in self.subscribers if sub.task is not None]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        for sub in self.subscribers:
+            try:
+                await asyncio.wait_for(sub.ws.wait_closed(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
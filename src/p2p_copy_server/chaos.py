@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Optional, Sequence, Tuple, Union
+
+from websockets.asyncio.server import ServerConnection
+
+from p2p_copy.events import EventLog, NO_EVENTS
+
+Frame = Union[str, bytes]
+
+DIRECTIONS = ("to_receiver", "to_sender")
+_UNITS = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30}
+
+
+class FaultKind(str, Enum):
+    """
+    drop: abort both connections, like a lost TCP connection.
+    truncate: forward only the start of the frame, then abort both connections.
+    pause: forward nothing in this direction for a while, then continue.
+    corrupt: flip a byte of the next data frame and forward it, the connections stay up.
+    """
+    drop = "drop"
+    truncate = "truncate"
+    pause = "pause"
+    corrupt = "corrupt"
+
+
+def _parse_size(value: str) -> int:
+    value = value.strip().lower().removesuffix("ib").removesuffix("b")
+    unit = value[-1:] if value[-1:] in _UNITS else ""
+    number = float(value[:len(value) - len(unit)])
+    if number < 0:
+        raise ValueError(value)
+    return int(number * _UNITS[unit])
+
+
+@dataclass(frozen=True)
+class Fault:
+    """
+    One fault, injected into one direction of a pair.
+
+    Parameters
+    ----------
+    kind : FaultKind
+        What happens.
+    after_bytes : int
+        Payload bytes forwarded in the direction before the fault hits; the
+        frame that crosses this offset is the one affected.
+    direction : str, optional
+        'to_receiver' or 'to_sender'. Default is 'to_receiver'.
+    seconds : float, optional
+        Length of a pause. Default is 1.
+    """
+    kind: FaultKind
+    after_bytes: int
+    direction: str = "to_receiver"
+    seconds: float = 1.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Fault":
+        """
+        Read a fault written as KIND@BYTES[:SECONDS][:to-sender].
+
+        Sizes accept K, M and G suffixes (binary), e.g. 'drop@4M',
+        'truncate@100K' or 'pause@1M:3s'.
+
+        Raises
+        ------
+        ValueError
+            If the spec is malformed.
+        """
+        kind, at, rest = spec.strip().partition("@")
+        if not at:
+            raise ValueError(f"bad fault {spec!r}, expected KIND@BYTES")
+        size, *options = rest.split(":")
+        try:
+            fault = cls(FaultKind(kind.strip().lower()), _parse_size(size))
+        except ValueError:
+            raise ValueError(f"bad fault {spec!r}") from None
+        for option in (o.strip().lower() for o in options):
+            if option.replace("-", "_") in DIRECTIONS:
+                fault = Fault(fault.kind, fault.after_bytes, option.replace("-", "_"), fault.seconds)
+                continue
+            try:
+                seconds = float(option.removesuffix("s"))
+            except ValueError:
+                raise ValueError(f"bad fault option {option!r} in {spec!r}") from None
+            fault = Fault(fault.kind, fault.after_bytes, fault.direction, seconds)
+        return fault
+
+
+@dataclass(frozen=True)
+class ChaosPlan:
+    """
+    Faults the relay injects into sender/receiver pairs, for measuring how
+    clients recover; never use it in production.
+
+    The schedule is deterministic: the n-th pair the relay forwards gets the
+    n-th entry of faults, so a test can break the first attempt of a transfer
+    and let the resumed one through.
+
+    Parameters
+    ----------
+    faults : Sequence[Fault or None]
+        Fault per pair in pairing order; None leaves a pair alone.
+    repeat : bool, optional
+        Start over at the first entry after the last one; otherwise later
+        pairs are left alone. Default is False.
+    """
+    faults: Tuple[Optional[Fault], ...] = ()
+    repeat: bool = False
+
+    def fault_for(self, index: int) -> Optional[Fault]:
+        """
+        Fault of the pair with this 0-based index.
+        """
+        if not self.faults or (index >= len(self.faults) and not self.repeat):
+            return None
+        return self.faults[index % len(self.faults)]
+
+    @classmethod
+    def seeded(cls, seed: int, pairs: int, max_bytes: int,
+               kinds: Sequence[FaultKind] = tuple(FaultKind), pause: float = 1.0) -> "ChaosPlan":
+        """
+        A random schedule that is the same for the same arguments.
+
+        Parameters
+        ----------
+        seed : int
+            Seed of the schedule.
+        pairs : int
+            Number of pairs with a fault.
+        max_bytes : int
+            Faults hit at a random offset below this, in the sender's direction.
+        kinds : Sequence[FaultKind], optional
+            Kinds to choose from. Default is all.
+        pause : float, optional
+            Seconds of each pause. Default is 1.
+
+        Returns
+        -------
+        ChaosPlan
+        """
+        rng = random.Random(seed)
+        return cls(tuple(Fault(rng.choice(list(kinds)), rng.randrange(max(1, max_bytes)), seconds=pause)
+                         for _ in range(pairs)))
+
+    @classmethod
+    def parse(cls, spec: str) -> "ChaosPlan":
+        """
+        Read a plan from a comma-separated list of faults, or a random one.
+
+        'drop@4M,none,pause@1M:2s' gives the first pair a drop, leaves the
+        second alone and pauses the third. 'seed=7,pairs=10,max=64M' is
+        ChaosPlan.seeded(7, 10, 64 MiB). A trailing ',repeat' repeats the list.
+
+        Raises
+        ------
+        ValueError
+            If the spec is malformed.
+        """
+        items = [item.strip() for item in spec.split(",") if item.strip()]
+        repeat = "repeat" in items
+        items = [item for item in items if item != "repeat"]
+        if items and all("=" in item for item in items):
+            options = dict(item.split("=", 1) for item in items)
+            unknown = set(options) - {"seed", "pairs", "max", "pause"}
+            if unknown or "seed" not in options:
+                raise ValueError(f"bad chaos plan {spec!r}, expected seed=,pairs=,max=[,pause=]")
+            plan = cls.seeded(int(options["seed"]), int(options.get("pairs", 1)),
+                              _parse_size(options.get("max", "64M")),
+                              pause=float(options.get("pause", "1").removesuffix("s")))
+            return cls(plan.faults, repeat)
+        return cls(tuple(None if item == "none" else Fault.parse(item) for item in items), repeat)
+
+
+class FaultInjector:
+    """
+    Apply a fault to the frames of one direction of a pair.
+
+    Parameters
+    ----------
+    fault : Fault
+        The fault.
+    connections : Tuple[ServerConnection, ServerConnection]
+        Both connections of the pair; drop and truncate abort them.
+    events : EventLog, optional
+        Receives a 'fault' event when the fault hits.
+    """
+
+    def __init__(self, fault: Fault, connections: Tuple[ServerConnection, ServerConnection],
+                 events: EventLog = NO_EVENTS):
+        self.fault = fault
+        self.connections = connections
+        self.events = events
+        self.fired = False
+
+    async def forward(self, frame: Frame, offset: int, send: Callable[[Frame], Awaitable[None]]) -> None:
+        """
+        Send a frame, or the part of it the fault leaves.
+
+        Parameters
+        ----------
+        frame : str or bytes
+            The frame.
+        offset : int
+            Payload bytes forwarded before this frame.
+        send : Callable
+            Sends a frame on.
+
+        Raises
+        ------
+        ConnectionAbortedError
+            If the fault aborted the connections.
+        """
+        fault = self.fault
+        if self.fired or offset + len(frame) <= fault.after_bytes or \
+                (fault.kind == FaultKind.corrupt and isinstance(frame, str)):
+            await send(frame)
+            return
+        self.fired = True
+        self.events.emit("fault", kind=fault.kind.value, direction=fault.direction, offset=offset,
+                         after_bytes=fault.after_bytes)
+        if fault.kind == FaultKind.pause:
+            await asyncio.sleep(fault.seconds)
+            await send(frame)
+            return
+        if fault.kind == FaultKind.corrupt:
+            at = min(len(frame) - 1, max(0, fault.after_bytes - offset))
+            await send(frame[:at] + bytes([frame[at] ^ 0xFF]) + frame[at + 1:])
+            return
+        if fault.kind == FaultKind.truncate:
+            await send(frame[:max(1, fault.after_bytes - offset)])
+        # abort without a closing handshake, as a broken network would
+        for ws in self.connections:
+            ws.transport.abort()
+        raise ConnectionAbortedError(f"injected {fault.kind.value}")
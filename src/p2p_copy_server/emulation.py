@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from .scheduler import TokenBucket, mbit_to_bytes
+
+# TCP payload per packet; loss is drawn per packet, a frame is lost if any of its packets is
+MSS = 1448
+# Lower bound of the TCP retransmission timeout, as on Linux
+MIN_RTO = 0.2
+# Frames in flight per direction before the relay stops reading
+QUEUE_FRAMES = 1024
+
+Frame = Union[str, bytes]
+
+
+@dataclass(frozen=True)
+class LinkProfile:
+    """
+    Properties of one direction of an emulated network path.
+
+    The relay carries WebSocket frames over TCP, so frames are never dropped
+    or reordered: a lost packet delays its frame, and every frame behind it,
+    by a retransmission timeout, as head-of-line blocking does on a real link.
+
+    Parameters
+    ----------
+    mbit : float, optional
+        Bandwidth in Mbit/s. Default is unlimited.
+    latency : float, optional
+        One-way delay in seconds. Default is 0.
+    jitter : float, optional
+        Random variation of the delay, uniform in +/- jitter seconds. Default is 0.
+    loss : float, optional
+        Packet loss probability per MSS-sized packet. Default is 0.
+    stall_every : float, optional
+        Mean seconds between stalls, exponentially distributed. Default is no stalls.
+    stall : float, optional
+        Seconds the link forwards nothing during a stall. Default is 1.
+    """
+    mbit: Optional[float] = None
+    latency: float = 0.0
+    jitter: float = 0.0
+    loss: float = 0.0
+    stall_every: Optional[float] = None
+    stall: float = 1.0
+
+    @property
+    def rto(self) -> float:
+        """Delay added to a lost frame: the retransmission timeout of a round trip like this one."""
+        return max(MIN_RTO, 2 * self.latency + 4 * self.jitter)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LinkProfile":
+        """
+        Read a profile from a preset name or a comma-separated key=value list.
+
+        Keys are the field names, with '-' or '_'; times accept an 's' or
+        'ms' suffix. A preset may be followed by keys that override it, e.g.
+        'lte,loss=0.02' or 'mbit=20,latency=40ms,jitter=5ms'.
+
+        Parameters
+        ----------
+        spec : str
+            The profile, see PROFILES for the presets.
+
+        Returns
+        -------
+        LinkProfile
+
+        Raises
+        ------
+        ValueError
+            If a preset or key is unknown or a value is invalid.
+        """
+        profile = cls()
+        names = {f.name for f in fields(cls)}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            if "=" not in item:
+                if item not in PROFILES:
+                    raise ValueError(f"unknown network profile {item!r}, known: {', '.join(PROFILES)}")
+                profile = PROFILES[item]
+                continue
+            key, _, value = item.partition("=")
+            key = key.strip().replace("-", "_")
+            if key not in names:
+                raise ValueError(f"unknown network profile key {key!r}")
+            value = value.strip().lower()
+            try:
+                if value.endswith("ms"):
+                    number = float(value[:-2]) / 1000
+                else:
+                    number = float(value[:-1] if value.endswith("s") else value)
+            except ValueError:
+                raise ValueError(f"bad value for {key}: {value!r}") from None
+            if number < 0 or (key == "loss" and number >= 1):
+                raise ValueError(f"bad value for {key}: {value!r}")
+            profile = replace(profile, **{key: number})
+        return profile
+
+
+# Presets for --emulate; latencies are one way, i.e. half the round trip
+PROFILES: Dict[str, LinkProfile] = {
+    "lan": LinkProfile(mbit=1000, latency=0.00025),
+    "broadband": LinkProfile(mbit=50, latency=0.01, jitter=0.002),
+    "dsl": LinkProfile(mbit=8, latency=0.02, jitter=0.005),
+    "lte": LinkProfile(mbit=20, latency=0.035, jitter=0.015, loss=0.001),
+    "wan": LinkProfile(mbit=100, latency=0.04, jitter=0.005, loss=0.0001),
+    "satellite": LinkProfile(mbit=10, latency=0.3, jitter=0.03, loss=0.005),
+    "flaky": LinkProfile(mbit=5, latency=0.05, jitter=0.02, loss=0.01, stall_every=20.0, stall=2.0),
+}
+
+
+@dataclass(frozen=True)
+class NetworkEmulation:
+    """
+    Network conditions the relay applies to every sender/receiver pair.
+
+    For benchmarking on realistic links locally; the relay should not
+    emulate anything in production. Each direction of a pair gets its own
+    link, with random numbers seeded from the seed and the code hash, so a
+    run can be repeated.
+
+    Parameters
+    ----------
+    to_receiver : LinkProfile, optional
+        Path of the sender's frames to the receiver. Default is unchanged.
+    to_sender : LinkProfile, optional
+        Path of the receiver's replies to the sender. Default is unchanged.
+    seed : int, optional
+        Seed of jitter, loss and stalls. Default is 0.
+    """
+    to_receiver: Optional[LinkProfile] = None
+    to_sender: Optional[LinkProfile] = None
+    seed: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.to_receiver is not None or self.to_sender is not None
+
+    def links(self, pair_id: str, send_to_receiver: Callable[[Frame], Awaitable[None]],
+              send_to_sender: Callable[[Frame], Awaitable[None]]
+              ) -> Tuple[Optional["EmulatedLink"], Optional["EmulatedLink"]]:
+        """
+        Create the links of one pair.
+
+        Returns
+        -------
+        Tuple[EmulatedLink, EmulatedLink]
+            The link to the receiver and the link to the sender, None for a
+            direction without a profile.
+        """
+        return tuple(
+            EmulatedLink(profile, send, random.Random(f"{self.seed}:{pair_id}:{direction}"))
+            if profile is not None else None
+            for direction, profile, send in (("to_receiver", self.to_receiver, send_to_receiver),
+                                             ("to_sender", self.to_sender, send_to_sender))
+        )
+
+
+class EmulatedLink:
+    """
+    Forward frames through a bandwidth limit and a delay line.
+
+    send() waits for the frame's serialization time at the link's bandwidth,
+    which slows the reading side down like a full TCP window, and queues the
+    frame with its delivery time. A delivery task sends queued frames in
+    order once they are due, so frames in flight overlap like packets on a
+    long link.
+
+    Parameters
+    ----------
+    profile : LinkProfile
+        Bandwidth, delay, loss and stalls of the link.
+    deliver : Callable
+        Sends a frame on to the peer, e.g. ServerConnection.send.
+    rng : random.Random, optional
+        Source of jitter, loss and stalls. Default is an unseeded Random.
+    """
+
+    def __init__(self, profile: LinkProfile, deliver: Callable[[Frame], Awaitable[None]],
+                 rng: Optional[random.Random] = None):
+        self.profile = profile
+        self.rng = rng or random.Random()
+        self.bucket = TokenBucket(mbit_to_bytes(profile.mbit), burst=max(MSS, mbit_to_bytes(profile.mbit) / 100)) \
+            if profile.mbit else None
+        self.lost = 0
+        self.stalls = 0
+        self._deliver = deliver
+        self._queue: asyncio.Queue = asyncio.Queue(QUEUE_FRAMES)
+        self._last_due = 0.0
+        self._blocked_until = 0.0
+        self._next_stall = time.monotonic() + self._stall_gap()
+        self._broken = False
+        self._aborted = False
+        self._task = asyncio.create_task(self._deliver_due())
+
+    def _stall_gap(self) -> float:
+        every = self.profile.stall_every
+        return self.rng.expovariate(1 / every) if every else math.inf
+
+    def _lost(self, size: int) -> bool:
+        if not self.profile.loss:
+            return False
+        packets = max(1, math.ceil(size / MSS))
+        return self.rng.random() < 1 - (1 - self.profile.loss) ** packets
+
+    async def send(self, frame: Frame) -> None:
+        """
+        Put a frame on the link.
+
+        Raises
+        ------
+        ConnectionError
+            If delivering an earlier frame failed.
+        """
+        if self._broken:
+            raise ConnectionError("emulated link closed")
+        if self.bucket is not None and (delay := self.bucket.reserve(len(frame))) > 0:
+            await asyncio.sleep(delay)
+        now = time.monotonic()
+        if now >= self._next_stall:
+            self.stalls += 1
+            self._blocked_until = now + self.profile.stall
+            self._next_stall = self._blocked_until + self._stall_gap()
+        if self._blocked_until > now:
+            await asyncio.sleep(self._blocked_until - now)
+            now = time.monotonic()
+        p = self.profile
+        due = now + max(0.0, p.latency + (self.rng.uniform(-p.jitter, p.jitter) if p.jitter else 0.0))
+        if self._lost(len(frame)):
+            self.lost += 1
+            due += p.rto
+        # TCP delivers in order: a delayed frame holds back the frames behind it
+        self._last_due = max(due, self._last_due)
+        await self._queue.put((self._last_due, frame))
+
+    async def _deliver_due(self) -> None:
+        while (item := await self._queue.get()) is not None:
+            if self._broken:
+                continue  # discard, so that send() never waits on a full queue
+            due, frame = item
+            # a stall also holds back frames that were already in flight
+            if (wait := max(due, self._blocked_until) - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self._deliver(frame)
+            except Exception:
+                self._broken = True
+
+    async def close(self) -> None:
+        """
+        Deliver the frames in flight, then stop.
+        """
+        if not self._task.done() and not self._aborted:
+            await self._queue.put(None)
+            await self._task
+
+    def abort(self) -> None:
+        """
+        Drop the frames in flight and stop.
+        """
+        self._aborted = True
+        self._task.cancel()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import itertools
+from typing import Dict, Optional
+
+from websockets.asyncio.server import ServerConnection
+
+from p2p_copy.protocol import gather_join
+
+
+class GatherSession:
+    """
+    Many senders and one collecting receiver sharing a code hash.
+
+    Senders wait here until the collector is connected. Each sender is announced
+    on the collector's control connection with a stream number; the collector
+    then opens one connection per stream, which is paired with that sender.
+    """
+
+    def __init__(self):
+        self.collector: Optional[ServerConnection] = None
+        self.pending: Dict[int, ServerConnection] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def empty(self) -> bool:
+        return self.collector is None and not self.pending
+
+    async def _announce(self, stream: int) -> None:
+        try:
+            await self.collector.send(gather_join(stream))
+        except Exception:
+            pass  # the collector is gone; the sender keeps waiting for the next one
+
+    async def add_sender(self, ws: ServerConnection) -> int:
+        """
+        Register a sender and announce it if a collector is connected.
+
+        Parameters
+        ----------
+        ws : ServerConnection
+            The sender connection.
+
+        Returns
+        -------
+        int
+            The stream number of the sender.
+        """
+        stream = next(self._ids)
+        self.pending[stream] = ws
+        if self.collector is not None:
+            await self._announce(stream)
+        return stream
+
+    async def set_collector(self, ws: ServerConnection) -> bool:
+        """
+        Register the collecting receiver and announce all waiting senders.
+
+        Parameters
+        ----------
+        ws : ServerConnection
+            The collector's control connection.
+
+        Returns
+        -------
+        bool
+            False if the session already has a collector.
+        """
+        if self.collector is not None:
+            return False
+        self.collector = ws
+        for stream in list(self.pending):
+            await self._announce(stream)
+        return True
+
+    def claim(self, stream: int) -> Optional[ServerConnection]:
+        """
+        Remove and return the waiting sender of a stream.
+
+        Parameters
+        ----------
+        stream : int
+            Stream number from a gather_join announcement.
+
+        Returns
+        -------
+        ServerConnection or None
+            The sender, or None if the stream is unknown or already claimed.
+        """
+        return self.pending.pop(stream, None)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from websockets.asyncio.server import ServerConnection
+
+
+@dataclass(frozen=True)
+class PairingLimits:
+    """
+    Limits for clients waiting in the relay for their peer.
+
+    Parameters
+    ----------
+    wait_timeout : float, optional
+        Seconds a client may wait for its peer before it is disconnected.
+        Default is None (wait until the client disconnects).
+    max_waiting : int, optional
+        Maximum number of clients waiting at the same time. Further clients
+        are rejected. Default is None (unlimited).
+    ping_interval : float, optional
+        Seconds between keepalive pings; connections that do not answer within
+        the same time are reaped. None disables pings. Default is 20.
+    shards : int, optional
+        Number of independently locked partitions of the waiting room. Default is 64.
+    reconnect_grace : float, optional
+        Seconds the code of a broken reconnectable session is kept for its two
+        clients, and the longest a reconnecting client waits for its peer.
+        Default is 60.
+    """
+    wait_timeout: Optional[float] = None
+    max_waiting: Optional[int] = None
+    ping_interval: Optional[float] = 20.0
+    shards: int = 64
+    reconnect_grace: float = 60.0
+
+
+class WaitingRoom:
+    """
+    Clients waiting for their peer, partitioned by code hash.
+
+    Each shard has its own dict and lock, so hellos for different codes do not
+    contend for a single global lock.
+
+    Parameters
+    ----------
+    shards : int, optional
+        Number of partitions. Default is 64.
+    max_waiting : int, optional
+        Maximum number of waiting clients over all shards. Default is unlimited.
+    """
+
+    def __init__(self, shards: int = 64, max_waiting: Optional[int] = None):
+        self._shards: List[Tuple[Dict[str, Tuple[str, ServerConnection]], asyncio.Lock]] = [
+            ({}, asyncio.Lock()) for _ in range(max(1, shards))
+        ]
+        self.max_waiting = max_waiting
+        self.size = 0
+
+    def _shard(self, code_hash: str) -> Tuple[Dict[str, Tuple[str, ServerConnection]], asyncio.Lock]:
+        return self._shards[hash(code_hash) % len(self._shards)]
+
+    async def join(self, code_hash: str, role: str, ws: ServerConnection) -> Tuple[str, Optional[ServerConnection]]:
+        """
+        Pair a client with a waiting peer or let it wait.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash from the hello.
+        role : str
+            'sender' or 'receiver'.
+        ws : ServerConnection
+            The client connection.
+
+        Returns
+        -------
+        Tuple[str, Optional[ServerConnection]]
+            ("paired", peer), ("waiting", None), ("duplicate", peer) if the
+            waiting client has the same role, or ("full", None).
+        """
+        waiting, lock = self._shard(code_hash)
+        async with lock:
+            if code_hash in waiting:
+                other_role, peer = waiting.pop(code_hash)
+                self.size -= 1
+                return ("duplicate" if other_role == role else "paired"), peer
+            if self.max_waiting is not None and self.size >= self.max_waiting:
+                return "full", None
+            waiting[code_hash] = (role, ws)
+            self.size += 1
+            return "waiting", None
+
+    async def take(self, code_hash: str, role: str) -> Optional[ServerConnection]:
+        """
+        Remove and return the client waiting for a code hash if it has the given role.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash.
+        role : str
+            Required role of the waiting client.
+
+        Returns
+        -------
+        ServerConnection or None
+            The waiting client, or None if there is none with that role.
+        """
+        waiting, lock = self._shard(code_hash)
+        async with lock:
+            if waiting.get(code_hash, (None, None))[0] == role:
+                self.size -= 1
+                return waiting.pop(code_hash)[1]
+            return None
+
+    async def leave(self, code_hash: str, ws: ServerConnection) -> bool:
+        """
+        Remove a client from the waiting room if it is still waiting.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash the client waits for.
+        ws : ServerConnection
+            The client connection.
+
+        Returns
+        -------
+        bool
+            True if the client was still waiting and has been removed.
+        """
+        waiting, lock = self._shard(code_hash)
+        async with lock:
+            if waiting.get(code_hash, (None, None))[1] is ws:
+                waiting.pop(code_hash)
+                self.size -= 1
+                return True
+            return False
+
+    async def wait(self, code_hash: str, ws: ServerConnection, timeout: Optional[float]) -> bool:
+        """
+        Wait until the client connection closes.
+
+        A paired client keeps its connection until the transfer ends; an unpaired
+        client is removed once the timeout expires.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash the client waits for.
+        ws : ServerConnection
+            The client connection.
+        timeout : float, optional
+            Seconds to wait for a peer. None waits without limit.
+
+        Returns
+        -------
+        bool
+            False if the client expired without being paired, True otherwise.
+        """
+        if timeout is not None:
+            try:
+                await asyncio.wait_for(ws.wait_closed(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                if await self.leave(code_hash, ws):
+                    return False
+        await ws.wait_closed()
+        return True
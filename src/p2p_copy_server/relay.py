@@ -2,15 +2,76 @@ from __future__ import annotations
 
 import asyncio
 import json
-import ssl
-from typing import Dict, Tuple, Optional
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
 
 from websockets.asyncio.server import serve, ServerConnection
 
-from p2p_copy.protocol import READY
+from p2p_copy.events import EventLog, NO_EVENTS
+from p2p_copy.io_utils import MAX_FRAME
+from p2p_copy.protocol import SPOOLED, loads, ready
+from p2p_copy.tracing import Tracer, NO_TRACER, SERVER
+from p2p_copy.watchdog import LoopWatchdog
+from .broadcast import BroadcastLimits, BroadcastGroup, SlowReceiverPolicy
+from .chaos import ChaosPlan, FaultInjector
+from .emulation import EmulatedLink, NetworkEmulation
+from .gather import GatherSession
+from .pairing import PairingLimits, WaitingRoom
+from .scheduler import RateLimits, BandwidthScheduler, remote_ip
+from .tls import TlsOptions, server_context
+from .spool import SpoolLimits, SpoolStore, SpoolQuotaExceeded, valid_code_hash
 
-WAITING: Dict[str, Tuple[str, ServerConnection]] = {}  # code_hash -> (role, ws)
-LOCK = asyncio.Lock()
+
+@dataclass
+class RelayContext:
+    """
+    State shared by all connections of one relay instance.
+    """
+    room: WaitingRoom
+    pairing: PairingLimits
+    scheduler: Optional[BandwidthScheduler] = None
+    spools: Optional[SpoolStore] = None
+    broadcast: BroadcastLimits = field(default_factory=BroadcastLimits)
+    groups: Dict[str, BroadcastGroup] = field(default_factory=dict)
+    gathers: Dict[str, GatherSession] = field(default_factory=dict)
+    events: EventLog = NO_EVENTS
+    tracer: Tracer = NO_TRACER
+    emulation: Optional[NetworkEmulation] = None
+    chaos: Optional[ChaosPlan] = None
+    # largest message accepted from clients
+    max_frame: int = MAX_FRAME
+    # largest message receivers accept, from their hello
+    frame_limits: "weakref.WeakKeyDictionary[ServerConnection, int]" = field(
+        default_factory=weakref.WeakKeyDictionary)
+    # version of the capability exchange receivers speak, from their hello
+    caps_versions: "weakref.WeakKeyDictionary[ServerConnection, int]" = field(
+        default_factory=weakref.WeakKeyDictionary)
+    # pairs forwarded so far, the position in the chaos schedule
+    pairs: int = 0
+    # traceparent and hello time of traced senders, until they are paired
+    traces: "weakref.WeakKeyDictionary[ServerConnection, Tuple[str, int]]" = field(
+        default_factory=weakref.WeakKeyDictionary)
+    # session id of senders that can reconnect
+    session_ids: "weakref.WeakKeyDictionary[ServerConnection, str]" = field(
+        default_factory=weakref.WeakKeyDictionary)
+    # code hash -> session id and expiry of broken sessions
+    sessions: Dict[str, Tuple[str, float]] = field(default_factory=dict)
+
+
+def _pair_label(pair_id: str) -> str:
+    """Shorten a code hash for logs; the full hash would let log readers pair with the transfer."""
+    code_hash, _, stream = pair_id.partition(":")
+    return code_hash[:12] + (f":{stream}" if stream else "")
+
+
+def _expire_sessions(ctx: RelayContext) -> None:
+    """Forget broken sessions past their grace period, also of codes that never connect again."""
+    now = time.monotonic()
+    for code_hash in [c for c, (_, expiry) in ctx.sessions.items() if expiry < now]:
+        del ctx.sessions[code_hash]
+        ctx.events.emit("session_expired", pair=_pair_label(code_hash))
 
 
 def use_production_logger():
@@ -40,24 +101,319 @@ def use_production_logger():
     relay_logger.setLevel(logging.INFO)
 
 
-async def _pipe(a: ServerConnection, b: ServerConnection) -> None:
+async def _pipe(a: ServerConnection, b: ServerConnection,
+                scheduler: Optional[BandwidthScheduler] = None, pair_id: str = "",
+                link: Optional[EmulatedLink] = None, injector: Optional[FaultInjector] = None) -> int:
     """
-    Pipe data bidirectionally between two WebSocket connections until one closes.
+    Pipe data from one WebSocket connection to another until one closes.
+
+    If a scheduler is given, every frame waits for its bandwidth budget before it is forwarded.
+    If an emulated link is given, frames go through it instead of straight to b; the frames
+    in flight are delivered before b is closed. An injector may pause, cut or drop the stream.
+    Returns the number of payload bytes forwarded.
     """
 
+    src_ip = remote_ip(a)
+    forwarded = 0
     try:
         async for frame in a:
-            await b.send(frame)
+            if scheduler is not None:
+                await scheduler.throttle(pair_id, src_ip, len(frame))
+            send = link.send if link is not None else b.send
+            await (injector.forward(frame, forwarded, send) if injector is not None else send(frame))
+            forwarded += len(frame)
+    except asyncio.CancelledError:
+        if link is not None:
+            link.abort()
+        raise
     except Exception:
         pass
     finally:
+        if link is not None:
+            await link.close()
         try:
             await b.close()
         except Exception:
             pass
+    return forwarded
+
+
+async def _frames_too_large(receiver: ServerConnection, code_hash: str, ctx: RelayContext) -> bool:
+    """
+    Turn away a receiver whose frame limit is below that of spooled uploads.
+
+    Uploads are stored before any receiver is known, in frames of the default
+    size, and replayed unchanged.
+    """
+
+    needed = min(ctx.max_frame, MAX_FRAME)
+    if ctx.frame_limits.get(receiver, MAX_FRAME) >= needed:
+        return False
+    ctx.events.emit("rejected", pair=_pair_label(code_hash), role="receiver", reason="frame size")
+    await receiver.close(code=1009, reason=f"Spooled upload needs max_frame of at least {needed} bytes")
+    return True
+
+
+async def _spool_upload(ws: ServerConnection, code_hash: str, ctx: RelayContext) -> None:
+    """
+    Store a sender's frame stream in the spool, independent of any receiver.
+
+    A receiver that is already waiting reads along while the upload is written.
+    The sender gets a 'spooled' message once its 'eof' is on disk.
+    """
+
+    store = ctx.spools
+    if store is None:
+        await ws.close(code=1013, reason="Spool not enabled on relay")
+        return
+    if not valid_code_hash(code_hash):
+        await ws.close(code=1002, reason="Bad hello")
+        return
+
+    spool = store.create(code_hash)
+    if (waiting_receiver := await ctx.room.take(code_hash, "receiver")) is not None:
+        if await _frames_too_large(waiting_receiver, code_hash, ctx):
+            waiting_receiver = None
+        else:
+            store.start_replay(code_hash, spool, waiting_receiver)
+    events = ctx.events.bind(pair=_pair_label(code_hash))
+    events.emit("spool_upload_start", reader_waiting=waiting_receiver is not None)
+    started, stored = time.monotonic(), 0
+
+    try:
+        await ws.send(ready(min(ctx.max_frame, MAX_FRAME)))  # replayed to receivers with the default limit
+        async for frame in ws:
+            store.check_quota(spool, len(frame))
+            await spool.append(frame)
+            stored += len(frame)
+            if isinstance(frame, str) and loads(frame).get("type") == "eof":
+                await spool.finish()
+                await ws.send(SPOOLED)
+                break
+    except SpoolQuotaExceeded as e:
+        events.emit("rejected", role="sender", reason="quota", detail=str(e))
+        await ws.close(code=1009, reason=str(e))
+    except Exception:
+        pass
+    finally:
+        if not spool.complete:
+            store.remove(code_hash, spool)
+        events.emit("spool_upload_end", bytes=stored, complete=spool.complete,
+                    seconds=round(time.monotonic() - started, 3))
+
+
+async def _spool_replay(ws: ServerConnection, code_hash: str, ctx: RelayContext) -> bool:
+    """
+    Replay a spooled upload to a receiver, if there is one for its code hash.
+
+    Returns
+    -------
+    bool
+        True if the receiver has been served from the spool.
+    """
+
+    if ctx.spools is None or (spool := ctx.spools.get(code_hash)) is None:
+        return False
+    if await _frames_too_large(ws, code_hash, ctx):
+        return True
+    ctx.events.emit("spool_replay", pair=_pair_label(code_hash), complete=spool.complete)
+    await ctx.spools.replay_to(code_hash, spool, ws)
+    # give the receiver time to process the stream and close the connection itself
+    await asyncio.wait([asyncio.create_task(ws.wait_closed())], timeout=30)
+    return True
+
+
+async def _broadcast(ws: ServerConnection, code_hash: str, role: str, hello: dict, ctx: RelayContext) -> None:
+    """
+    Join a one-to-many broadcast: the sender's frames are fanned out to all receivers.
+
+    The sender gets READY once the number of receivers it asked for has joined.
+    Frames from receivers are discarded.
+    """
+
+    group = ctx.groups.get(code_hash)
+    if group is None:
+        spool_dir = ctx.spools.directory if ctx.spools is not None else None
+        group = ctx.groups[code_hash] = BroadcastGroup(ctx.broadcast, spool_dir)
+
+    if role == "receiver":
+        sub = group.add_receiver(ws)
+        if sub is None:
+            await ws.close(code=1013, reason="Broadcast full or already started")
+            return
+        try:
+            async for _ in ws:
+                pass  # receivers only listen
+        except Exception:
+            pass
+        finally:
+            group.remove_receiver(sub)
+            if group.empty and ctx.groups.get(code_hash) is group:
+                del ctx.groups[code_hash]
+        return
+
+    if group.sender is not None:
+        await ws.close(code=1013, reason="Duplicate role for code")
+        return
+    receivers = hello.get("receivers")
+    if not isinstance(receivers, int) or receivers < 1:
+        await ws.close(code=1002, reason="Bad hello")
+        return
+    group.sender = ws
+    group.expected = receivers
+    scheduler = ctx.scheduler
+    src_ip = remote_ip(ws)
+    events = ctx.events.bind(pair=_pair_label(code_hash))
+    published = 0
+    try:
+        started = await group.wait_ready(ctx.pairing.wait_timeout)
+        # the code is free for a new broadcast once this one has started or expired
+        if ctx.groups.get(code_hash) is group:
+            del ctx.groups[code_hash]
+        if not started:
+            events.emit("rejected", role=role, reason="timeout", receivers=len(group.subscribers))
+            await ws.close(code=1013, reason="No peer within timeout")
+            for sub in group.subscribers:
+                await sub.ws.close(code=1013, reason="No peer within timeout")
+            return
+        if scheduler is not None:
+            scheduler.open_pair(code_hash, (src_ip,))
+        await ws.send(ready(min(ctx.max_frame, MAX_FRAME)))
+        events.emit("broadcast_start", receivers=receivers)
+        async for frame in ws:
+            if scheduler is not None:
+                await scheduler.throttle(code_hash, src_ip, len(frame))
+            published += len(frame)
+            if not await group.publish(frame):
+                await ws.close(code=1011, reason="All receivers left")
+                break
+    except Exception:
+        pass
+    finally:
+        group.sender = None
+        if group.started:
+            events.emit("broadcast_end", bytes=published, receivers=len(group.subscribers))
+            await group.close()
+            if scheduler is not None:
+                scheduler.close_pair(code_hash, (src_ip,))
+
+
+async def _relay_pair(ws: ServerConnection, peer: ServerConnection, role: str,
+                      pair_id: str, ctx: RelayContext) -> None:
+    """
+    Pipe data between a paired sender and receiver in both directions until one side finishes.
+    """
+
+    # Inform sender that pipe is ready, of the largest frame the path carries and whether
+    # the receiver exchanges capabilities, before any frame the receiver sent while waiting
+    sender, receiver = (ws, peer) if role == "sender" else (peer, ws)
+    await sender.send(ready(min(ctx.max_frame, ctx.frame_limits.get(receiver, MAX_FRAME)),
+                            ctx.caps_versions.get(receiver, 0)))
+
+    # Start bi-directional piping
+    scheduler = ctx.scheduler
+    ips = (remote_ip(ws), remote_ip(peer))
+    if scheduler is not None:
+        scheduler.open_pair(pair_id, ips)
+    events = ctx.events.bind(pair=_pair_label(pair_id))
+    events.emit("paired")
+    started = time.monotonic()
+    traceparent, hello_ns = ctx.traces.pop(ws if role == "sender" else peer, (None, 0))
+    tracer = ctx.tracer if traceparent else NO_TRACER
+    tracer.start("relay_wait", kind=SERVER, traceparent=traceparent, start_ns=hello_ns,
+                 pair=_pair_label(pair_id)).end()
+    pair_span = tracer.start("relay_pair", kind=SERVER, traceparent=traceparent, pair=_pair_label(pair_id))
+    to_peer = to_ws = None
+    if ctx.emulation is not None:
+        to_receiver, to_sender = ctx.emulation.links(pair_id, receiver.send, sender.send)
+        to_peer, to_ws = (to_receiver, to_sender) if role == "sender" else (to_sender, to_receiver)
+    inject_peer = inject_ws = None
+    fault = ctx.chaos.fault_for(ctx.pairs) if ctx.chaos is not None else None
+    ctx.pairs += 1
+    if fault is not None:
+        injector = FaultInjector(fault, (ws, peer), events)
+        towards_receiver = (fault.direction == "to_receiver") == (role == "sender")
+        inject_peer, inject_ws = (injector, None) if towards_receiver else (None, injector)
+    session = ctx.session_ids.get(sender)
+    ctx.sessions.pop(pair_id, None)
+    _expire_sessions(ctx)
+    t1 = asyncio.create_task(_pipe(ws, peer, scheduler, pair_id, to_peer, inject_peer))
+    t2 = asyncio.create_task(_pipe(peer, ws, scheduler, pair_id, to_ws, inject_ws))
+
+    # wait for one side to finish
+    done, pending = await asyncio.wait({t1, t2}, return_when=asyncio.FIRST_COMPLETED)
+
+    # give the slower side up to 1 second to finish
+    sleep_task = asyncio.create_task(asyncio.sleep(1.0))
+    done2, pending2 = await asyncio.wait(pending | {sleep_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    # cancel whatever is still pending (excluding the sleep_task)
+    for t in pending2:
+        if t is not sleep_task:
+            t.cancel()
 
+    if scheduler is not None:
+        scheduler.close_pair(pair_id, ips)
+    # both clients close normally at the end of a transfer; otherwise keep the code for the session
+    broken = any(c.close_code != 1000 for c in (ws, peer))
+    if session and broken:
+        ctx.sessions[pair_id] = (session, time.monotonic() + ctx.pairing.reconnect_grace)
+    from_ws, from_peer = (t.result() if t.done() and not t.cancelled() else None for t in (t1, t2))
+    from_sender, from_receiver = (from_ws, from_peer) if role == "sender" else (from_peer, from_ws)
+    events.emit("pair_end", seconds=round(time.monotonic() - started, 3),
+                bytes_from_sender=from_sender, bytes_from_receiver=from_receiver,
+                **({"session_kept": True} if session and broken else {}))
+    pair_span.end(bytes_from_sender=from_sender, bytes_from_receiver=from_receiver)
+    tracer.flush()
 
-async def _handle(ws: ServerConnection) -> None:
+
+async def _gather(ws: ServerConnection, code_hash: str, role: str, hello: dict, ctx: RelayContext) -> None:
+    """
+    Join a many-to-one gather session.
+
+    Senders wait until the collecting receiver announces them; the collector then
+    opens one connection per sender stream, which is piped like a normal pair.
+    """
+
+    session = ctx.gathers.get(code_hash)
+    if session is None:
+        session = ctx.gathers[code_hash] = GatherSession()
+
+    try:
+        if role == "sender":
+            stream = await session.add_sender(ws)
+            try:
+                await asyncio.wait_for(ws.wait_closed(), ctx.pairing.wait_timeout)
+            except asyncio.TimeoutError:
+                if session.claim(stream) is not None:
+                    await ws.close(code=1013, reason="No peer within timeout")
+                else:
+                    await ws.wait_closed()  # paired in the meantime
+            finally:
+                session.claim(stream)
+
+        elif hello.get("stream"):
+            stream = hello["stream"]
+            sender = session.claim(stream) if isinstance(stream, int) else None
+            if sender is None:
+                await ws.close(code=1013, reason="Unknown gather stream")
+                return
+            await _relay_pair(ws, sender, role, f"{code_hash}:{stream}", ctx)
+
+        else:
+            if not await session.set_collector(ws):
+                await ws.close(code=1013, reason="Duplicate role for code")
+                return
+            try:
+                await ws.wait_closed()
+            finally:
+                session.collector = None
+    finally:
+        if session.empty and ctx.gathers.get(code_hash) is session:
+            del ctx.gathers[code_hash]
+
+
+async def _handle(ws: ServerConnection, ctx: RelayContext) -> None:
     """
     Handle a single WebSocket connection: validate hello, pair with peer, and pipe data.
     """
@@ -67,6 +423,7 @@ async def _handle(ws: ServerConnection) -> None:
         raw = await ws.recv()
     except Exception:
         return
+    hello_ns = time.time_ns()
     if not isinstance(raw, str):
         await ws.close(code=1002, reason="First frame must be hello text")
         return
@@ -81,56 +438,86 @@ async def _handle(ws: ServerConnection) -> None:
     code_hash = hello.get("code_hash_hex")
     role = hello.get("role")
     if not code_hash or role not in {"sender", "receiver"}:
+        ctx.events.emit("rejected", reason="bad hello")
         await ws.close(code=1002, reason="Bad hello")
         return
+    if role == "sender" and isinstance(hello.get("traceparent"), str):
+        ctx.traces[ws] = (hello["traceparent"], hello_ns)
+    session = hello.get("session") if isinstance(hello.get("session"), str) else ""
+    if role == "sender" and session:
+        ctx.session_ids[ws] = session
+    if role == "receiver" and isinstance(hello.get("max_frame"), int) and hello["max_frame"] > 0:
+        ctx.frame_limits[ws] = hello["max_frame"]
+    if role == "receiver" and isinstance(hello.get("caps"), int) and hello["caps"] > 0:
+        ctx.caps_versions[ws] = hello["caps"]
+
+    # Store-and-forward: spooled uploads bypass pairing
+    if role == "sender" and hello.get("spool"):
+        await _spool_upload(ws, code_hash, ctx)
+        return
+    if role == "receiver" and await _spool_replay(ws, code_hash, ctx):
+        return
+    if hello.get("broadcast"):
+        await _broadcast(ws, code_hash, role, hello, ctx)
+        return
+    if hello.get("gather"):
+        await _gather(ws, code_hash, role, hello, ctx)
+        return
+
+    # A broken session keeps its code until the grace period ends
+    if (kept := ctx.sessions.get(code_hash)) is not None:
+        if kept[1] < time.monotonic():
+            del ctx.sessions[code_hash]
+        elif kept[0] != session:
+            ctx.events.emit("rejected", pair=_pair_label(code_hash), role=role, reason="session")
+            await ws.close(code=1013, reason="Session in progress")
+            return
 
     # 2) Pair by code_hash (exactly one sender + one receiver)
-    peer: Optional[ServerConnection] = None
-    async with LOCK:
-        if code_hash in WAITING:
-            other_role, peer = WAITING.pop(code_hash)
-            if other_role == role:
-                # two senders or two receivers — reject both
-                await peer.close(code=1013, reason="Duplicate role for code")
-                await ws.close(code=1013, reason="Duplicate role for code")
-                return
-        else:
-            WAITING[code_hash] = (role, ws)
+    status, peer = await ctx.room.join(code_hash, role, ws)
+    if status in ("duplicate", "full"):
+        ctx.events.emit("rejected", pair=_pair_label(code_hash), role=role, reason=status)
+    if status == "duplicate":
+        # two senders or two receivers — reject both
+        await peer.close(code=1013, reason="Duplicate role for code")
+        await ws.close(code=1013, reason="Duplicate role for code")
+        return
+    if status == "full":
+        await ws.close(code=1013, reason="Waiting room full")
+        return
 
     if peer is None:
         # wait until paired; then this handler exits when ws closes
+        timeout = ctx.pairing.wait_timeout
+        if session and hello.get("reconnect"):
+            timeout = min(timeout or ctx.pairing.reconnect_grace, ctx.pairing.reconnect_grace)
         try:
-            await ws.wait_closed()
+            if not await ctx.room.wait(code_hash, ws, timeout):
+                ctx.events.emit("rejected", pair=_pair_label(code_hash), role=role, reason="timeout")
+                await ws.close(code=1013, reason="No peer within timeout")
         finally:
-            async with LOCK:
-                if WAITING.get(code_hash, (None, None))[1] is ws:
-                    WAITING.pop(code_hash, None)
+            await ctx.room.leave(code_hash, ws)
         return
 
-    # 3) Start bi-directional piping
-    t1 = asyncio.create_task(_pipe(ws, peer))
-    t2 = asyncio.create_task(_pipe(peer, ws))
-
-    # 4) Inform sender that pipe is ready
-    await (ws if role == "sender" else peer).send(READY)
-
-    # wait for one side to finish
-    done, pending = await asyncio.wait({t1, t2}, return_when=asyncio.FIRST_COMPLETED)
-
-    # give the slower side up to 1 second to finish
-    sleep_task = asyncio.create_task(asyncio.sleep(1.0))
-    done2, pending2 = await asyncio.wait(pending | {sleep_task}, return_when=asyncio.FIRST_COMPLETED)
-
-    # cancel whatever is still pending (excluding the sleep_task)
-    for t in pending2:
-        if t is not sleep_task:
-            t.cancel()
+    # 3) Pipe until the transfer ends
+    await _relay_pair(ws, peer, role, code_hash, ctx)
 
 
 async def run_relay(host: str, port: int,
                     use_tls: bool = True,
                     certfile: Optional[str] = None,
-                    keyfile: Optional[str] = None) -> None:
+                    keyfile: Optional[str] = None,
+                    rate_limits: Optional[RateLimits] = None,
+                    pairing: Optional[PairingLimits] = None,
+                    spool: Optional[SpoolLimits] = None,
+                    broadcast: Optional[BroadcastLimits] = None,
+                    tls_options: Optional[TlsOptions] = None,
+                    events: Optional[EventLog] = None,
+                    stall_threshold: Optional[float] = None,
+                    tracer: Optional[Tracer] = None,
+                    emulation: Optional[NetworkEmulation] = None,
+                    chaos: Optional[ChaosPlan] = None,
+                    max_frame: int = MAX_FRAME) -> None:
     """
     Run the WebSocket relay server for pairing and forwarding client connections.
 
@@ -139,7 +526,9 @@ async def run_relay(host: str, port: int,
     sender and receiver clients based on matching passphrase hashes, then forwards
     bidirectional data streams without storing content. It handles exactly one
     sender and one receiver per code hash, rejecting duplicates. Use for secure,
-    firewall-friendly (port 443) P2P transfers.
+    firewall-friendly (port 443) P2P transfers. A sender may also broadcast to a
+    fixed number of receivers that joined with the same code, and a receiver
+    may gather the uploads of many senders.
 
     Parameters
     ----------
@@ -153,18 +542,58 @@ async def run_relay(host: str, port: int,
         Path to TLS certificate file.
     keyfile : str, optional
         Path to TLS key file.
+    rate_limits : RateLimits, optional
+        Per-pair, per-IP and total bandwidth limits. Default is no limits.
+    pairing : PairingLimits, optional
+        Waiting timeout, waiting-room size and keepalive settings. Default is PairingLimits().
+    spool : SpoolLimits, optional
+        Enable store-and-forward for senders that request it, with the given
+        directory, quotas and expiry. Default is None (disabled).
+    broadcast : BroadcastLimits, optional
+        Per-receiver queue size and slow-receiver policy for one-to-many
+        broadcasts. Default is BroadcastLimits().
+    tls_options : TlsOptions, optional
+        Minimum TLS version, cipher preferences and session tickets for
+        resumption. Default is TlsOptions().
+    events : EventLog, optional
+        Write pairing, rejection and per-pair byte counts as JSON lines. Code
+        hashes are shortened to 12 hex digits. Default is None (no event log).
+    stall_threshold : float, optional
+        Report every time the event loop is blocked for longer than this many
+        seconds, with the stack of the blocking call. Blocking stalls all
+        pairs at once. Default is None (no watchdog).
+    tracer : Tracer, optional
+        Add a span for the wait and one for the forwarding of every pair to
+        the trace named in the sender's hello; flushed after each pair.
+        Default is None (no tracing).
+    emulation : NetworkEmulation, optional
+        Forward the frames of every pair through emulated links with the given
+        bandwidth, latency, jitter, loss and stalls, to benchmark WAN
+        conditions locally. Broadcasts and spooled uploads are not affected.
+        Default is None (forward at full speed).
+    chaos : ChaosPlan, optional
+        Drop, truncate or pause pairs on a fixed schedule, to measure the
+        cost of recovering with resume. Default is None (no faults).
+    max_frame : int, optional
+        Largest WebSocket message accepted, in bytes. Paired senders are
+        told the smaller of this and their receiver's limit and size their
+        chunks to fit. Default is MAX_FRAME (2 MiB).
 
     Raises
     ------
     RuntimeError
-        If TLS is requested but certfile or keyfile is missing.
+        If TLS is requested but certfile or keyfile is missing, or the 'spool'
+        slow-receiver policy is requested without a spool directory.
     """
+    broadcast = broadcast or BroadcastLimits()
+    if broadcast.policy == SlowReceiverPolicy.spool and spool is None:
+        raise RuntimeError("Slow-receiver policy 'spool' needs a spool directory")
+
     ssl_ctx = None
     if use_tls:
         if not certfile or not keyfile:
             raise RuntimeError("TLS requested but certfile/keyfile missing")
-        ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ssl_ctx.load_cert_chain(certfile, keyfile)
+        ssl_ctx = server_context(certfile, keyfile, tls_options)
 
     scheme = "wss" if ssl_ctx else "ws"
     print(f"\nRelay listening on {scheme}://{host}:{port}")
@@ -172,5 +601,26 @@ async def run_relay(host: str, port: int,
     if host != "localhost":
         use_production_logger()
 
-    async with serve(_handle, host, port, max_size=2**21, ssl=ssl_ctx, compression=None):
-        await asyncio.Future()  # run forever
+    pairing = pairing or PairingLimits()
+    ctx = RelayContext(
+        room=WaitingRoom(shards=pairing.shards, max_waiting=pairing.max_waiting),
+        pairing=pairing,
+        scheduler=BandwidthScheduler(rate_limits) if rate_limits and rate_limits.enabled else None,
+        spools=SpoolStore(spool) if spool else None,
+        broadcast=broadcast,
+        events=(events or NO_EVENTS).bind(source="relay"),
+        tracer=tracer or NO_TRACER,
+        emulation=emulation if emulation and emulation.enabled else None,
+        chaos=chaos,
+        max_frame=max_frame,
+    )
+    reaper = asyncio.create_task(ctx.spools.reap_expired()) if ctx.spools else None
+
+    async with serve(lambda ws: _handle(ws, ctx), host, port, max_size=max_frame, ssl=ssl_ctx, compression=None,
+                     ping_interval=pairing.ping_interval, ping_timeout=pairing.ping_interval):
+        try:
+            async with LoopWatchdog(stall_threshold, events=ctx.events):
+                await asyncio.Future()  # run forever
+        finally:
+            if reaper is not None:
+                reaper.cancel()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+def mbit_to_bytes(mbit: float) -> float:
+    """
+    Convert a rate in Mbit/s to bytes per second.
+
+    Parameters
+    ----------
+    mbit : float
+        Rate in Mbit/s.
+
+    Returns
+    -------
+    float
+        Rate in bytes per second.
+    """
+    return mbit * 1_000_000 / 8.0
+
+
+@dataclass(frozen=True)
+class RateLimits:
+    """
+    Bandwidth limits applied by the relay while forwarding frames.
+
+    Parameters
+    ----------
+    pair_mbit : float, optional
+        Limit per sender/receiver pair (both directions combined), in Mbit/s.
+    ip_mbit : float, optional
+        Limit per source IP over all of its connections, in Mbit/s.
+    uplink_mbit : float, optional
+        Total forwarding capacity of the relay, in Mbit/s. If set, it is shared
+        between active pairs by weighted fair queuing.
+    ip_weights : Dict[str, float], optional
+        Fair-share weight per source IP, positive. IPs not listed get weight 1.0.
+
+    Raises
+    ------
+    ValueError
+        If a weight is not positive.
+    """
+    pair_mbit: Optional[float] = None
+    ip_mbit: Optional[float] = None
+    uplink_mbit: Optional[float] = None
+    ip_weights: Dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        # a zero weight divides by zero in the fair queue, a negative one puts the flow ahead of all others
+        for ip, weight in self.ip_weights.items():
+            if not weight > 0:
+                raise ValueError(f"weight of {ip} must be positive: {weight}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.pair_mbit or self.ip_mbit or self.uplink_mbit)
+
+
+class TokenBucket:
+    """
+    Meter bytes at a fixed rate.
+
+    Reservations may drive the bucket below zero; the returned delay is the
+    time the caller has to wait until the debt is paid back. This keeps the
+    long-term rate exact even for frames larger than the burst size.
+
+    Parameters
+    ----------
+    rate : float
+        Refill rate in bytes per second.
+    burst : float, optional
+        Bucket capacity in bytes. Default is a quarter second worth of rate.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate / 4
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def reserve(self, n: int) -> float:
+        """
+        Take n bytes from the bucket.
+
+        Parameters
+        ----------
+        n : int
+            Number of bytes to account for.
+
+        Returns
+        -------
+        float
+            Seconds to wait before the bytes may be forwarded.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class FairShare:
+    """
+    Share one token bucket between flows by weighted fair queuing.
+
+    Each waiting frame gets a virtual finish tag ``start + size / weight``;
+    frames are released in tag order, so a flow with a small frame overtakes
+    the backlog of a bulk flow instead of queuing behind it. Idle flows
+    re-enter at the current virtual time and therefore cannot save up credit.
+
+    Parameters
+    ----------
+    rate : float
+        Shared capacity in bytes per second.
+    """
+
+    def __init__(self, rate: float):
+        self.bucket = TokenBucket(rate)
+        self._queue: List[Tuple[float, int, float, int, asyncio.Future]] = []
+        self._finish: Dict[Hashable, float] = {}
+        self._vtime = 0.0
+        self._tie = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, flow: Hashable, n: int, weight: float = 1.0) -> None:
+        """
+        Wait until n bytes of the given flow may be forwarded.
+
+        Parameters
+        ----------
+        flow : Hashable
+            Identifier of the flow (e.g. the pair).
+        n : int
+            Number of bytes.
+        weight : float, optional
+            Relative share of this flow. Default is 1.0.
+        """
+        start = max(self._vtime, self._finish.get(flow, 0.0))
+        finish = start + n / weight
+        self._finish[flow] = finish
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish, next(self._tie), start, n, fut))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await fut
+
+    def forget(self, flow: Hashable) -> None:
+        """
+        Drop the bookkeeping of a flow that has ended.
+
+        Parameters
+        ----------
+        flow : Hashable
+            Identifier of the flow.
+        """
+        self._finish.pop(flow, None)
+
+    async def _dispatch(self) -> None:
+        while self._queue:
+            _, _, start, n, fut = heapq.heappop(self._queue)
+            if fut.done():  # waiter was cancelled
+                continue
+            self._vtime = start
+            if delay := self.bucket.reserve(n):
+                await asyncio.sleep(delay)
+            if not fut.done():
+                fut.set_result(None)
+
+
+class BandwidthScheduler:
+    """
+    Apply RateLimits to the frames forwarded by the relay.
+
+    Parameters
+    ----------
+    limits : RateLimits
+        The configured limits.
+    """
+
+    def __init__(self, limits: RateLimits):
+        self.limits = limits
+        self._pairs: Dict[str, TokenBucket] = {}
+        self._ips: Dict[str, List] = {}  # ip -> [bucket, refcount]
+        self._uplink = FairShare(mbit_to_bytes(limits.uplink_mbit)) if limits.uplink_mbit else None
+
+    def open_pair(self, pair_id: str, ips: Tuple[str, str]) -> None:
+        """
+        Register a pair that starts forwarding.
+
+        Parameters
+        ----------
+        pair_id : str
+            Identifier of the pair (its code hash).
+        ips : Tuple[str, str]
+            Source IPs of both connections.
+        """
+        if self.limits.pair_mbit:
+            self._pairs[pair_id] = TokenBucket(mbit_to_bytes(self.limits.pair_mbit))
+        if self.limits.ip_mbit:
+            for ip in ips:
+                entry = self._ips.setdefault(ip, [TokenBucket(mbit_to_bytes(self.limits.ip_mbit)), 0])
+                entry[1] += 1
+
+    def close_pair(self, pair_id: str, ips: Tuple[str, str]) -> None:
+        """
+        Release the state of a pair that stopped forwarding.
+
+        Parameters
+        ----------
+        pair_id : str
+            Identifier of the pair.
+        ips : Tuple[str, str]
+            Source IPs of both connections, as passed to open_pair.
+        """
+        self._pairs.pop(pair_id, None)
+        for ip in ips:
+            entry = self._ips.get(ip)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._ips[ip]
+        if self._uplink:
+            self._uplink.forget(pair_id)
+
+    async def throttle(self, pair_id: str, src_ip: str, n: int) -> None:
+        """
+        Wait until n bytes coming from src_ip may be forwarded for the pair.
+
+        Parameters
+        ----------
+        pair_id : str
+            Identifier of the pair.
+        src_ip : str
+            IP of the connection the frame arrived on.
+        n : int
+            Frame size in bytes.
+        """
+        delay = 0.0
+        if bucket := self._pairs.get(pair_id):
+            delay = bucket.reserve(n)
+        if entry := self._ips.get(src_ip):
+            delay = max(delay, entry[0].reserve(n))
+        if delay:
+            await asyncio.sleep(delay)
+        if self._uplink:
+            await self._uplink.acquire(pair_id, n, self.limits.ip_weights.get(src_ip, 1.0))
+
+
+def remote_ip(ws) -> str:
+    """
+    Return the peer IP of a connection.
+
+    Parameters
+    ----------
+    ws : ServerConnection
+        The connection.
+
+    Returns
+    -------
+    str
+        The IP, or an empty string if unknown.
+    """
+    addr = getattr(ws, "remote_address", None)
+    return str(addr[0]) if addr else ""
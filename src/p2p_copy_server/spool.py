@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Set, Union
+
+from websockets.asyncio.server import ServerConnection
+
+# Spool records: [ kind: uint8 | length: uint32_be | data ]
+# kind 0 = text frame, 1 = binary frame, 2 = end of a complete upload
+RECORD_HEADER = struct.Struct("!BI")
+_TEXT, _BINARY, _END = 0, 1, 2
+_END_RECORD = RECORD_HEADER.pack(_END, 0)
+
+
+class SpoolQuotaExceeded(Exception):
+    """
+    Raised when an upload would exceed the spool quota.
+    """
+
+
+@dataclass(frozen=True)
+class SpoolLimits:
+    """
+    Configuration of the relay's store-and-forward spool.
+
+    Parameters
+    ----------
+    directory : str
+        Directory for spool files.
+    max_bytes : int, optional
+        Maximum size of a single spooled upload in bytes. Default is unlimited.
+    max_total_bytes : int, optional
+        Maximum size of all spooled uploads together in bytes. Default is unlimited.
+    ttl : float, optional
+        Seconds a spooled upload is kept after it was created. Default is 24 hours.
+    """
+    directory: str
+    max_bytes: Optional[int] = None
+    max_total_bytes: Optional[int] = None
+    ttl: float = 24 * 3600.0
+
+
+def valid_code_hash(code_hash: str) -> bool:
+    """
+    Check that a code hash is plain hex and can safely be used as a file name.
+
+    Parameters
+    ----------
+    code_hash : str
+        Hex code hash from a hello.
+
+    Returns
+    -------
+    bool
+        True if the code hash is usable as spool key.
+    """
+    if not 0 < len(code_hash) <= 128:
+        return False
+    try:
+        int(code_hash, 16)
+    except ValueError:
+        return False
+    return True
+
+
+class Spool:
+    """
+    One spooled upload: an append-only file of frames that can be replayed
+    to any number of readers, also while it is still being written.
+
+    Parameters
+    ----------
+    path : Path
+        Location of the spool file.
+    complete : bool, optional
+        Whether the file already holds a complete upload. Default is False.
+    """
+
+    def __init__(self, path: Path, complete: bool = False):
+        self.path = path
+        self.created = path.stat().st_mtime if complete else time.time()
+        self.size = path.stat().st_size if complete else 0
+        self.complete = complete
+        self.aborted = False
+        self.readers = 0
+        self.replayed = False
+        self._fp = None if complete else path.open("wb")
+        self._grown = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._grown.set()
+        self._grown = asyncio.Event()
+
+    async def append(self, frame: Union[str, bytes]) -> None:
+        """
+        Append one frame to the spool file.
+
+        Parameters
+        ----------
+        frame : str or bytes
+            The WebSocket frame as received from the sender.
+        """
+        if isinstance(frame, str):
+            data, kind = frame.encode(), _TEXT
+        else:
+            data, kind = frame, _BINARY
+        record = RECORD_HEADER.pack(kind, len(data))
+
+        def write():
+            self._fp.write(record)
+            self._fp.write(data)
+            self._fp.flush()
+
+        await asyncio.to_thread(write)
+        self.size += RECORD_HEADER.size + len(data)
+        self._notify()
+
+    async def finish(self) -> None:
+        """
+        Mark the upload as complete and close the spool file.
+        """
+        def write_end():
+            self._fp.write(_END_RECORD)
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._fp.close()
+
+        await asyncio.to_thread(write_end)
+        self.size += len(_END_RECORD)
+        self.complete = True
+        self.created = time.time()
+        self._notify()
+
+    def abort(self) -> None:
+        """
+        Mark the upload as failed; readers stop and the file is removed.
+        """
+        if self._fp is not None and not self._fp.closed:
+            self._fp.close()
+        self.aborted = True
+        self._notify()
+
+    async def replay(self, ws: ServerConnection) -> bool:
+        """
+        Send all spooled frames to a receiver, following the file while it grows.
+
+        Parameters
+        ----------
+        ws : ServerConnection
+            The receiver connection.
+
+        Returns
+        -------
+        bool
+            True if the complete upload has been replayed.
+        """
+        self.readers += 1
+        try:
+            with self.path.open("rb") as fp:
+                while True:
+                    grown = self._grown
+                    pos = fp.tell()
+                    header = await asyncio.to_thread(fp.read, RECORD_HEADER.size)
+                    kind, length = RECORD_HEADER.unpack(header) if len(header) == RECORD_HEADER.size else (None, 0)
+                    data = await asyncio.to_thread(fp.read, length) if length else b""
+                    if kind is None or len(data) < length:
+                        # reached the writer: wait for more data
+                        if self.aborted:
+                            return False
+                        fp.seek(pos)
+                        await grown.wait()
+                        continue
+                    if kind == _END:
+                        self.replayed = True
+                        return True
+                    await ws.send(data.decode() if kind == _TEXT else data)
+        finally:
+            self.readers -= 1
+
+
+class SpoolStore:
+    """
+    All spooled uploads of a relay, keyed by code hash.
+
+    Complete spool files found in the directory on startup are kept; incomplete
+    ones from an interrupted run are removed.
+
+    Parameters
+    ----------
+    limits : SpoolLimits
+        Directory, quotas and expiry.
+    """
+
+    def __init__(self, limits: SpoolLimits):
+        self.limits = limits
+        self.directory = Path(limits.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.spools: Dict[str, Spool] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        for path in self.directory.glob("*.spool"):
+            if self._is_complete(path):
+                self.spools[path.stem] = Spool(path, complete=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _is_complete(path: Path) -> bool:
+        with path.open("rb") as fp:
+            fp.seek(0, os.SEEK_END)
+            if fp.tell() < len(_END_RECORD):
+                return False
+            fp.seek(-len(_END_RECORD), os.SEEK_END)
+            return fp.read() == _END_RECORD
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(s.size for s in self.spools.values())
+
+    def get(self, code_hash: str) -> Optional[Spool]:
+        """
+        Return the spool for a code hash, if one exists and has not failed.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash.
+
+        Returns
+        -------
+        Spool or None
+        """
+        spool = self.spools.get(code_hash)
+        return spool if spool is not None and not spool.aborted else None
+
+    def create(self, code_hash: str) -> Spool:
+        """
+        Start a new spooled upload, replacing an older one for the same code.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash, must satisfy valid_code_hash().
+
+        Returns
+        -------
+        Spool
+        """
+        self.remove(code_hash)
+        spool = Spool(self.directory / f"{code_hash}.spool")
+        self.spools[code_hash] = spool
+        return spool
+
+    def check_quota(self, spool: Spool, incoming: int) -> None:
+        """
+        Raise SpoolQuotaExceeded if appending incoming bytes would exceed a quota.
+
+        Parameters
+        ----------
+        spool : Spool
+            The spool being written.
+        incoming : int
+            Size of the next frame.
+        """
+        max_bytes, max_total = self.limits.max_bytes, self.limits.max_total_bytes
+        if max_bytes is not None and spool.size + incoming > max_bytes:
+            raise SpoolQuotaExceeded("Spool quota exceeded")
+        if max_total is not None and self.total_bytes + incoming > max_total:
+            raise SpoolQuotaExceeded("Relay spool full")
+
+    def remove(self, code_hash: str, spool: Optional[Spool] = None) -> None:
+        """
+        Delete a spool and its file.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash.
+        spool : Spool, optional
+            Only delete this spool. If a newer upload has replaced it, the
+            file belongs to the newer one and is kept. Default is None
+            (whatever spool the code hash has).
+        """
+        if spool is not None and self.spools.get(code_hash) is not spool:
+            spool.abort()
+            return
+        spool = self.spools.pop(code_hash, None)
+        if spool is not None:
+            spool.abort()
+            spool.path.unlink(missing_ok=True)
+
+    def release(self, code_hash: str, spool: Spool) -> None:
+        """
+        Delete a spool once it has been replayed completely and no reader is left.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash.
+        spool : Spool
+            The spool a reader has finished with.
+        """
+        if spool.replayed and spool.readers == 0 and self.spools.get(code_hash) is spool:
+            self.spools.pop(code_hash)
+            spool.path.unlink(missing_ok=True)
+
+    async def replay_to(self, code_hash: str, spool: Spool, ws: ServerConnection) -> None:
+        """
+        Replay a spool to a receiver and release it afterwards.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash.
+        spool : Spool
+            The spool to replay.
+        ws : ServerConnection
+            The receiver connection.
+        """
+        try:
+            if not await spool.replay(ws):
+                await ws.close(code=1011, reason="Sender aborted spooled upload")
+        except Exception:
+            pass
+        finally:
+            self.release(code_hash, spool)
+
+    def start_replay(self, code_hash: str, spool: Spool, ws: ServerConnection) -> None:
+        """
+        Replay a spool to a receiver in a background task.
+
+        Parameters
+        ----------
+        code_hash : str
+            Hex code hash.
+        spool : Spool
+            The spool to replay.
+        ws : ServerConnection
+            The receiver connection.
+        """
+        task = asyncio.create_task(self.replay_to(code_hash, spool, ws))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def reap_expired(self) -> None:
+        """
+        Periodically delete spools older than the configured ttl.
+        """
+        while True:
+            await asyncio.sleep(min(60.0, self.limits.ttl))
+            now = time.time()
+            for code_hash, spool in list(self.spools.items()):
+                if spool.complete and spool.readers == 0 and now - spool.created > self.limits.ttl:
+                    self.remove(code_hash)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import ssl
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class TlsOptions:
+    """
+    TLS settings of the relay.
+
+    Parameters
+    ----------
+    min_version : str, optional
+        Lowest accepted protocol version, '1.2' or '1.3'. TLS 1.3 is always
+        preferred when the client supports it. Default is '1.2'.
+    ciphers : str, optional
+        OpenSSL cipher string for TLS 1.2, in order of preference. Default is
+        None (OpenSSL defaults).
+    session_tickets : int, optional
+        Session tickets issued per TLS 1.3 handshake so clients can resume
+        without a full handshake. 0 disables resumption. Default is 2.
+    """
+    min_version: str = "1.2"
+    ciphers: Optional[str] = None
+    session_tickets: int = 2
+
+
+def server_context(certfile: str, keyfile: str, options: Optional[TlsOptions] = None) -> ssl.SSLContext:
+    """
+    Build the relay's SSL context.
+
+    Parameters
+    ----------
+    certfile : str
+        Path to the TLS certificate file (PEM).
+    keyfile : str
+        Path to the TLS key file (PEM).
+    options : TlsOptions, optional
+        Protocol version, ciphers and session resumption. Default is TlsOptions().
+
+    Returns
+    -------
+    ssl.SSLContext
+
+    Raises
+    ------
+    ValueError
+        If min_version is not '1.2' or '1.3'.
+    """
+    options = options or TlsOptions()
+    versions = {"1.2": ssl.TLSVersion.TLSv1_2, "1.3": ssl.TLSVersion.TLSv1_3}
+    if options.min_version not in versions:
+        raise ValueError(f"Unsupported TLS version: {options.min_version}")
+
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.minimum_version = versions[options.min_version]
+    ctx.maximum_version = ssl.TLSVersion.MAXIMUM_SUPPORTED
+    ctx.options |= ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+    if options.ciphers:
+        ctx.set_ciphers(options.ciphers)
+    if options.session_tickets > 0:
+        ctx.num_tickets = options.session_tickets
+    else:
+        ctx.options |= ssl.OP_NO_TICKET
+        ctx.num_tickets = 0
+    ctx.load_cert_chain(certfile, keyfile)
+    return ctx
@@ -0,0 +1,254 @@
+"""
+Load generator for the relay: many synthetic sender/receiver pairs at once.
+
+Starts the relay as a subprocess (`p2p-copy run-relay-server`) and, for every
+step of increasing pair counts, pairs N senders with N receivers, lets every
+sender stream frames of a fixed size at a fixed rate and reports aggregate
+throughput, pairing-latency percentiles and the relay's RSS and CPU. The first
+step that misses the offered throughput, exceeds the pairing-latency limit or
+loses connections is reported as the degradation point.
+
+Example (Linux, needs /proc):
+
+    python tests/load_relay.py --pairs 100,500,1000,2000 --frame-size 65536 --rate 20 --duration 10
+
+The load generator runs in a single process; on small machines it can become
+the bottleneck before the relay does, which shows up as high client CPU.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from contextlib import closing
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from websockets.asyncio.client import connect
+
+from p2p_copy import run, LoopKind
+from p2p_copy.protocol import Hello
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+@dataclass
+class StepResult:
+    pairs: int
+    offered_mbit: float
+    throughput_mbit: float
+    pairing_p50_ms: float
+    pairing_p99_ms: float
+    relay_rss_mib: float
+    relay_cpu_percent: float
+    client_cpu_percent: float
+    errors: int
+    degraded: bool
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _rss_kib(pid: int) -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+def _cpu_seconds(pid: int) -> float:
+    # utime and stime are fields 14 and 15; the command name may contain spaces
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * q) - 1))] if ordered else 0.0
+
+
+async def _run_step(url: str, pid: int, n: int, step: int, frame_size: int, rate: float, duration: float,
+                    max_pairing_ms: float, min_efficiency: float) -> StepResult:
+    frame = os.urandom(frame_size)
+    received = [0] * n
+    errors = 0
+    receivers, senders = [], []
+
+    def code_hash(i: int) -> str:
+        return f"{step:08x}{i:056x}"
+
+    async def open_receiver(i: int):
+        ws = await connect(url, ping_interval=None, open_timeout=60, compression=None, max_size=2**21)
+        await ws.send(Hello(type="hello", code_hash_hex=code_hash(i), role="receiver").to_json())
+        receivers.append((i, ws))
+
+    async def open_sender(i: int) -> float:
+        ws = await connect(url, ping_interval=None, open_timeout=60, compression=None, max_size=2**21)
+        t0 = time.perf_counter()
+        await ws.send(Hello(type="hello", code_hash_hex=code_hash(i), role="sender").to_json())
+        await asyncio.wait_for(ws.recv(), timeout=30)  # ready
+        senders.append(ws)
+        return time.perf_counter() - t0
+
+    async def stream(ws, deadline: float):
+        nonlocal errors
+        interval = 1.0 / rate if rate > 0 else 0.0
+        next_t = time.perf_counter()
+        try:
+            while (now := time.perf_counter()) < deadline:
+                if interval:
+                    next_t += interval
+                    await asyncio.sleep(max(0.0, next_t - now))
+                await ws.send(frame)
+        except Exception:
+            errors += 1
+
+    async def drain(i: int, ws, deadline: float):
+        nonlocal errors
+        try:
+            while True:
+                msg = await asyncio.wait_for(ws.recv(), timeout=max(0.1, deadline - time.perf_counter()))
+                if time.perf_counter() <= deadline:
+                    received[i] += len(msg)
+        except asyncio.TimeoutError:
+            pass
+        except Exception:
+            errors += 1
+
+    # pair in batches to stay below the listen backlog
+    latencies: List[float] = []
+    for start in range(0, n, 500):
+        batch = range(start, min(n, start + 500))
+        await asyncio.gather(*(open_receiver(i) for i in batch))
+        results = await asyncio.gather(*(open_sender(i) for i in batch), return_exceptions=True)
+        latencies += [r for r in results if isinstance(r, float)]
+        errors += sum(1 for r in results if not isinstance(r, float))
+
+    cpu0, client_cpu0, t0 = _cpu_seconds(pid), time.process_time(), time.perf_counter()
+    deadline = t0 + duration
+    await asyncio.gather(*(stream(ws, deadline) for ws in senders),
+                         *(drain(i, ws, deadline) for i, ws in receivers))
+    elapsed = time.perf_counter() - t0
+    relay_cpu = (_cpu_seconds(pid) - cpu0) / elapsed * 100
+    client_cpu = (time.process_time() - client_cpu0) / elapsed * 100
+    rss = _rss_kib(pid) / 1024
+
+    await asyncio.gather(*(ws.close() for ws in senders), *(ws.close() for _, ws in receivers),
+                         return_exceptions=True)
+
+    offered = n * frame_size * rate * 8 / 1e6 if rate > 0 else 0.0
+    throughput = sum(received) * 8 / 1e6 / duration
+    p50, p99 = _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.99) * 1000
+    degraded = (errors > 0 or p99 > max_pairing_ms
+                or (offered > 0 and throughput < offered * min_efficiency))
+    return StepResult(n, round(offered, 1), round(throughput, 1), round(p50, 2), round(p99, 2),
+                      round(rss, 1), round(relay_cpu, 1), round(client_cpu, 1), errors, degraded)
+
+
+async def run_load(pairs: Sequence[int], frame_size: int = 65536, rate: float = 10.0, duration: float = 5.0,
+                   max_pairing_ms: float = 1000.0, min_efficiency: float = 0.9,
+                   relay_args: Sequence[str] = (), stop_at_degradation: bool = True) -> List[StepResult]:
+    """
+    Run the load steps against a relay subprocess and return one result per step.
+
+    Parameters
+    ----------
+    pairs : Sequence[int]
+        Pair counts of the steps, increasing.
+    frame_size : int, optional
+        Bytes per frame. Default is 64 KiB.
+    rate : float, optional
+        Frames per second per sender, 0 for as fast as possible. Default is 10.
+    duration : float, optional
+        Seconds of streaming per step. Default is 5.
+    max_pairing_ms : float, optional
+        Pairing p99 above which a step counts as degraded. Default is 1000.
+    min_efficiency : float, optional
+        Fraction of the offered throughput a step has to reach. Default is 0.9.
+    relay_args : Sequence[str], optional
+        Extra arguments for `p2p-copy run-relay-server`.
+    stop_at_degradation : bool, optional
+        Stop after the first degraded step. Default is True.
+    """
+    needed = 2 * max(pairs) + 200
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard) if hard != resource.RLIM_INFINITY else needed,
+                                                    hard))
+
+    host, port = "localhost", _free_port()
+    relay = subprocess.Popen(["p2p-copy", "run-relay-server", host, str(port), "--no-tls", *relay_args],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    results = []
+    try:
+        await asyncio.sleep(0.5)
+        for step, n in enumerate(pairs):
+            result = await _run_step(f"ws://{host}:{port}", relay.pid, n, step, frame_size, rate, duration,
+                                     max_pairing_ms, min_efficiency)
+            results.append(result)
+            if result.degraded and stop_at_degradation:
+                break
+    finally:
+        relay.terminate()
+        relay.wait(timeout=5)
+    return results
+
+
+def print_table(results: Sequence[StepResult]) -> None:
+    header = (f"{'pairs':>7} {'offered':>10} {'achieved':>10} {'pair p50':>9} {'pair p99':>9} "
+              f"{'relay RSS':>10} {'relay CPU':>9} {'client CPU':>10} {'errors':>6}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r.pairs:>7} {r.offered_mbit:>6.1f}Mbit {r.throughput_mbit:>6.1f}Mbit {r.pairing_p50_ms:>7.1f}ms "
+              f"{r.pairing_p99_ms:>7.1f}ms {r.relay_rss_mib:>7.1f}MiB {r.relay_cpu_percent:>8.0f}% "
+              f"{r.client_cpu_percent:>9.0f}% {r.errors:>6}{'  <- degraded' if r.degraded else ''}")
+    first: Optional[StepResult] = next((r for r in results if r.degraded), None)
+    print(f"first degraded step: {first.pairs} pairs" if first else "no degradation up to the last step")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the p2p-copy relay with many concurrent pairs.")
+    parser.add_argument("--pairs", default="10,100,500,1000",
+                        help="comma-separated pair counts, increasing (default: %(default)s)")
+    parser.add_argument("--frame-size", type=int, default=65536, help="bytes per frame (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="frames per second per sender, 0 = unthrottled (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per step (default: %(default)s)")
+    parser.add_argument("--max-pairing-ms", type=float, default=1000.0,
+                        help="pairing p99 that counts as degraded (default: %(default)s)")
+    parser.add_argument("--min-efficiency", type=float, default=0.9,
+                        help="fraction of offered throughput to reach (default: %(default)s)")
+    parser.add_argument("--relay-arg", action="append", default=[],
+                        help="extra argument for run-relay-server, repeatable (e.g. --relay-arg=--loop=uvloop)")
+    parser.add_argument("--loop", choices=[k.value for k in LoopKind], default="asyncio",
+                        help="event loop of the load generator (default: %(default)s)")
+    parser.add_argument("--all-steps", action="store_true", help="continue after the first degraded step")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if not Path("/proc/self/stat").exists():
+        print("load_relay.py needs /proc to measure the relay", file=sys.stderr)
+        return 2
+
+    pairs = [int(p) for p in args.pairs.split(",")]
+    results = run(run_load(pairs, args.frame_size, args.rate, args.duration, args.max_pairing_ms,
+                           args.min_efficiency, args.relay_arg, not args.all_steps), loop=args.loop)
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps([asdict(r) for r in results], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+"""
+End-to-end performance regression suite for send/receive through the relay.
+
+Every case transfers one dataset with the real `send()`/`receive()` through a
+relay started in this process with `run_relay()` on localhost and measures
+the wall-clock throughput, best of several repeats. Datasets cover many small
+files, a few huge files and mixed compressibility, each plain and encrypted
+(if p2p-copy[security] is installed).
+
+Results are compared with a baseline JSON stored per machine in
+tests/perf_baselines/<machine>.json; a case fails if its throughput is more
+than the tolerance below the baseline. Without a baseline the run creates one.
+
+Example:
+
+    python tests/perf_suite.py                      # compare with (or create) the baseline
+    python tests/perf_suite.py --update-baseline    # accept the current numbers
+    python tests/perf_suite.py --dataset small-files --scale 0.2 --repeat 1
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import sys
+import tempfile
+import time
+from contextlib import closing
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from p2p_copy import send, receive, TransferStats
+from p2p_copy.bench import DataProfile, make_data
+from p2p_copy_server import run_relay
+
+BASELINE_DIR = Path(__file__).parent / "perf_baselines"
+
+
+@dataclass(frozen=True)
+class Dataset:
+    name: str
+    files: int
+    file_size: int
+    profiles: Sequence[DataProfile]  # cycled over the files
+    scale_files: bool = False  # --scale changes the number of files instead of their size
+
+
+DATASETS = {d.name: d for d in (
+    Dataset("small-files", files=2000, file_size=8 * 2**10, profiles=(DataProfile.text, DataProfile.random),
+            scale_files=True),
+    Dataset("huge-files", files=2, file_size=256 * 2**20, profiles=(DataProfile.random,)),
+    Dataset("mixed", files=24, file_size=8 * 2**20,
+            profiles=(DataProfile.text, DataProfile.random, DataProfile.zeros)),
+)}
+
+
+@dataclass
+class CaseResult:
+    case: str
+    bytes: int
+    files: int
+    seconds: float
+    mib_per_s: float
+    bottleneck: Optional[str]
+    loop_stalls: int
+
+
+def machine_id() -> str:
+    """Host name, architecture and Python version, as used in baseline file names."""
+    raw = f"{platform.node()}-{platform.machine()}-py{sys.version_info.major}{sys.version_info.minor}"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", raw)
+
+
+def baseline_path(directory: Path, scale: float) -> Path:
+    """Baselines are kept per machine and scale; other scales move different amounts of data."""
+    return directory / (f"{machine_id()}.json" if scale == 1.0 else f"{machine_id()}-scale{scale:g}.json")
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _has_security() -> bool:
+    try:
+        import cryptography, argon2  # noqa: F401
+        return True
+    except ModuleNotFoundError:
+        return False
+
+
+def build_dataset(dataset: Dataset, root: Path, scale: float) -> Path:
+    """Write a dataset below root, scaled in file count (small files) or file size."""
+    target = root / dataset.name
+    if target.exists():
+        return target
+    files = max(1, round(dataset.files * scale)) if dataset.scale_files else dataset.files
+    size = dataset.file_size if dataset.scale_files else max(2**16, int(dataset.file_size * scale))
+    blobs = {p: make_data(p, size, seed=i) for i, p in enumerate(dataset.profiles)}
+    for i in range(files):
+        path = target / f"d{i // 100:03}" / f"f{i:05}.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(blobs[dataset.profiles[i % len(dataset.profiles)]])
+    return target
+
+
+async def run_case(server: str, src: Path, out: Path, encrypt: bool) -> CaseResult:
+    """Transfer src once and measure from the start of send until the receiver is done."""
+    code = os.urandom(8).hex()
+    stats = TransferStats()
+    recv_task = asyncio.create_task(receive(server=server, code=code, encrypt=encrypt, out=str(out), stats=stats))
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    rc_send = await send(server=server, code=code, files=[str(src)], encrypt=encrypt, stall_threshold=0.5)
+    rc_recv = await recv_task
+    seconds = time.perf_counter() - t0
+    if rc_send or rc_recv:
+        raise RuntimeError(f"transfer failed ({rc_send}/{rc_recv})")
+    return CaseResult("", stats.bytes_raw, len(stats.files), seconds, stats.bytes_raw / 2**20 / seconds,
+                      stats.bottleneck, stats.loop_stalls)
+
+
+async def run_suite(datasets: Sequence[str] = tuple(DATASETS), encrypt: Sequence[bool] = (False, True),
+                    scale: float = 1.0, repeat: int = 3, workdir: Optional[Path] = None) -> List[CaseResult]:
+    """
+    Run every dataset with every encryption setting and keep the best of `repeat` runs.
+
+    Parameters
+    ----------
+    datasets : Sequence[str]
+        Names from DATASETS.
+    encrypt : Sequence[bool]
+        Encryption settings; True is skipped without p2p-copy[security].
+    scale : float
+        Scales the number of small files and the size of large files. Default is 1.0.
+    repeat : int
+        Runs per case. Default is 3.
+    workdir : Path, optional
+        Directory for datasets and output. Default is a temporary directory.
+    """
+    encrypt = [e for e in encrypt if not e or _has_security()]
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        root = Path(tmp)
+        port = _free_port()
+        server = f"ws://localhost:{port}"
+        relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+        results = []
+        try:
+            await asyncio.sleep(0.2)
+            for name in datasets:
+                src = build_dataset(DATASETS[name], root / "data", scale)
+                for enc in encrypt:
+                    runs = []
+                    for i in range(repeat):
+                        runs.append(await run_case(server, src, root / "out" / f"{name}-{enc}-{i}", enc))
+                    best = max(runs, key=lambda r: r.mib_per_s)
+                    best.case = f"{name}/{'encrypted' if enc else 'plain'}"
+                    results.append(best)
+        finally:
+            relay_task.cancel()
+    return results
+
+
+def load_baseline(scale: float = 1.0, directory: Path = BASELINE_DIR) -> Optional[Dict[str, float]]:
+    path = baseline_path(directory, scale)
+    if not path.exists():
+        return None
+    return {case: r["mib_per_s"] for case, r in json.loads(path.read_text())["results"].items()}
+
+
+def save_baseline(results: Sequence[CaseResult], scale: float, directory: Path = BASELINE_DIR) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = baseline_path(directory, scale)
+    path.write_text(json.dumps({
+        "machine": {"id": machine_id(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                    "python": platform.python_version()},
+        "scale": scale,
+        "results": {r.case: asdict(r) for r in results},
+    }, indent=2) + "\n")
+    return path
+
+
+def regressions(results: Sequence[CaseResult], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Cases whose throughput fell more than tolerance (a fraction) below the baseline."""
+    found = []
+    for r in results:
+        expected = baseline.get(r.case)
+        if expected and r.mib_per_s < expected * (1 - tolerance):
+            found.append(f"{r.case}: {r.mib_per_s:.1f} MiB/s, baseline {expected:.1f} MiB/s "
+                         f"({r.mib_per_s / expected - 1:+.0%})")
+    return found
+
+
+def print_table(results: Sequence[CaseResult], baseline: Optional[Dict[str, float]]) -> None:
+    header = f"{'case':<24} {'MiB':>8} {'files':>6} {'seconds':>8} {'MiB/s':>8} {'baseline':>9} {'change':>7}  bottleneck"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        expected = (baseline or {}).get(r.case)
+        change = f"{r.mib_per_s / expected - 1:+.0%}" if expected else ""
+        print(f"{r.case:<24} {r.bytes / 2**20:>8.1f} {r.files:>6} {r.seconds:>8.2f} {r.mib_per_s:>8.1f} "
+              f"{expected or 0:>9.1f} {change:>7}  {r.bottleneck or '-'}"
+              + (f", {r.loop_stalls} loop stalls" if r.loop_stalls else ""))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end throughput regression suite for p2p-copy.")
+    parser.add_argument("--dataset", action="append", choices=list(DATASETS),
+                        help="dataset to run, repeatable (default: all)")
+    parser.add_argument("--no-encrypt", action="store_true", help="skip the encrypted cases")
+    parser.add_argument("--scale", type=float, default=1.0, help="dataset scale factor (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, best counts (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed throughput drop below the baseline (default: %(default)s)")
+    parser.add_argument("--baseline-dir", type=Path, default=BASELINE_DIR, help="where baselines are stored")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--workdir", type=Path, help="directory for datasets (default: system temp)")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_suite(args.dataset or list(DATASETS), (False,) if args.no_encrypt else (False, True),
+                                    args.scale, args.repeat, args.workdir))
+    baseline = load_baseline(args.scale, args.baseline_dir)
+    print_table(results, baseline)
+    if args.json:
+        Path(args.json).write_text(json.dumps([asdict(r) for r in results], indent=2))
+    if baseline is None or args.update_baseline:
+        print(f"baseline written to {save_baseline(results, args.scale, args.baseline_dir)}")
+        return 0
+    if found := regressions(results, baseline, args.tolerance):
+        print("throughput regressions:\n  " + "\n  ".join(found))
+        return 1
+    print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
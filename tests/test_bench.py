@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import asyncio
+
+import zstandard as zstd
+from typer.testing import CliRunner
+
+from p2p_copy.bench import run_bench, make_data, format_table, BenchStage, DataProfile
+from p2p_copy_cli.main import app
+
+
+def test_data_profiles_compress_differently():
+    size = 2**20
+    ratios = {p: len(zstd.ZstdCompressor(level=3).compress(make_data(p, size))) / size for p in DataProfile}
+    assert all(len(make_data(p, size)) == size for p in DataProfile)
+    assert ratios[DataProfile.random] > 0.99
+    assert 0.1 < ratios[DataProfile.text] < 0.6
+    assert ratios[DataProfile.zeros] < 0.01
+    assert make_data(DataProfile.text, 1000) == make_data(DataProfile.text, 1000)
+
+
+def test_bench_measures_every_stage():
+    results = asyncio.run(run_bench(chunk_sizes=(65536, 3 * 2**20), levels=(1, 3), size=4 * 2**20))
+    print("\n" + format_table(results))
+    stages = {r.stage for r in results}
+    assert stages == {s.value for s in BenchStage}
+
+    compress = [r for r in results if r.stage == "compress"]
+    assert len(compress) == 2 * len(DataProfile) * 2
+    assert all(r.ratio is not None for r in compress)
+
+    pipeline = [r for r in results if r.stage == "pipeline"]
+    assert [r.profile for r in pipeline] == [p.value for p in DataProfile]
+    assert all(r.mib_per_s for r in pipeline)
+
+    # frames of 3 MiB chunks exceed the WebSocket frame limit
+    websocket = {r.chunk_size: r for r in results if r.stage == "websocket"}
+    assert websocket[65536].mib_per_s and websocket[3 * 2**20].mib_per_s is None
+
+
+def test_bench_cli_selects_data_profile():
+    # --data picks the data; --profile is CPU profiling on the other commands
+    result = CliRunner().invoke(app, ["bench", "--stage", "disk", "--data", "zeros", "--size-mb", "1",
+                                      "--chunk-size", "65536"])
+    assert result.exit_code == 0
+    rows = [line.split()[:2] for line in result.output.splitlines() if line.startswith("disk")]
+    assert rows == [["disk", "zeros"]]
+    assert CliRunner().invoke(app, ["bench", "--profile", "zeros"]).exit_code != 0
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+from websockets.asyncio.client import connect
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode
+from p2p_copy.protocol import Hello
+from p2p_copy.security import SecurityHandler
+from p2p_copy_server import run_relay, BroadcastLimits, SlowReceiverPolicy, SpoolLimits
+from p2p_copy_server.broadcast import BroadcastGroup
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _mk_files(base: Path, layout: dict[str, bytes]) -> None:
+    for rel, content in layout.items():
+        p = base / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(content)
+
+
+LAYOUT = {
+    "a.txt": b"hello everyone",
+    "sub/b.bin": random.Random(11).randbytes(3 * (1 << 20) + 77),
+}
+
+
+@pytest.mark.parametrize("encrypt", [False, True])
+def test_broadcast_to_three_receivers(tmp_path, encrypt):
+    asyncio.run(async_broadcast_to_three_receivers(tmp_path, encrypt))
+
+
+async def async_broadcast_to_three_receivers(tmp_path: Path, encrypt: bool):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    _mk_files(src, LAYOUT)
+    outs = [tmp_path / f"out{i}" for i in range(3)]
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        # the sender may connect before all receivers have joined
+        send_task = asyncio.create_task(
+            api_send(server=server_url, code="many", files=[str(src)], encrypt=encrypt, broadcast=3))
+        recv_tasks = []
+        for out in outs:
+            await asyncio.sleep(0.05)
+            recv_tasks.append(asyncio.create_task(
+                api_receive(server=server_url, code="many", encrypt=encrypt, out=str(out), broadcast=True)))
+        results = await asyncio.wait_for(asyncio.gather(send_task, *recv_tasks), timeout=60)
+    finally:
+        relay_task.cancel()
+
+    assert results == [0, 0, 0, 0]
+    for out in outs:
+        for rel, content in LAYOUT.items():
+            assert (out / "src" / rel).read_bytes() == content
+
+
+@pytest.mark.parametrize("policy", [SlowReceiverPolicy.drop, SlowReceiverPolicy.spool])
+def test_slow_broadcast_receiver_does_not_stall_others(tmp_path, policy):
+    asyncio.run(async_slow_broadcast_receiver_does_not_stall_others(tmp_path, policy))
+
+
+async def async_slow_broadcast_receiver_does_not_stall_others(tmp_path: Path, policy: SlowReceiverPolicy):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "big.bin"
+    src.write_bytes(random.Random(3).randbytes(24 * (1 << 20)))
+    spool_dir = tmp_path / "spool"
+
+    relay_task = asyncio.create_task(run_relay(
+        host="localhost", port=port, use_tls=False,
+        spool=SpoolLimits(directory=str(spool_dir)),
+        broadcast=BroadcastLimits(queue_frames=2, policy=policy, grace=0.5)))
+    try:
+        await asyncio.sleep(0.1)
+        code_hash = SecurityHandler("slow", False).code_hash.hex()
+        # a receiver that joins but does not read anything for now
+        async with connect(server_url, max_size=2**21, max_queue=1, close_timeout=1,
+                           compression=None) as slow:
+            await slow.send(Hello(type="hello", code_hash_hex=code_hash, role="receiver", broadcast=True).to_json())
+            await asyncio.sleep(0.05)
+            recv_task = asyncio.create_task(
+                api_receive(server=server_url, code="slow", out=str(tmp_path / "out"), broadcast=True))
+            await asyncio.sleep(0.05)
+            send_rc = await asyncio.wait_for(
+                api_send(server=server_url, code="slow", files=[str(src)], compress=CompressMode.off, broadcast=2),
+                timeout=60)
+            recv_rc = await asyncio.wait_for(recv_task, timeout=30)
+            assert send_rc == 0 and recv_rc == 0
+
+            if policy == SlowReceiverPolicy.spool:
+                assert list(spool_dir.glob("*.overflow"))
+                # the slow receiver still gets the complete stream from its overflow file
+                frames = 0
+                while True:
+                    frame = await asyncio.wait_for(slow.recv(), timeout=30)
+                    frames += 1
+                    if isinstance(frame, str) and '"eof"' in frame:
+                        break
+                assert frames > 24
+    finally:
+        relay_task.cancel()
+
+    assert (tmp_path / "out" / "big.bin").read_bytes() == src.read_bytes()
+
+
+def test_broadcast_rejects_resume_and_spool(tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"x")
+    assert asyncio.run(api_send(server="ws://localhost:1", code="c", files=[str(src)], broadcast=2, resume=True)) != 0
+    assert asyncio.run(api_send(server="ws://localhost:1", code="c", files=[str(src)], broadcast=2, spool=True)) != 0
+
+
+class _VanishingReceiver:
+    """A receiver connection that takes a moment to notice it is gone."""
+
+    async def send(self, frame):
+        await asyncio.sleep(0.1)
+        raise ConnectionError("receiver gone")
+
+    async def wait_closed(self):
+        pass
+
+
+def test_dead_receiver_does_not_stall_waiting_broadcast():
+    asyncio.run(async_dead_receiver_does_not_stall_waiting_broadcast())
+
+
+async def async_dead_receiver_does_not_stall_waiting_broadcast():
+    group = BroadcastGroup(BroadcastLimits(queue_frames=2, policy=SlowReceiverPolicy.wait))
+    group.expected = 1
+    sub = group.add_receiver(_VanishingReceiver())
+    assert await group.wait_ready(1.0)
+    # the receiver dies while the publisher waits for room in its full queue
+    for i in range(4):
+        assert await asyncio.wait_for(group.publish(b"frame %d" % i), timeout=5)
+    assert sub.failed
+    assert not await asyncio.wait_for(group.publish(b"last"), timeout=5)
+    await asyncio.wait_for(group.close(), timeout=5)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+from contextlib import closing
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+from websockets.asyncio.client import connect
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog
+from p2p_copy.capabilities import PROTOCOL_VERSION, local_capabilities, parse_capabilities, negotiate
+from p2p_copy.io_utils import CHUNK_SIZE, MAX_CHUNK
+from p2p_copy.protocol import Hello, EOF
+from p2p_copy.security import SecurityHandler
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _events(path: Path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+# ---------- unit checks ----------
+
+def test_negotiate_picks_common_settings():
+    sender = local_capabilities(False, MAX_CHUNK)
+    receiver = replace(local_capabilities(False, CHUNK_SIZE), version=PROTOCOL_VERSION + 1, codecs=("lz4", "none"),
+                       cpus=2)
+    # the message survives the wire
+    assert parse_capabilities(json.loads(sender.to_json())) == sender
+
+    settings = negotiate(sender, receiver)
+    assert settings.version == PROTOCOL_VERSION
+    assert settings.codec == "none"  # the receiver cannot decompress zstd
+    assert settings.hash == "sha256" and settings.cipher == ""
+    assert settings.max_chunk == CHUNK_SIZE and settings.streams == 1 and settings.cpus == min(2, sender.cpus)
+
+
+def test_negotiate_rejects_what_does_not_fit():
+    plain, encrypted = local_capabilities(False, MAX_CHUNK), local_capabilities(True, MAX_CHUNK)
+    with pytest.raises(ValueError, match="encryption setting does not match: sender off, receiver on"):
+        negotiate(plain, encrypted)
+    with pytest.raises(ValueError, match="no common cipher"):
+        negotiate(replace(encrypted, ciphers=("aes-256-gcm",)), replace(encrypted, ciphers=()))
+    with pytest.raises(ValueError, match="no common checksum"):
+        negotiate(plain, replace(plain, hashes=("blake3",)))
+    for bad in ({"type": "manifest"}, {"type": "capabilities", "version": 1},
+                dict(json.loads(plain.to_json()), codecs="zstd"), dict(json.loads(plain.to_json()), streams=0)):
+        with pytest.raises(ValueError):
+            parse_capabilities(bad)
+
+
+# ---------- end-to-end through the relay ----------
+
+def test_both_sides_agree_on_settings(tmp_path: Path):
+    asyncio.run(async_both_sides_agree_on_settings(tmp_path))
+
+
+async def async_both_sides_agree_on_settings(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "data.txt"
+    src.write_bytes(b"negotiated " * 100000)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    send_log, recv_log = EventLog(tmp_path / "send.jsonl"), EventLog(tmp_path / "recv.jsonl")
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="caps", out=str(out), events=recv_log))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="caps", files=[str(src)], compress=CompressMode.on,
+                                 events=send_log)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+    finally:
+        relay_task.cancel()
+        send_log.close()
+        recv_log.close()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.txt").read_bytes() == src.read_bytes()
+    sent = next(e for e in _events(tmp_path / "send.jsonl") if e["event"] == "negotiated")
+    received = next(e for e in _events(tmp_path / "recv.jsonl") if e["event"] == "negotiated")
+    for key in ("version", "codec", "hash", "cipher", "max_chunk", "streams", "cpus"):
+        assert sent[key] == received[key]
+    assert sent["codec"] == "zstd" and sent["max_chunk"] == CHUNK_SIZE  # half the default 2 MiB frame
+
+
+def test_direct_transfer_keeps_to_the_receivers_chunk_limit(tmp_path: Path):
+    asyncio.run(async_direct_transfer_keeps_to_the_receivers_chunk_limit(tmp_path))
+
+
+async def async_direct_transfer_keeps_to_the_receivers_chunk_limit(tmp_path: Path):
+    pytest.importorskip("cryptography")
+    pytest.importorskip("argon2")
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    payload = os.urandom(4 * CHUNK_SIZE)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    send_log, recv_log = EventLog(tmp_path / "send.jsonl"), EventLog(tmp_path / "recv.jsonl")
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="caps-direct", out=str(out), encrypt=True,
+                                                    direct=True, max_frame=2**18, events=recv_log))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="caps-direct", files=[str(src)], encrypt=True, direct=True,
+                                 compress=CompressMode.off, events=send_log)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+    finally:
+        relay_task.cancel()
+        send_log.close()
+        recv_log.close()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    sent = _events(tmp_path / "send.jsonl")
+    assert next(e for e in sent if e["event"] == "paired")["direct"]
+    # the capabilities went over the direct connection, the receiver's limit holds there too
+    for log in (sent, _events(tmp_path / "recv.jsonl")):
+        assert next(e for e in log if e["event"] == "negotiated")["max_chunk"] == 2**17
+    assert next(e for e in sent if e["event"] == "file_start")["chunk"] <= 2**17
+
+
+def test_receiver_without_exchange_gets_the_manifest(tmp_path: Path):
+    asyncio.run(async_receiver_without_exchange_gets_the_manifest(tmp_path))
+
+
+async def async_receiver_without_exchange_gets_the_manifest(tmp_path: Path):
+    port = _free_port()
+    url = f"ws://localhost:{port}"
+    src = tmp_path / "data.bin"
+    src.write_bytes(b"x" * 1000)
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        # a receiver that predates the exchange does not announce it in its hello
+        async with connect(url) as receiver:
+            code_hash = SecurityHandler("old-peer", False).code_hash.hex()
+            await receiver.send(Hello(type="hello", code_hash_hex=code_hash, role="receiver").to_json())
+            send_task = asyncio.create_task(api_send(server=url, code="old-peer", files=[str(src)]))
+            first = json.loads(await asyncio.wait_for(receiver.recv(), timeout=5))
+            assert first["type"] == "manifest"
+        await asyncio.wait_for(send_task, timeout=5)
+    finally:
+        relay_task.cancel()
+
+
+def test_sender_finishes_with_receiver_that_does_not_confirm(tmp_path: Path):
+    asyncio.run(async_sender_finishes_with_receiver_that_does_not_confirm(tmp_path))
+
+
+async def async_sender_finishes_with_receiver_that_does_not_confirm(tmp_path: Path):
+    port = _free_port()
+    url = f"ws://localhost:{port}"
+    src = tmp_path / "data.bin"
+    src.write_bytes(os.urandom(3 * CHUNK_SIZE))
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        # an older receiver reads everything up to the EOF and closes without sending 'done'
+        async with connect(url, max_size=None) as receiver:
+            code_hash = SecurityHandler("no-done", False).code_hash.hex()
+            await receiver.send(Hello(type="hello", code_hash_hex=code_hash, role="receiver").to_json())
+            send_task = asyncio.create_task(api_send(server=url, code="no-done", files=[str(src)]))
+            manifest = json.loads(await asyncio.wait_for(receiver.recv(), timeout=5))
+            assert manifest["type"] == "manifest" and not manifest.get("retransmit")
+            while await asyncio.wait_for(receiver.recv(), timeout=5) != EOF:
+                pass
+        assert await asyncio.wait_for(send_task, timeout=5) == 0
+    finally:
+        relay_task.cancel()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog, TransferStats
+from p2p_copy.capabilities import local_capabilities
+from p2p_copy.io_utils import MAX_FRAME, max_chunk_for
+from p2p_copy_server import run_relay, ChaosPlan, Fault, FaultKind
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+# ---------- unit checks ----------
+
+def test_parse_chaos_plan():
+    plan = ChaosPlan.parse("drop@4M, none, pause@512K:2.5s, truncate@100:to-sender, corrupt@1K")
+    assert plan.faults == (
+        Fault(FaultKind.drop, 4 * 2**20),
+        None,
+        Fault(FaultKind.pause, 512 * 2**10, seconds=2.5),
+        Fault(FaultKind.truncate, 100, direction="to_sender"),
+        Fault(FaultKind.corrupt, 1024),
+    )
+    assert plan.fault_for(1) is None and plan.fault_for(5) is None
+    assert ChaosPlan.parse("drop@1K,repeat").fault_for(5) == Fault(FaultKind.drop, 1024)
+    for bad in ("drop", "explode@1M", "pause@1M:soon", "seed=1,size=2"):
+        with pytest.raises(ValueError):
+            ChaosPlan.parse(bad)
+
+
+def test_seeded_plan_is_deterministic():
+    a = ChaosPlan.parse("seed=7,pairs=20,max=8M")
+    assert a == ChaosPlan.seeded(7, 20, 8 * 2**20)
+    assert a != ChaosPlan.seeded(8, 20, 8 * 2**20)
+    assert {f.kind for f in a.faults} == set(FaultKind)
+    assert all(0 <= f.after_bytes < 8 * 2**20 for f in a.faults)
+
+
+# ---------- recovery cost through the relay ----------
+
+@dataclass
+class Recovery:
+    fault: str
+    attempts: int
+    seconds: float
+    bytes_sent: int
+
+    def __str__(self) -> str:
+        return f"{self.fault}: {self.attempts} attempts, {self.seconds:.2f} s, {self.bytes_sent / 2**20:.1f} MiB sent"
+
+
+async def _recover(tmp_path: Path, fault: str, size: int, max_attempts: int = 3) -> Recovery:
+    """Send one file with resume through a faulty relay until it arrives; count time and file bytes sent."""
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    payload = os.urandom(size)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+    events = EventLog(tmp_path / "relay.jsonl")
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               chaos=ChaosPlan.parse(fault), events=events))
+    bytes_sent = 0
+    try:
+        await asyncio.sleep(0.1)
+        t0 = time.perf_counter()
+        for attempt in range(1, max_attempts + 1):
+            code = f"chaos-{attempt}"
+            recv_task = asyncio.create_task(api_receive(server=server_url, code=code, out=str(out)))
+            await asyncio.sleep(0.1)
+            stats = TransferStats()
+            send_rc = await api_send(server=server_url, code=code, files=[str(src)], compress=CompressMode.off,
+                                     resume=True, stats=stats)
+            recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+            bytes_sent += stats.bytes_raw
+            if send_rc == 0 and recv_rc == 0:
+                break
+        seconds = time.perf_counter() - t0
+    finally:
+        relay_task.cancel()
+        events.close()
+
+    assert (out / "data.bin").read_bytes() == payload
+    assert '"event": "fault"' in (tmp_path / "relay.jsonl").read_text()
+    return Recovery(fault, attempt, seconds, bytes_sent)
+
+
+@pytest.mark.parametrize("fault", ["drop@3M", "truncate@3M", "pause@3M:0.5s"])
+def test_resume_recovery_cost(tmp_path: Path, fault: str):
+    result = asyncio.run(_recover(tmp_path, fault, size=8 * 2**20))
+    print(f"\n[chaos] {result}")
+    size = 8 * 2**20
+    if fault.startswith("pause"):
+        assert result.attempts == 1 and result.seconds >= 0.5
+        assert result.bytes_sent == size
+    else:
+        assert result.attempts == 2
+        # resume keeps what arrived: the re-sent part is less than the whole file
+        assert size < result.bytes_sent < 2 * size
+
+
+# ---------- corrupted frames are sent again ----------
+
+@pytest.mark.parametrize("encrypt", [False, True])
+def test_corrupted_frame_costs_one_chunk(tmp_path: Path, encrypt: bool):
+    if encrypt:
+        pytest.importorskip("cryptography")
+        pytest.importorskip("argon2")
+    asyncio.run(async_corrupted_frame_costs_one_chunk(tmp_path, encrypt))
+
+
+async def async_corrupted_frame_costs_one_chunk(tmp_path: Path, encrypt: bool):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    size = 8 * 2**20
+    payload = os.urandom(size)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+    events = EventLog(tmp_path / "recv.jsonl")
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               chaos=ChaosPlan.parse("corrupt@3M")))
+    send_stats, recv_stats = TransferStats(), TransferStats()
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="corrupt", out=str(out),
+                                                    encrypt=encrypt, stats=recv_stats, events=events))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="corrupt", files=[str(src)], encrypt=encrypt,
+                                 compress=CompressMode.off, stats=send_stats)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+    finally:
+        relay_task.cancel()
+        events.close()
+
+    # one attempt: the receiver asked for the chunk again instead of failing
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    assert send_stats.retransmits == recv_stats.retransmits == 1
+    assert recv_stats.bytes_raw == size
+    assert size < send_stats.bytes_raw < 2 * size  # the frames in flight were sent again
+    assert '"event": "retransmit"' in (tmp_path / "recv.jsonl").read_text()
+
+
+# ---------- a drop after the last file ----------
+
+def test_drop_after_eof_is_reported_without_reconnecting(tmp_path: Path):
+    asyncio.run(async_drop_after_eof_is_reported_without_reconnecting(tmp_path))
+
+
+async def async_drop_after_eof_is_reported_without_reconnecting(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    payload = os.urandom(2**20)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+    events = EventLog(tmp_path / "send.jsonl")
+    # the receiver's capabilities reply gets through, its 'done' after the EOF does not
+    reply = local_capabilities(False, max_chunk_for(MAX_FRAME)).to_json()
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               chaos=ChaosPlan.parse(f"drop@{len(reply)}:to-sender")))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="no-done", out=str(out)))
+        await asyncio.sleep(0.1)
+        t0 = time.perf_counter()
+        send_rc = await api_send(server=server_url, code="no-done", files=[str(src)], reconnect=10, events=events)
+        elapsed = time.perf_counter() - t0
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+    finally:
+        relay_task.cancel()
+        events.close()
+
+    assert recv_rc == 0 and (out / "data.bin").read_bytes() == payload
+    # the sender cannot know whether the receiver finished, but does not wait for it to come back
+    assert send_rc == 3 and elapsed < 5
+    log = (tmp_path / "send.jsonl").read_text()
+    assert "completion unconfirmed" in log and '"event": "connection_lost"' not in log
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+from contextlib import closing
+from pathlib import Path
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog
+from p2p_copy.checkpoint import Checkpoint, RawChain, hash_tail
+from p2p_copy.io_utils import compute_chain_up_to, CHUNK_SIZE
+from p2p_copy_server import run_relay, ChaosPlan
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+# ---------- unit checks ----------
+
+def test_raw_chain_matches_compute_chain_up_to(tmp_path: Path):
+    data = os.urandom(3 * CHUNK_SIZE + 12345)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    _, expected = asyncio.run(compute_chain_up_to(path))
+
+    # pieces that do not line up with the blocks, as after appending to a partial file
+    chain, pos = RawChain(), 0
+    for size in (1000, CHUNK_SIZE, 7, 2 * CHUNK_SIZE, 5000000):
+        chain.update(data[pos:pos + size])
+        pos += size
+    assert chain.size == len(data) and chain.digest() == expected
+
+    # continuing from a checkpoint hashes only the tail
+    half = RawChain()
+    half.update(data[:2 * CHUNK_SIZE])
+    cp = Checkpoint("data.bin", half.offset, half.chain.hex())
+    assert asyncio.run(hash_tail(path, cp.chain())).digest() == expected
+
+
+def test_checkpoint_is_ignored_if_it_does_not_fit(tmp_path: Path):
+    dest = tmp_path / "part.bin"
+    dest.write_bytes(b"x" * CHUNK_SIZE)
+    Checkpoint("part.bin", CHUNK_SIZE, "00" * 32).save(dest)
+    assert Checkpoint.load(dest, "part.bin") == Checkpoint("part.bin", CHUNK_SIZE, "00" * 32)
+    assert Checkpoint.load(dest, "other.bin") is None
+    dest.write_bytes(b"x" * 100)  # truncated below the checkpoint
+    assert Checkpoint.load(dest, "part.bin") is None
+    Checkpoint.remove(dest)
+    assert not Checkpoint.file_for(dest).exists()
+
+
+# ---------- resume from a checkpoint ----------
+
+def test_resume_hashes_only_after_checkpoint(tmp_path: Path):
+    asyncio.run(async_resume_hashes_only_after_checkpoint(tmp_path))
+
+
+async def async_resume_hashes_only_after_checkpoint(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    size = 16 * 2**20
+    payload = os.urandom(size)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+    dest = out / "data.bin"
+    every = 2 * 2**20
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               chaos=ChaosPlan.parse("drop@9M,none")))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="cp-1", out=str(out),
+                                                    checkpoint_every=every))
+        await asyncio.sleep(0.1)
+        await api_send(server=server_url, code="cp-1", files=[str(src)], compress=CompressMode.off)
+        assert await asyncio.wait_for(recv_task, timeout=10) == 4
+
+        partial = dest.stat().st_size
+        cp = Checkpoint.load(dest, "data.bin")
+        assert cp is not None and every <= cp.offset <= partial < size
+
+        events = EventLog(tmp_path / "recv.jsonl")
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="cp-2", out=str(out),
+                                                    checkpoint_every=every, events=events))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="cp-2", files=[str(src)], compress=CompressMode.off,
+                                 resume=True)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+        events.close()
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert dest.read_bytes() == payload
+    assert not Checkpoint.file_for(dest).exists()
+    log = [json.loads(line) for line in (tmp_path / "recv.jsonl").read_text().splitlines()]
+    resume = next(e for e in log if e["event"] == "resume")
+    assert resume["hashed"] == partial - cp.offset
+    start = next(e for e in log if e["event"] == "file_start")
+    assert start["append_from"] == partial  # the checkpointed chain matched the sender's
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog
+from p2p_copy.io_utils import CHUNK_SIZE, MIN_CHUNK, MAX_CHUNK, MAX_FRAME, chunk_size_for, max_chunk_for
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _events(path: Path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+# ---------- unit checks ----------
+
+def test_max_chunk_leaves_room_for_frame_overhead():
+    assert max_chunk_for(MAX_FRAME) == CHUNK_SIZE
+    assert max_chunk_for(3 * 2**20) == CHUNK_SIZE  # rounded down to a power of two
+    assert max_chunk_for(2**30) == MAX_CHUNK
+
+
+def test_chunk_size_follows_file_size_and_rate():
+    big = 2**30
+    assert chunk_size_for(big, CHUNK_SIZE) == CHUNK_SIZE  # nothing measured yet
+    assert chunk_size_for(1000, CHUNK_SIZE) == MIN_CHUNK  # small files get small chunks
+    assert chunk_size_for(1 * 2**20, CHUNK_SIZE) == 2**18
+    assert chunk_size_for(big, MAX_CHUNK, rate=1e9) == 2**23  # 10 ms at 1 GB/s
+    assert chunk_size_for(big, CHUNK_SIZE, rate=1e9) == CHUNK_SIZE  # the frame limit wins
+    assert chunk_size_for(big, MAX_CHUNK, rate=1e6) == MIN_CHUNK  # slow link
+    assert chunk_size_for(big, 2**14) == 2**14  # a path with tiny frames
+
+
+# ---------- end-to-end through the relay ----------
+
+@pytest.mark.parametrize("relay_frame, receiver_frame, limit", [
+    (8 * 2**20, 8 * 2**20, 4 * 2**20),
+    (MAX_FRAME, 8 * 2**20, CHUNK_SIZE),  # the relay's limit is smaller
+    (MAX_FRAME, 2**18, 2**17),  # the receiver's limit is smaller
+])
+def test_chunks_fit_negotiated_frame_size(tmp_path: Path, relay_frame: int, receiver_frame: int, limit: int):
+    asyncio.run(async_chunks_fit_negotiated_frame_size(tmp_path, relay_frame, receiver_frame, limit))
+
+
+async def async_chunks_fit_negotiated_frame_size(tmp_path: Path, relay_frame: int, receiver_frame: int, limit: int):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    src.mkdir()
+    # the first large file is sent before any throughput is measured, the second one after
+    payloads = {"a.bin": os.urandom(24 * 2**20), "b.bin": os.urandom(24 * 2**20), "c.txt": os.urandom(5000)}
+    for name, data in payloads.items():
+        (src / name).write_bytes(data)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, max_frame=relay_frame))
+    send_log = EventLog(tmp_path / "send.jsonl")
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="frames", out=str(out),
+                                                    max_frame=receiver_frame))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="frames", files=[str(src)], compress=CompressMode.on,
+                                 events=send_log)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=30)
+    finally:
+        relay_task.cancel()
+        send_log.close()
+
+    assert send_rc == 0 and recv_rc == 0
+    for name, data in payloads.items():
+        assert (out / "src" / name).read_bytes() == data
+    chunks = {e["path"]: e["chunk"] for e in _events(tmp_path / "send.jsonl") if e["event"] == "file_start"}
+    assert chunks["src/a.bin"] == min(CHUNK_SIZE, limit)
+    assert MIN_CHUNK <= chunks["src/b.bin"] <= limit
+    assert chunks["src/c.txt"] == MIN_CHUNK
+
+
+def test_receiver_rejects_tiny_frame_limit(tmp_path: Path):
+    rc = asyncio.run(api_receive(server="ws://localhost:1", code="x", out=str(tmp_path), max_frame=1000))
+    assert rc == 4
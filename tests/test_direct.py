@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import socket
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive
+from p2p_copy import direct
+from p2p_copy_server import run_relay, RateLimits
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+PAYLOAD = random.Random(5).randbytes(4 * (1 << 20))
+
+
+async def _transfer(tmp_path: Path, *, send_direct: bool, recv_direct: bool,
+                    rate_limits: RateLimits | None = None):
+    # the direct connection has no TLS, so it is only used for encrypted transfers
+    pytest.importorskip("cryptography")
+    pytest.importorskip("argon2")
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "data.bin"
+    src.write_bytes(PAYLOAD)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, rate_limits=rate_limits))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(
+            api_receive(server=server_url, code="d", encrypt=True, out=str(out), direct=recv_direct))
+        await asyncio.sleep(0.1)
+        t0 = time.perf_counter()
+        send_rc = await asyncio.wait_for(
+            api_send(server=server_url, code="d", files=[str(src)], encrypt=True, direct=send_direct), timeout=60)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=30)
+        elapsed = time.perf_counter() - t0
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == PAYLOAD
+    return elapsed
+
+
+def test_direct_path_bypasses_relay(tmp_path):
+    # through the relay 4 MiB at 4 Mbit/s would take about 8 seconds
+    slow_relay = RateLimits(pair_mbit=4)
+    elapsed = asyncio.run(_transfer(tmp_path, send_direct=True, recv_direct=True, rate_limits=slow_relay))
+    assert elapsed < 4.0
+
+
+def test_direct_tries_next_candidate(tmp_path, monkeypatch):
+    # the first address is unreachable from the sender, the second works
+    connect = direct.connect
+
+    def unreachable_first(url, **kwargs):
+        if "127.0.0.2" in url:
+            raise OSError("unreachable")
+        return connect(url, **kwargs)
+
+    monkeypatch.setattr(direct, "local_addresses", lambda ws: ["127.0.0.2", "127.0.0.1"])
+    monkeypatch.setattr(direct, "connect", unreachable_first)
+    monkeypatch.setattr(direct, "CONNECT_TIMEOUT", 0.5)
+    elapsed = asyncio.run(_transfer(tmp_path, send_direct=True, recv_direct=True, rate_limits=RateLimits(pair_mbit=4)))
+    assert elapsed < 4.0
+
+
+def test_direct_falls_back_to_relay(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(direct, "local_addresses", lambda ws: ["192.0.2.1"])
+    monkeypatch.setattr(direct, "CONNECT_TIMEOUT", 0.5)
+    asyncio.run(_transfer(tmp_path, send_direct=True, recv_direct=True))
+
+
+def test_direct_receiver_with_relay_only_sender(tmp_path):
+    asyncio.run(_transfer(tmp_path, send_direct=False, recv_direct=True))
+
+
+def test_direct_receiver_survives_lost_relay(tmp_path):
+    asyncio.run(async_direct_receiver_survives_lost_relay(tmp_path))
+
+
+async def async_direct_receiver_survives_lost_relay(tmp_path: Path):
+    pytest.importorskip("cryptography")
+    pytest.importorskip("argon2")
+    port = _free_port()
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    await asyncio.sleep(0.1)
+    # the receiver waits for a sender that never comes when the relay goes away
+    recv_task = asyncio.create_task(api_receive(server=f"ws://localhost:{port}", code="gone", encrypt=True,
+                                                out=str(tmp_path), direct=True))
+    await asyncio.sleep(0.3)
+    relay_task.cancel()
+    assert await asyncio.wait_for(recv_task, timeout=10) == 4
+
+
+def test_direct_listener_binds_offered_addresses_only(monkeypatch):
+    asyncio.run(async_direct_listener_binds_offered_addresses_only(monkeypatch))
+
+
+async def async_direct_listener_binds_offered_addresses_only(monkeypatch):
+    class FakeRelay:
+        sent = []
+
+        async def send(self, frame):
+            self.sent.append(frame)
+
+    # 192.0.2.1 is not an address of this host and cannot be bound
+    monkeypatch.setattr(direct, "local_addresses", lambda ws: ["192.0.2.1", "127.0.0.1"])
+    relay = FakeRelay()
+    listener = await direct.DirectListener.start(relay)
+    try:
+        assert [sock.getsockname()[0] for server in listener.servers for sock in server.sockets] == ["127.0.0.1"]
+        offer = json.loads(relay.sent[0])
+        assert [c.rsplit(":", 1)[0] for c in offer["candidates"]] == ["ws://127.0.0.1"]
+    finally:
+        listener.close()
+
+
+def test_direct_needs_encryption(tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"x")
+    assert asyncio.run(api_send(server="ws://localhost:1", code="c", files=[str(src)], direct=True)) == 3
+    assert asyncio.run(api_receive(server="ws://localhost:1", code="c", out=str(tmp_path), direct=True)) == 4
+
+
+def test_local_addresses_include_loopback():
+    class FakeTransport:
+        @staticmethod
+        def get_extra_info(name):
+            return ("10.1.2.3", 5555)
+
+    class FakeWs:
+        transport = FakeTransport()
+
+    addresses = direct.local_addresses(FakeWs())
+    assert addresses[0] == "10.1.2.3"
+    assert "127.0.0.1" in addresses
+    assert len(addresses) == len(set(addresses))
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import socket
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode
+from p2p_copy_server import run_relay, NetworkEmulation, LinkProfile
+from p2p_copy_server.emulation import EmulatedLink, PROFILES
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+# ---------- unit checks ----------
+
+def test_parse_profile():
+    assert LinkProfile.parse("dsl") == PROFILES["dsl"]
+    assert LinkProfile.parse("lte, loss=0.02") == LinkProfile(mbit=20, latency=0.035, jitter=0.015, loss=0.02)
+    assert LinkProfile.parse("mbit=10,latency=40ms,stall-every=5s,stall=250ms") == \
+           LinkProfile(mbit=10, latency=0.04, stall_every=5.0, stall=0.25)
+    for bad in ("fibre", "speed=10", "latency=fast", "loss=1"):
+        with pytest.raises(ValueError):
+            LinkProfile.parse(bad)
+
+
+def test_link_delays_without_blocking_the_reader():
+    asyncio.run(async_link_delays_without_blocking_the_reader())
+
+
+async def async_link_delays_without_blocking_the_reader():
+    arrived = []
+    t0 = time.monotonic()
+
+    async def deliver(frame):
+        arrived.append((frame, time.monotonic() - t0))
+
+    link = EmulatedLink(LinkProfile(latency=0.2), deliver)
+    for i in range(5):
+        await link.send(bytes([i]))
+    queued = time.monotonic() - t0
+    await link.close()
+
+    assert queued < 0.05  # frames in flight overlap
+    assert [f for f, _ in arrived] == [bytes([i]) for i in range(5)]
+    assert all(0.19 <= t < 0.35 for _, t in arrived), arrived
+
+
+def test_link_bandwidth_and_loss_keep_order():
+    asyncio.run(async_link_bandwidth_and_loss_keep_order())
+
+
+async def async_link_bandwidth_and_loss_keep_order():
+    arrived = []
+
+    async def deliver(frame):
+        arrived.append(frame)
+
+    # 8 Mbit/s = 1 MB/s: 20 frames of 20 kB take about 0.4 s
+    link = EmulatedLink(LinkProfile(mbit=8, jitter=0.01, loss=0.05), deliver, random.Random(1))
+    frames = [bytes([i]) * 20_000 for i in range(20)]
+    t0 = time.monotonic()
+    for frame in frames:
+        await link.send(frame)
+    await link.close()
+    elapsed = time.monotonic() - t0
+
+    assert arrived == frames
+    assert link.lost > 0  # 14 packets per frame at 5 % loss
+    assert elapsed >= 0.35
+
+
+# ---------- end-to-end through the relay ----------
+
+def test_emulated_latency_slows_transfer(tmp_path: Path):
+    asyncio.run(async_emulated_latency_slows_transfer(tmp_path))
+
+
+async def async_emulated_latency_slows_transfer(tmp_path: Path):
+    host = "localhost"
+    port = _free_port()
+    server_url = f"ws://{host}:{port}"
+    code = "emulated-wan"
+
+    payload = bytes(range(256)) * 4096  # 1 MiB
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+
+    wan = LinkProfile(mbit=100, latency=0.1, jitter=0.01, loss=0.001)
+    emulation = NetworkEmulation(to_receiver=wan, to_sender=wan, seed=7)
+    relay_task = asyncio.create_task(run_relay(host=host, port=port, use_tls=False, emulation=emulation))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code=code, out=str(out)))
+        await asyncio.sleep(0.1)
+
+        t0 = time.perf_counter()
+        send_rc = await api_send(server=server_url, code=code, files=[str(src)], compress=CompressMode.off)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+        elapsed = time.perf_counter() - t0
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    # at least the data's trip to the receiver and its 'done' back, plus 84 ms at 100 Mbit
+    assert elapsed >= 0.25, f"emulation not applied ({elapsed:.3f}s)"
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from contextlib import closing
+
+import pytest
+from websockets.asyncio.client import connect
+
+from p2p_copy import run, LoopKind
+from p2p_copy import event_loop
+from p2p_copy.protocol import Hello
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+async def _loop_type_name() -> str:
+    return type(asyncio.get_running_loop()).__module__
+
+
+def test_run_falls_back_to_asyncio_without_uvloop(monkeypatch, capsys):
+    monkeypatch.setattr(event_loop, "_import_uvloop", lambda: None)
+    assert run(_loop_type_name(), loop=LoopKind.uvloop).startswith("asyncio")
+    assert "uvloop is not installed" in capsys.readouterr().out
+
+
+def test_run_uses_uvloop_when_installed():
+    pytest.importorskip("uvloop")
+    assert run(_loop_type_name(), loop="uvloop").startswith("uvloop")
+
+
+# ---------- benchmark: small frames through the relay ----------
+
+FRAMES = 20000
+FRAME_SIZE = 1024
+
+
+async def _pump_frames() -> float:
+    """Send FRAMES small binary frames sender -> relay -> receiver, return seconds."""
+    port = _free_port()
+    url = f"ws://localhost:{port}"
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        async with connect(url, compression=None) as receiver, connect(url, compression=None) as sender:
+            await receiver.send(Hello(type="hello", code_hash_hex="cd" * 32, role="receiver").to_json())
+            await asyncio.sleep(0.05)
+            await sender.send(Hello(type="hello", code_hash_hex="cd" * 32, role="sender").to_json())
+            await sender.recv()  # ready
+
+            frame = b"x" * FRAME_SIZE
+
+            async def consume():
+                for _ in range(FRAMES):
+                    await receiver.recv()
+
+            t0 = time.perf_counter()
+            consumer = asyncio.create_task(consume())
+            for _ in range(FRAMES):
+                await sender.send(frame)
+            await asyncio.wait_for(consumer, timeout=60)
+            return time.perf_counter() - t0
+    finally:
+        relay_task.cancel()
+
+
+def test_frame_rate_per_event_loop():
+    kinds = [LoopKind.asyncio]
+    try:
+        import uvloop  # noqa: F401
+        kinds.append(LoopKind.uvloop)
+    except ImportError:
+        print("\n[bench] uvloop not installed, measuring asyncio only")
+
+    print()
+    for kind in kinds:
+        cpu0 = time.process_time()
+        seconds = run(_pump_frames(), loop=kind)
+        cpu = time.process_time() - cpu0
+        print(f"[bench] loop={kind.value}: {FRAMES / seconds:,.0f} frames/s, "
+              f"cpu={cpu:.2f}s for {FRAMES} frames of {FRAME_SIZE} B (relay + both clients in one process)")
+        assert seconds > 0
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import os
+import socket
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List
+
+from p2p_copy import send as api_send, receive as api_receive, EventLog
+from p2p_copy.security import SecurityHandler
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _read_events(path: Path) -> List[Dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_transfer_event_logs(tmp_path):
+    asyncio.run(async_transfer_event_logs(tmp_path))
+
+
+async def async_transfer_event_logs(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.bin").write_bytes(os.urandom(1_500_000))
+    (src / "b.txt").write_text("hello " * 1000)
+
+    logs = {name: tmp_path / f"{name}.jsonl" for name in ("sender", "receiver", "relay")}
+    relay_events = EventLog(logs["relay"])
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, events=relay_events))
+    try:
+        await asyncio.sleep(0.1)
+        with EventLog(logs["receiver"]) as recv_events, EventLog(logs["sender"]) as send_events:
+            recv_task = asyncio.create_task(api_receive(server=server_url, code="events", out=str(tmp_path / "out"),
+                                                        events=recv_events))
+            await asyncio.sleep(0.05)
+            assert await api_send(server=server_url, code="events", files=[str(src)], events=send_events) == 0
+            assert await asyncio.wait_for(recv_task, timeout=20) == 0
+        for _ in range(50):  # the relay ends the pair once both connections are closed
+            await asyncio.sleep(0.05)
+            if "pair_end" in logs["relay"].read_text():
+                break
+    finally:
+        relay_task.cancel()
+        relay_events.close()
+
+    pair = SecurityHandler("events", False).code_hash.hex()[:12]
+    for role in ("sender", "receiver"):
+        events = _read_events(logs[role])
+        names = [e["event"] for e in events]
+        assert names[:4] == ["connect", "paired", "negotiated", "manifest"]
+        assert names[-1] == "transfer_end" and events[-1]["rc"] == 0
+        assert names.count("file_start") == names.count("file_end") == 2
+        assert all(e["source"] == role and e["pair"] == pair for e in events)
+        assert [e["ts"] for e in events] == sorted(e["ts"] for e in events)
+        assert sum(e["bytes"] for e in events if e["event"] == "file_end") == 1_500_000 + 6000
+
+    relay = _read_events(logs["relay"])
+    assert [e["event"] for e in relay] == ["paired", "pair_end"]
+    assert all(e["source"] == "relay" and e["pair"] == pair for e in relay)
+    assert relay[1]["bytes_from_sender"] > 1_500_000
+
+
+def test_failed_transfer_logs_error(tmp_path):
+    asyncio.run(async_failed_transfer_logs_error(tmp_path))
+
+
+async def async_failed_transfer_logs_error(tmp_path: Path):
+    stream = io.StringIO()
+    with EventLog(stream) as events:
+        assert await api_send(server="ws://localhost:1", code="x", files=[str(tmp_path / "missing")],
+                              events=events) == 3
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert events[-1]["event"] == "error" and events[-1]["rc"] == 3 and events[-1]["source"] == "sender"
+
+
+def test_relay_logs_rejections():
+    asyncio.run(async_relay_logs_rejections())
+
+
+async def async_relay_logs_rejections():
+    from websockets.asyncio.client import connect
+    from p2p_copy.protocol import Hello
+
+    port = _free_port()
+    stream = io.StringIO()
+    events = EventLog(stream)
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, events=events))
+    try:
+        await asyncio.sleep(0.1)
+        hello = Hello(type="hello", code_hash_hex="ab" * 32, role="sender").to_json()
+        async with connect(f"ws://localhost:{port}") as first, connect(f"ws://localhost:{port}") as second:
+            await first.send(hello)
+            await asyncio.sleep(0.05)
+            await second.send(hello)
+            await asyncio.sleep(0.1)
+    finally:
+        relay_task.cancel()
+        events.close()
+
+    rejected = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert rejected == [{"ts": rejected[0]["ts"], "source": "relay", "event": "rejected",
+                         "pair": "ab" * 6, "role": "sender", "reason": "duplicate"}]
+
+
+def test_emit_does_not_wait_for_writes(tmp_path):
+    class SlowStream(io.StringIO):
+        def write(self, s):
+            time.sleep(0.05)
+            return super().write(s)
+
+    stream = SlowStream()
+    log = EventLog(stream).bind(pair="p")
+    t0 = time.perf_counter()
+    for i in range(20_000):
+        log.emit("tick", i=i)
+    emitted = time.perf_counter() - t0
+    log.close()
+
+    lines = stream.getvalue().splitlines()
+    assert emitted < 0.5
+    assert len(lines) == 20_000
+    assert json.loads(lines[-1]) == {"ts": json.loads(lines[-1])["ts"], "source": "p2p_copy", "pair": "p",
+                                     "event": "tick", "i": 19_999}
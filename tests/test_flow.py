@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog, TransferStats
+from p2p_copy.flow import CreditWindow, parse_window, AUTO_WINDOW
+from p2p_copy.io_utils import CHUNK_SIZE
+from p2p_copy_server import run_relay, ChaosPlan, NetworkEmulation, LinkProfile
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _events(path: Path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+# ---------- unit checks ----------
+
+def test_parse_window():
+    assert parse_window("auto") == 0
+    assert parse_window("16") == 16 * 2**20
+    assert parse_window("0.5") == 2**19
+    for bad in ("0", "-1", "lots"):
+        with pytest.raises(ValueError):
+            parse_window(bad)
+
+
+def test_credit_window_bounds_bytes_in_flight():
+    asyncio.run(async_credit_window_bounds_bytes_in_flight())
+
+
+async def async_credit_window_bounds_bytes_in_flight():
+    flow = CreditWindow(3 * 100)
+    # the first frame may go before the receiver grants anything, the next one waits
+    assert await flow.acquire(100) == 0.0
+    waiting = asyncio.create_task(flow.acquire(100))
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+    flow.open(300)
+    await waiting
+    await flow.acquire(100)
+    assert flow.in_flight == 300 and flow.credit == 0
+
+    waiting = asyncio.create_task(flow.acquire(100))
+    await asyncio.sleep(0.05)
+    assert not waiting.done() and flow.waits == 2
+    flow.grant(100)  # one frame written
+    assert await waiting > 0
+    assert flow.in_flight == 300
+
+    # a lost connection ends the wait
+    waiting = asyncio.create_task(flow.acquire(100))
+    await asyncio.sleep(0)
+    flow.close(ConnectionError("lost"))
+    with pytest.raises(ConnectionError):
+        await waiting
+    flow.reset()
+    assert flow.in_flight == 0 and await flow.acquire(100) == 0.0
+
+
+def test_auto_window_grows_with_the_bandwidth_delay_product():
+    flow = CreditWindow(0)
+    assert flow.window == AUTO_WINDOW and flow.wanted() is None
+    flow.min_rtt, flow.max_rate = 0.1, 200 * 2**20  # 20 MiB in flight per round trip
+    assert flow.wanted() == 40 * CHUNK_SIZE
+    assert flow.wanted() is None  # asked for once
+    assert CreditWindow(4 * CHUNK_SIZE).wanted() is None  # a fixed window stays
+
+
+# ---------- end-to-end through the relay ----------
+
+@pytest.mark.parametrize("window", [1, 4 * CHUNK_SIZE])
+def test_transfer_with_window(tmp_path: Path, window: int):
+    asyncio.run(async_transfer_with_window(tmp_path, window))
+
+
+async def async_transfer_with_window(tmp_path: Path, window: int):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    payload = os.urandom(10 * CHUNK_SIZE + 777)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    stats = TransferStats()
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="flow", out=str(out)))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="flow", files=[str(src)], compress=CompressMode.off,
+                                 window=window, stats=stats)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    assert "credit_wait" in stats.stages
+    if window == 1:
+        # smaller than a frame: one frame at a time, each waits for the credit of the one before
+        assert stats.stages["credit_wait"] > 0
+
+
+def test_auto_window_grows_on_a_slow_link(tmp_path: Path):
+    asyncio.run(async_auto_window_grows_on_a_slow_link(tmp_path))
+
+
+async def async_auto_window_grows_on_a_slow_link(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    payload = os.urandom(48 * CHUNK_SIZE)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+
+    link = LinkProfile(latency=0.1)
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               emulation=NetworkEmulation(to_receiver=link, to_sender=link)))
+    send_log, recv_log = EventLog(tmp_path / "send.jsonl"), EventLog(tmp_path / "recv.jsonl")
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="auto", out=str(out), events=recv_log))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="auto", files=[str(src)], compress=CompressMode.off,
+                                 window=0, events=send_log)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=30)
+    finally:
+        relay_task.cancel()
+        send_log.close()
+        recv_log.close()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    # a 200 ms round trip needs more than the initial window in flight
+    asked = [e["bytes"] for e in _events(tmp_path / "send.jsonl") if e["event"] == "window"]
+    granted = [e["bytes"] for e in _events(tmp_path / "recv.jsonl") if e["event"] == "window"]
+    assert asked and asked[0] > AUTO_WINDOW
+    assert granted == asked
+
+
+def test_window_survives_reconnect(tmp_path: Path):
+    asyncio.run(async_window_survives_reconnect(tmp_path))
+
+
+async def async_window_survives_reconnect(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    payload = os.urandom(12 * CHUNK_SIZE)
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               chaos=ChaosPlan.parse("drop@5M")))
+    stats = TransferStats()
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="flow-rc", out=str(out)))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="flow-rc", files=[str(src)], compress=CompressMode.off,
+                                 window=2 * CHUNK_SIZE, reconnect=20, stats=stats)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=20)
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    assert stats.reconnects == 1
+    # only the window was in flight when the connection broke
+    assert stats.bytes_raw <= len(payload) + 3 * CHUNK_SIZE
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, GatherLayout
+from p2p_copy.gather import GatherPlacement
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+SENDERS = 5
+
+
+async def _gather(tmp_path: Path, layout: GatherLayout, encrypt: bool = False, same_name: bool = False):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    out = tmp_path / "out"
+    sources = []
+    for i in range(SENDERS):
+        src = tmp_path / f"task{i}" / ("result.txt" if same_name else f"result{i}.txt")
+        src.parent.mkdir(parents=True)
+        src.write_bytes(f"output of task {i}\n".encode() * (1000 * (i + 1)))
+        sources.append(src)
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        # some senders connect before the collector, the others after it
+        send_tasks = [asyncio.create_task(api_send(server=server_url, code="results", files=[str(src)],
+                                                   encrypt=encrypt, gather=True))
+                      for src in sources[:2]]
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="results", encrypt=encrypt,
+                                                    out=str(out), gather=SENDERS, layout=layout))
+        await asyncio.sleep(0.1)
+        send_tasks += [asyncio.create_task(api_send(server=server_url, code="results", files=[str(src)],
+                                                    encrypt=encrypt, gather=True))
+                       for src in sources[2:]]
+        send_rcs = await asyncio.wait_for(asyncio.gather(*send_tasks), timeout=60)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=30)
+    finally:
+        relay_task.cancel()
+    return sources, out, send_rcs, recv_rc
+
+
+@pytest.mark.parametrize("encrypt", [False, True])
+def test_gather_into_subdirectories(tmp_path, encrypt):
+    sources, out, send_rcs, recv_rc = asyncio.run(_gather(tmp_path, GatherLayout.subdirs, encrypt))
+    assert send_rcs == [0] * SENDERS and recv_rc == 0
+
+    received = sorted(out.glob("sender-*/*"))
+    assert len(received) == SENDERS
+    assert sorted(p.read_bytes() for p in received) == sorted(src.read_bytes() for src in sources)
+
+
+def test_gather_merged_tree(tmp_path):
+    sources, out, send_rcs, recv_rc = asyncio.run(_gather(tmp_path, GatherLayout.merge_rename))
+    assert send_rcs == [0] * SENDERS and recv_rc == 0
+    for src in sources:
+        assert (out / src.name).read_bytes() == src.read_bytes()
+
+
+def test_gather_merged_tree_renames_conflicts(tmp_path):
+    sources, out, send_rcs, recv_rc = asyncio.run(_gather(tmp_path, GatherLayout.merge_rename, same_name=True))
+    assert recv_rc == 0
+    received = sorted(out.glob("result*.txt"))
+    assert len(received) == SENDERS
+    assert sorted(p.read_bytes() for p in received) == sorted(src.read_bytes() for src in sources)
+
+
+def test_gather_merged_tree_fails_on_conflict(tmp_path):
+    sources, out, send_rcs, recv_rc = asyncio.run(_gather(tmp_path, GatherLayout.merge_fail, same_name=True))
+    assert recv_rc != 0
+    assert (out / "result.txt").read_bytes() in {src.read_bytes() for src in sources}
+
+
+@pytest.mark.parametrize("layout", list(GatherLayout))
+def test_gather_keeps_senders_inside_output_directory(tmp_path, layout):
+    placement = GatherPlacement(tmp_path / "out", layout)
+    base = (tmp_path / "out" / ("sender-1" if layout == GatherLayout.subdirs else "")).resolve()
+    assert placement.place(1, "a/../b.txt") == base / "b.txt"
+    for rel in ("../../x", "a/../../x", "/etc/passwd", "."):
+        with pytest.raises(ValueError, match="outside the output directory"):
+            placement.place(1, rel)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from perf_suite import DATASETS, load_baseline, regressions, run_suite
+
+
+def test_perf_suite_smoke(tmp_path: Path):
+    # a tiny run keeps the suite working; P2P_COPY_PERF=1 runs the real one below
+    results = asyncio.run(run_suite(["small-files", "mixed"], encrypt=(False,), scale=0.01, repeat=1,
+                                    workdir=tmp_path))
+    assert [r.case for r in results] == ["small-files/plain", "mixed/plain"]
+    assert results[0].files == 20 and results[1].files == DATASETS["mixed"].files
+    assert all(r.bytes > 0 and r.mib_per_s > 0 for r in results)
+
+
+@pytest.mark.skipif(not os.environ.get("P2P_COPY_PERF"), reason="set P2P_COPY_PERF=1 to run the full suite")
+def test_perf_against_baseline(tmp_path: Path):
+    baseline = load_baseline()
+    if baseline is None:
+        pytest.skip("no baseline for this machine, create one with: python tests/perf_suite.py")
+    results = asyncio.run(run_suite(workdir=tmp_path))
+    tolerance = float(os.environ.get("P2P_COPY_PERF_TOLERANCE", "0.15"))
+    assert regressions(results, baseline, tolerance) == []
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import pstats
+import socket
+from contextlib import closing
+from pathlib import Path
+
+from p2p_copy import send as api_send, receive as api_receive
+from p2p_copy.profiling import Profiler
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+async def _transfer(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    (tmp_path / "a.bin").write_bytes(os.urandom(4 * 2**20))
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="profile", out=str(tmp_path / "out")))
+        await asyncio.sleep(0.05)
+        assert await api_send(server=server_url, code="profile", files=[str(tmp_path / "a.bin")]) == 0
+        assert await asyncio.wait_for(recv_task, timeout=20) == 0
+    finally:
+        relay_task.cancel()
+
+
+def test_profile_covers_loop_threads_and_memory(tmp_path):
+    with Profiler(tmp_path / "prof" / "run", sample_interval=0.02) as profiler:
+        asyncio.run(_transfer(tmp_path))
+
+    names = sorted(p.name for p in profiler.files)
+    assert names == ["run-loop.prof", "run-threads.prof", "run.txt"]
+
+    loop = pstats.Stats(str(tmp_path / "prof" / "run-loop.prof"))
+    assert any(func[2] == "send" and func[0].endswith("api.py") for func in loop.stats)
+    threads = pstats.Stats(str(tmp_path / "prof" / "run-threads.prof"))
+    assert any("read" in func[2] for func in threads.stats)  # fp.read in asyncio.to_thread
+
+    assert profiler.traced_peak >= 2**20  # at least one chunk
+    assert "network" in profiler.stage_peaks
+    report = (tmp_path / "prof" / "run.txt").read_text()
+    assert "== CPU, other threads ==" in report and "per stage" in report
+
+
+def test_profile_without_memory(tmp_path):
+    with Profiler(tmp_path / "run", memory=False) as profiler:
+        asyncio.run(_transfer(tmp_path))
+    assert not profiler.stage_peaks
+    assert "Memory" not in (tmp_path / "run.txt").read_text()
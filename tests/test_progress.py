@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import List
+
+from p2p_copy import send as api_send, receive as api_receive
+from p2p_copy.progress import Progress, progress_line
+from p2p_copy_server import run_relay, RateLimits
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def test_progress_reports_are_throttled(tmp_path):
+    asyncio.run(async_progress_reports_are_throttled(tmp_path))
+
+
+async def async_progress_reports_are_throttled(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(3):
+        (src / f"f{i}.bin").write_bytes(os.urandom(2 * 2**20))
+    total = 3 * 2 * 2**20
+
+    sent: List[Progress] = []
+    received: List[Progress] = []
+    # 40 Mbit/s -> about 1.3 s for 6 MiB to the receiver; the sender is done
+    # sooner because the relay buffers frames
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               rate_limits=RateLimits(pair_mbit=40)))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="progress", out=str(tmp_path / "out"),
+                                                    progress=received.append, progress_interval=0.1))
+        await asyncio.sleep(0.05)
+        t0 = time.perf_counter()
+        assert await api_send(server=server_url, code="progress", files=[str(src)],
+                              progress=sent.append, progress_interval=0.1) == 0
+        assert await asyncio.wait_for(recv_task, timeout=20) == 0
+        elapsed = time.perf_counter() - t0
+    finally:
+        relay_task.cancel()
+
+    print(f"\n[progress] {len(received)} receiver reports in {elapsed:.2f} s, last: {progress_line(received[-1])}")
+    assert len(received) >= 5
+    assert any(r.throughput > 0 and r.eta is not None and 0 < r.fraction < 1 for r in received)
+    for reports in (sent, received):
+        assert 1 <= len(reports) <= elapsed / 0.1 + 3
+        assert [r.bytes_done for r in reports] == sorted(r.bytes_done for r in reports)
+        assert reports[-1].done and not any(r.done for r in reports[:-1])
+        assert (reports[-1].bytes_done, reports[-1].bytes_total) == (total, total)
+        assert (reports[-1].files_done, reports[-1].files_total) == (3, 3)
+
+
+def test_progress_counts_resumed_files(tmp_path):
+    asyncio.run(async_progress_counts_resumed_files(tmp_path))
+
+
+async def async_progress_counts_resumed_files(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "done.bin").write_bytes(os.urandom(300_000))
+    (src / "half.bin").write_bytes(os.urandom(300_000))
+    out = tmp_path / "out" / "src"
+    out.mkdir(parents=True)
+    (out / "done.bin").write_bytes((src / "done.bin").read_bytes())
+    (out / "half.bin").write_bytes((src / "half.bin").read_bytes()[:100_000])
+
+    sent: List[Progress] = []
+    received: List[Progress] = []
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="resume-progress",
+                                                    out=str(tmp_path / "out"), progress=received.append))
+        await asyncio.sleep(0.05)
+        assert await api_send(server=server_url, code="resume-progress", files=[str(src)], resume=True,
+                              progress=sent.append) == 0
+        assert await asyncio.wait_for(recv_task, timeout=20) == 0
+    finally:
+        relay_task.cancel()
+
+    for reports in (sent, received):
+        final = reports[-1]
+        assert (final.bytes_done, final.bytes_total, final.files_done) == (600_000, 600_000, 2)
+
+
+def test_progress_line_formats_long_transfers():
+    p = Progress(bytes_done=3 * 2**40, bytes_total=6 * 2**40, files_done=3, files_total=10, throughput=85.3e6,
+                 eta=25 * 3600 + 61.9)
+    assert progress_line(p) == " 50% 3.0 TiB/6.0 TiB  3/10 files  85.3 MB/s  ETA 25:01:01"
+    assert progress_line(Progress(0, 0, 0, 0, 0.0, None)).endswith("ETA -:--:--")
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog, TransferStats
+from p2p_copy.protocol import Hello
+from p2p_copy_server import run_relay, ChaosPlan, PairingLimits
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _events(path: Path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.mark.parametrize("encrypt", [False, True])
+@pytest.mark.parametrize("fault", ["drop@5M", "drop@5M,drop@2M"])
+def test_reconnect_continues_mid_file(tmp_path: Path, fault: str, encrypt: bool):
+    if encrypt:
+        pytest.importorskip("cryptography")
+        pytest.importorskip("argon2")
+    asyncio.run(async_reconnect_continues_mid_file(tmp_path, fault, encrypt))
+
+
+async def async_reconnect_continues_mid_file(tmp_path: Path, fault: str, encrypt: bool):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    code = "reconnect-me"
+    size = 12 * 2**20
+    src = tmp_path / "src"
+    src.mkdir()
+    payloads = {"a.bin": os.urandom(size), "b.txt": b"0123456789abcdef" * 2**16}
+    for name, data in payloads.items():
+        (src / name).write_bytes(data)
+    out = tmp_path / "out"
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               chaos=ChaosPlan.parse(fault)))
+    send_stats, recv_stats = TransferStats(), TransferStats()
+    send_log, recv_log = EventLog(tmp_path / "send.jsonl"), EventLog(tmp_path / "recv.jsonl")
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code=code, out=str(out), encrypt=encrypt,
+                                                    stats=recv_stats, events=recv_log))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code=code, files=[str(src)], encrypt=encrypt,
+                                 compress=CompressMode.auto, reconnect=20, stats=send_stats, events=send_log)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=20)
+    finally:
+        relay_task.cancel()
+        send_log.close()
+        recv_log.close()
+
+    assert send_rc == 0 and recv_rc == 0
+    for name, data in payloads.items():
+        assert (out / "src" / name).read_bytes() == data
+    drops = fault.count("@")
+    assert send_stats.reconnects == recv_stats.reconnects == drops
+    # continued where the receiver stopped: nothing was written twice, only frames in flight were sent again
+    total = sum(map(len, payloads.values()))
+    assert recv_stats.bytes_raw == total
+    assert total < send_stats.bytes_raw < 2 * total
+    sent = _events(tmp_path / "send.jsonl")
+    assert [e["event"] for e in sent].count("reconnected") == drops
+    assert all(e["offset"] > 0 for e in sent if e["event"] == "reconnected")
+    assert [e["path"] for e in sent if e["event"] == "file_start"] == ["src/a.bin", "src/b.txt"]
+
+
+def test_relay_keeps_code_for_broken_session(tmp_path: Path):
+    asyncio.run(async_relay_keeps_code_for_broken_session())
+
+
+async def async_relay_keeps_code_for_broken_session():
+    port = _free_port()
+    url = f"ws://localhost:{port}"
+    code_hash = "ab" * 32
+
+    def hello(role: str, session: str = "", reconnect: bool = False) -> str:
+        return Hello(type="hello", code_hash_hex=code_hash, role=role, session=session,
+                     reconnect=reconnect).to_json()
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               pairing=PairingLimits(reconnect_grace=5)))
+    try:
+        await asyncio.sleep(0.1)
+        sender = await connect(url)
+        await sender.send(hello("sender", "s1"))
+        receiver = await connect(url)
+        await receiver.send(hello("receiver"))
+        assert json.loads(await sender.recv())["type"] == "ready"
+        sender.transport.abort()
+        with pytest.raises(ConnectionClosed):
+            await receiver.recv()
+        await asyncio.sleep(1.2)  # the relay gives the other side a second to finish
+
+        # another transfer cannot take the code while the session may come back
+        async with connect(url) as intruder:
+            await intruder.send(hello("sender", "s2"))
+            with pytest.raises(ConnectionClosed):
+                await intruder.recv()
+            assert intruder.close_code == 1013
+
+        # both sides of the session pair again
+        async with connect(url) as sender, connect(url) as receiver:
+            await sender.send(hello("sender", "s1", reconnect=True))
+            await receiver.send(hello("receiver", "s1", reconnect=True))
+            assert json.loads(await sender.recv())["type"] == "ready"
+            await receiver.send("hi")
+            assert await sender.recv() == "hi"
+    finally:
+        relay_task.cancel()
+
+
+def test_relay_forgets_expired_session(tmp_path: Path):
+    asyncio.run(async_relay_forgets_expired_session(tmp_path))
+
+
+async def async_relay_forgets_expired_session(tmp_path: Path):
+    port = _free_port()
+    url = f"ws://localhost:{port}"
+
+    def hello(code_hash: str, role: str, session: str = "") -> str:
+        return Hello(type="hello", code_hash_hex=code_hash, role=role, session=session).to_json()
+
+    relay_log = EventLog(tmp_path / "relay.jsonl")
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, events=relay_log,
+                                               pairing=PairingLimits(reconnect_grace=0.1)))
+    try:
+        await asyncio.sleep(0.1)
+        # a broken session whose code never connects again
+        sender = await connect(url)
+        await sender.send(hello("ab" * 32, "sender", "s1"))
+        receiver = await connect(url)
+        await receiver.send(hello("ab" * 32, "receiver"))
+        assert json.loads(await sender.recv())["type"] == "ready"
+        sender.transport.abort()
+        with pytest.raises(ConnectionClosed):
+            await receiver.recv()
+        await asyncio.sleep(1.2)  # the relay gives the other side a second to finish
+
+        # another pair clears it out
+        async with connect(url) as sender, connect(url) as receiver:
+            await sender.send(hello("cd" * 32, "sender"))
+            await receiver.send(hello("cd" * 32, "receiver"))
+            assert json.loads(await sender.recv())["type"] == "ready"
+    finally:
+        relay_task.cancel()
+        relay_log.close()
+
+    events = _events(tmp_path / "relay.jsonl")
+    assert next(e for e in events if e["event"] == "pair_end")["session_kept"]
+    assert [e["pair"] for e in events if e["event"] == "session_expired"] == ["ab" * 6]
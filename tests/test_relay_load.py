@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from load_relay import run_load
+
+pytestmark = pytest.mark.skipif(not Path("/proc/self/stat").exists(), reason="needs /proc")
+
+
+def test_load_harness_smoke():
+    # a short run keeps the harness working; P2P_COPY_LOAD_PAIRS runs a real ramp
+    pairs = [int(p) for p in os.environ.get("P2P_COPY_LOAD_PAIRS", "5,20").split(",")]
+    results = asyncio.run(run_load(pairs, frame_size=16384, rate=10, duration=1.0,
+                                   max_pairing_ms=5000, min_efficiency=0.5, stop_at_degradation=False))
+    for r in results:
+        print(f"\n[load] {r}")
+    assert [r.pairs for r in results] == pairs
+    assert all(r.errors == 0 and r.throughput_mbit > 0 and r.relay_rss_mib > 0 for r in results)
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from p2p_copy.protocol import Hello, loads
+from p2p_copy_server import run_relay, PairingLimits
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _hello(code_hash: str, role: str) -> str:
+    return Hello(type="hello", code_hash_hex=code_hash, role=role).to_json()
+
+
+def _rss_kib(pid: int) -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+# ---------- waiting-room limits ----------
+
+def test_waiter_is_closed_after_timeout():
+    asyncio.run(async_waiter_is_closed_after_timeout())
+
+
+async def async_waiter_is_closed_after_timeout():
+    port = _free_port()
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               pairing=PairingLimits(wait_timeout=0.3)))
+    try:
+        await asyncio.sleep(0.1)
+        async with connect(f"ws://localhost:{port}") as ws:
+            await ws.send(_hello("ab" * 32, "receiver"))
+            t0 = time.perf_counter()
+            with pytest.raises(ConnectionClosed):
+                await asyncio.wait_for(ws.recv(), timeout=3)
+            assert ws.close_reason == "No peer within timeout"
+            assert 0.25 < time.perf_counter() - t0 < 2
+    finally:
+        relay_task.cancel()
+
+
+def test_waiting_room_full_rejects_new_waiters():
+    asyncio.run(async_waiting_room_full_rejects_new_waiters())
+
+
+async def async_waiting_room_full_rejects_new_waiters():
+    port = _free_port()
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               pairing=PairingLimits(max_waiting=1)))
+    try:
+        await asyncio.sleep(0.1)
+        async with connect(f"ws://localhost:{port}") as first, connect(f"ws://localhost:{port}") as second:
+            await first.send(_hello("01" * 32, "receiver"))
+            await asyncio.sleep(0.1)
+            await second.send(_hello("02" * 32, "receiver"))
+            with pytest.raises(ConnectionClosed):
+                await asyncio.wait_for(second.recv(), timeout=2)
+            assert second.close_reason == "Waiting room full"
+
+            # the waiting client still gets paired
+            async with connect(f"ws://localhost:{port}") as sender:
+                await sender.send(_hello("01" * 32, "sender"))
+                ready = loads(await asyncio.wait_for(sender.recv(), timeout=2))
+                assert ready["type"] == "ready"
+    finally:
+        relay_task.cancel()
+
+
+# ---------- load: many simultaneous waiters ----------
+
+def test_many_waiters_memory_and_pairing_latency():
+    """
+    Park many receivers in the relay, then pair a sample of them and measure
+    relay memory per waiter and hello->ready latency. The number of waiters
+    defaults to 1000; set P2P_COPY_LOAD_WAITERS=50000 (with a matching
+    open-files limit) for the full load test.
+    """
+    n = int(os.environ.get("P2P_COPY_LOAD_WAITERS", "1000"))
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = n + 200
+    if soft < needed:
+        if hard != resource.RLIM_INFINITY and hard < needed:
+            pytest.skip(f"open-files limit {hard} too low for {n} waiters")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+    if not Path("/proc/self/status").exists():
+        pytest.skip("needs /proc to measure relay memory")
+
+    host = "localhost"
+    port = _free_port()
+    relay_proc = subprocess.Popen(
+        ["p2p-copy", "run-relay-server", host, str(port), "--no-tls"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        time.sleep(0.5)
+        results = asyncio.run(_park_and_pair(host, port, n, sample=min(200, n), pid=relay_proc.pid))
+    finally:
+        relay_proc.terminate()
+        relay_proc.wait(timeout=5)
+
+    rss_before, rss_after, latencies = results
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    per_waiter = (rss_after - rss_before) / n
+    print(f"\n[load] waiters={n} relay_rss={rss_after / 1024:.1f}MiB ({per_waiter:.1f}KiB/waiter) "
+          f"pairing p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms")
+
+    assert len(latencies) == min(200, n)
+    assert p99 < 2.0
+
+
+async def _park_and_pair(host: str, port: int, n: int, sample: int, pid: int):
+    url = f"ws://{host}:{port}"
+    rss_before = _rss_kib(pid)
+    waiters = []
+
+    async def park(i: int):
+        ws = await connect(url, ping_interval=None, open_timeout=60)
+        await ws.send(_hello(f"{i:064x}", "receiver"))
+        waiters.append(ws)
+
+    # connect in batches to stay below the listen backlog
+    for start in range(0, n, 500):
+        await asyncio.gather(*(park(i) for i in range(start, min(n, start + 500))))
+    await asyncio.sleep(0.5)
+    rss_after = _rss_kib(pid)
+
+    async def pair(i: int) -> float:
+        async with connect(url, ping_interval=None) as ws:
+            t0 = time.perf_counter()
+            await ws.send(_hello(f"{i:064x}", "sender"))
+            await asyncio.wait_for(ws.recv(), timeout=10)
+            return time.perf_counter() - t0
+
+    latencies = await asyncio.gather(*(pair(i) for i in range(sample)))
+    await asyncio.gather(*(ws.close() for ws in waiters), return_exceptions=True)
+    return rss_before, rss_after, list(latencies)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode
+from p2p_copy_server import run_relay, RateLimits
+from p2p_copy_server.scheduler import TokenBucket, FairShare
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+# ---------- unit checks ----------
+
+def test_token_bucket_delays_beyond_burst():
+    bucket = TokenBucket(rate=1000, burst=500)
+    assert bucket.reserve(500) == 0.0
+    # the next 1000 bytes are 1000 bytes in debt -> about one second
+    delay = bucket.reserve(1000)
+    assert 0.9 < delay <= 1.0
+
+
+def test_fair_share_lets_small_flow_overtake_bulk_backlog():
+    asyncio.run(async_fair_share_lets_small_flow_overtake_bulk_backlog())
+
+
+async def async_fair_share_lets_small_flow_overtake_bulk_backlog():
+    share = FairShare(rate=1_000_000)
+    share.bucket.tokens = 0  # start without burst
+    order = []
+
+    async def bulk():
+        for i in range(5):
+            await share.acquire("bulk", 100_000)
+            order.append(f"bulk{i}")
+
+    async def small():
+        await asyncio.sleep(0.05)  # arrives while bulk is being served
+        await share.acquire("small", 1_000)
+        order.append("small")
+
+    await asyncio.gather(bulk(), small())
+    # bulk alone would need 0.5 s; the small frame must not wait behind all of it
+    assert order.index("small") <= 2, order
+
+
+@pytest.mark.parametrize("weight", [0.0, -1.0])
+def test_ip_weight_must_be_positive(weight: float):
+    with pytest.raises(ValueError):
+        RateLimits(uplink_mbit=100, ip_weights={"10.0.0.1": weight})
+
+
+# ---------- end-to-end through the relay ----------
+
+def test_pair_rate_limit_slows_transfer(tmp_path: Path):
+    asyncio.run(async_pair_rate_limit_slows_transfer(tmp_path))
+
+
+async def async_pair_rate_limit_slows_transfer(tmp_path: Path):
+    host = "localhost"
+    port = _free_port()
+    server_url = f"ws://{host}:{port}"
+    code = "rate-limited"
+
+    payload = bytes(range(256)) * 16384  # 4 MiB
+    src = tmp_path / "data.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+
+    # 40 Mbit/s = 5 MB/s -> 4 MiB need roughly 0.6 s after the initial burst
+    limits = RateLimits(pair_mbit=40)
+    relay_task = asyncio.create_task(run_relay(host=host, port=port, use_tls=False, rate_limits=limits))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code=code, out=str(out)))
+        await asyncio.sleep(0.1)
+
+        t0 = time.perf_counter()
+        send_rc = await api_send(server=server_url, code=code, files=[str(src)], compress=CompressMode.off)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=10)
+        elapsed = time.perf_counter() - t0
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    assert (out / "data.bin").read_bytes() == payload
+    assert elapsed >= 0.45, f"rate limit not applied ({elapsed:.3f}s)"
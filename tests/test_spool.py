@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, CompressMode, EventLog
+from p2p_copy_server import run_relay, SpoolLimits
+from p2p_copy_server.spool import SpoolStore
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _mk_files(base: Path, layout: dict[str, bytes]) -> None:
+    for rel, content in layout.items():
+        p = base / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(content)
+
+
+def _random_bytes(n: int) -> bytes:
+    return random.Random(7).randbytes(n)
+
+
+LAYOUT = {
+    "a.txt": b"spooled hello",
+    "sub/b.bin": _random_bytes(3 * (1 << 20) + 123),
+}
+
+
+def _needs_encryption():
+    # spooled uploads are always encrypted, the relay keeps them on its disk
+    pytest.importorskip("cryptography")
+    pytest.importorskip("argon2")
+
+
+def test_spool_upload_then_receive_later(tmp_path):
+    _needs_encryption()
+    asyncio.run(async_spool_upload_then_receive_later(tmp_path))
+
+
+async def async_spool_upload_then_receive_later(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    spool_dir = tmp_path / "spool"
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+    _mk_files(src, LAYOUT)
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               spool=SpoolLimits(directory=str(spool_dir))))
+    try:
+        await asyncio.sleep(0.1)
+        # sender finishes without any receiver being connected
+        send_rc = await asyncio.wait_for(
+            api_send(server=server_url, code="later", files=[str(src)], encrypt=True, spool=True), timeout=30)
+        assert send_rc == 0
+        assert len(list(spool_dir.glob("*.spool"))) == 1
+
+        recv_rc = await asyncio.wait_for(
+            api_receive(server=server_url, code="later", encrypt=True, out=str(out)), timeout=30)
+        assert recv_rc == 0
+    finally:
+        relay_task.cancel()
+
+    for rel, content in LAYOUT.items():
+        assert (out / "src" / rel).read_bytes() == content
+    # consumed spools are removed
+    assert not list(spool_dir.glob("*.spool"))
+
+
+def test_spool_replays_to_waiting_receiver_while_uploading(tmp_path):
+    _needs_encryption()
+    asyncio.run(async_spool_replays_to_waiting_receiver_while_uploading(tmp_path))
+
+
+async def async_spool_replays_to_waiting_receiver_while_uploading(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+    _mk_files(src, LAYOUT)
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False,
+                                               spool=SpoolLimits(directory=str(tmp_path / "spool"))))
+    try:
+        await asyncio.sleep(0.1)
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="along", encrypt=True, out=str(out)))
+        await asyncio.sleep(0.1)
+        send_rc = await api_send(server=server_url, code="along", files=[str(src)], encrypt=True,
+                                 compress=CompressMode.off, spool=True)
+        recv_rc = await asyncio.wait_for(recv_task, timeout=30)
+    finally:
+        relay_task.cancel()
+
+    assert send_rc == 0 and recv_rc == 0
+    for rel, content in LAYOUT.items():
+        assert (out / "src" / rel).read_bytes() == content
+
+
+def test_spool_turns_away_receiver_with_small_frames(tmp_path):
+    _needs_encryption()
+    asyncio.run(async_spool_turns_away_receiver_with_small_frames(tmp_path))
+
+
+async def async_spool_turns_away_receiver_with_small_frames(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    spool_dir = tmp_path / "spool"
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+    _mk_files(src, LAYOUT)
+
+    relay_log = EventLog(tmp_path / "relay.jsonl")
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, events=relay_log,
+                                               spool=SpoolLimits(directory=str(spool_dir))))
+    try:
+        await asyncio.sleep(0.1)
+        # the upload is stored in default frames, whether the receiver waits or comes later
+        waiting = asyncio.create_task(api_receive(server=server_url, code="frames", encrypt=True, out=str(out),
+                                                  max_frame=2**18))
+        await asyncio.sleep(0.1)
+        assert await asyncio.wait_for(
+            api_send(server=server_url, code="frames", files=[str(src)], encrypt=True, spool=True), timeout=30) == 0
+        assert await asyncio.wait_for(waiting, timeout=10) == 4
+        assert await asyncio.wait_for(
+            api_receive(server=server_url, code="frames", encrypt=True, out=str(out), max_frame=2**18),
+            timeout=10) == 4
+
+        # the upload is kept for a receiver that takes the default frames
+        assert len(list(spool_dir.glob("*.spool"))) == 1
+        assert await asyncio.wait_for(api_receive(server=server_url, code="frames", encrypt=True, out=str(out)),
+                                      timeout=30) == 0
+    finally:
+        relay_task.cancel()
+        relay_log.close()
+
+    # turned away before the replay, not cut off in the middle of it
+    events = [json.loads(line) for line in (tmp_path / "relay.jsonl").read_text().splitlines()]
+    assert [e.get("reason") for e in events if e["event"] == "rejected"] == ["frame size", "frame size"]
+    assert sum(e["event"] == "spool_replay" for e in events) == 1
+
+    for rel, content in LAYOUT.items():
+        assert (out / "src" / rel).read_bytes() == content
+
+
+def test_spool_quota_rejects_large_upload(tmp_path):
+    _needs_encryption()
+    asyncio.run(async_spool_quota_rejects_large_upload(tmp_path))
+
+
+async def async_spool_quota_rejects_large_upload(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    spool_dir = tmp_path / "spool"
+    src = tmp_path / "src"
+    _mk_files(src, LAYOUT)
+
+    limits = SpoolLimits(directory=str(spool_dir), max_bytes=1 << 20)
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, spool=limits))
+    try:
+        await asyncio.sleep(0.1)
+        send_rc = await asyncio.wait_for(
+            api_send(server=server_url, code="too-big", files=[str(src)], encrypt=True, compress=CompressMode.off,
+                     spool=True),
+            timeout=30)
+    finally:
+        relay_task.cancel()
+
+    assert send_rc != 0
+    assert not list(spool_dir.glob("*.spool"))
+
+
+def test_spool_requires_relay_support_and_no_resume(tmp_path):
+    _needs_encryption()
+    asyncio.run(async_spool_requires_relay_support_and_no_resume(tmp_path))
+
+
+async def async_spool_requires_relay_support_and_no_resume(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"x" * 100)
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        assert await api_send(server=server_url, code="c", files=[str(src)], encrypt=True, spool=True,
+                              resume=True) != 0
+        # plaintext is not left on the relay's disk
+        assert await api_send(server=server_url, code="c", files=[str(src)], spool=True) == 3
+        assert await asyncio.wait_for(api_send(server=server_url, code="c", files=[str(src)], encrypt=True,
+                                               spool=True), timeout=5) != 0
+    finally:
+        relay_task.cancel()
+
+
+def test_failed_upload_keeps_the_upload_that_replaced_it(tmp_path):
+    asyncio.run(async_failed_upload_keeps_the_upload_that_replaced_it(tmp_path))
+
+
+async def async_failed_upload_keeps_the_upload_that_replaced_it(tmp_path):
+    store = SpoolStore(SpoolLimits(directory=str(tmp_path / "spool")))
+    code_hash = "ab" * 32
+    first = store.create(code_hash)
+    await first.append(b"first")
+    second = store.create(code_hash)  # a second upload with the same code replaces the first
+    await second.append(b"second")
+    assert first.aborted
+
+    # the first upload fails and cleans up after itself
+    store.remove(code_hash, first)
+    assert store.get(code_hash) is second
+    assert second.path.exists()
+    await second.append(b"more")
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive, TransferStats
+from p2p_copy.stats import SEND_STAGES, RECEIVE_STAGES
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize("encrypt", [False, True])
+def test_stats_of_sender_and_receiver(tmp_path, encrypt):
+    asyncio.run(async_stats_of_sender_and_receiver(tmp_path, encrypt))
+
+
+async def async_stats_of_sender_and_receiver(tmp_path: Path, encrypt: bool):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"compress me " * 300_000)  # ~3.4 MiB, 4 chunks
+    (src / "b.bin").write_bytes(os.urandom(1_500_000))
+    raw = 12 * 300_000 + 1_500_000
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        sent, received = TransferStats(), TransferStats()
+        recv_task = asyncio.create_task(api_receive(server=server_url, code="stats", encrypt=encrypt,
+                                                    out=str(tmp_path / "out"), stats=received))
+        await asyncio.sleep(0.05)
+        assert await api_send(server=server_url, code="stats", files=[str(src)], encrypt=encrypt, stats=sent) == 0
+        assert await asyncio.wait_for(recv_task, timeout=20) == 0
+    finally:
+        relay_task.cancel()
+
+    print(f"\n[stats] sender\n{sent.summary()}\n[stats] receiver\n{received.summary()}")
+    for stats, stages in ((sent, SEND_STAGES), (received, RECEIVE_STAGES)):
+        assert stats.bytes_raw == raw
+        assert stats.bytes_compressed < raw  # a.txt compresses
+        assert stats.bytes_wire > stats.bytes_compressed  # frame headers, encryption tags, control frames
+        assert [f.path for f in stats.files] == ["src/a.txt", "src/b.bin"]
+        assert [f.compression for f in stats.files] == ["zstd", "none"]
+        assert stats.files[1].bytes_compressed == stats.files[1].bytes_raw == 1_500_000
+        assert all(f.seconds > 0 for f in stats.files)
+        assert set(stats.stages) == set(stages)
+        assert stats.bottleneck in stages
+        assert 0 < stats.elapsed < 20
+        assert stats.to_dict()["bottleneck"] == stats.bottleneck
+    assert sent.bytes_wire == received.bytes_wire
+    assert sent.role == "sender" and received.role == "receiver"
+
+
+def test_bottleneck_is_the_slowest_stage():
+    stats = TransferStats()
+    assert stats.bottleneck is None
+    stats.begin("receiver")
+    stats.bytes_raw = 1
+    stats.add("write", 2.0)
+    stats.add("recv_wait", 0.5)
+    stats.add("write", 0.1)
+    stats.end()
+    assert stats.bottleneck == "write"
+    assert "bottleneck: write (disk write)" in stats.summary()
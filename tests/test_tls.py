@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import socket
+import statistics
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from p2p_copy import send as api_send, receive as api_receive
+from p2p_copy import tls
+from p2p_copy.protocol import Hello
+from p2p_copy_server import run_relay, TlsOptions
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def localhost_cert(tmp_path, monkeypatch):
+    """Self-signed certificate for localhost, trusted by the client context."""
+    pytest.importorskip("cryptography")
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(key, hashes.SHA256()))
+    certfile, keyfile = tmp_path / "cert.pem", tmp_path / "key.pem"
+    certfile.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    keyfile.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                          serialization.NoEncryption()))
+
+    monkeypatch.setenv("SSL_CERT_FILE", str(certfile))
+    monkeypatch.setattr(tls, "_client_context", None)
+    return str(certfile), str(keyfile)
+
+
+def test_tls_transfer_resumes_session(tmp_path, localhost_cert):
+    asyncio.run(async_tls_transfer_resumes_session(tmp_path, *localhost_cert))
+
+
+async def async_tls_transfer_resumes_session(tmp_path: Path, certfile: str, keyfile: str):
+    port = _free_port()
+    server_url = f"wss://localhost:{port}"
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"over tls" * 1000)
+
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, certfile=certfile, keyfile=keyfile,
+                                               tls_options=TlsOptions(min_version="1.3")))
+    try:
+        await asyncio.sleep(0.1)
+        for i in range(2):
+            recv_task = asyncio.create_task(api_receive(server=server_url, code="tls", out=str(tmp_path / f"out{i}")))
+            await asyncio.sleep(0.05)
+            assert await api_send(server=server_url, code="tls", files=[str(src)]) == 0
+            assert await asyncio.wait_for(recv_task, timeout=10) == 0
+            assert (tmp_path / f"out{i}" / "a.txt").read_bytes() == src.read_bytes()
+
+        # a session of an earlier transfer is reused for the next connection
+        async with tls.connect_relay(server_url) as ws:
+            ssl_object = ws.transport.get_extra_info("ssl_object")
+            assert ssl_object.version() == "TLSv1.3"
+            assert ssl_object.session_reused
+    finally:
+        relay_task.cancel()
+
+
+# ---------- benchmark: latency to the first data byte ----------
+
+ROUNDS = 20
+
+
+async def _first_byte_latency(server_url: str, code: str, resume_sessions: bool) -> tuple[float, bool]:
+    """Seconds from the sender's connect until its first data frame reaches the receiver, and session reuse."""
+    code_hash = code.encode().hex()
+    async with tls.connect_relay(server_url) as receiver:
+        await receiver.send(Hello(type="hello", code_hash_hex=code_hash, role="receiver").to_json())
+        await asyncio.sleep(0.01)
+        if not resume_sessions:
+            tls._client_context = None  # new context, full handshake
+        t0 = time.perf_counter()
+        async with tls.connect_relay(server_url) as sender:
+            await sender.send(Hello(type="hello", code_hash_hex=code_hash, role="sender").to_json())
+            await sender.recv()  # ready
+            await sender.send(b"x")
+            await receiver.recv()
+            return time.perf_counter() - t0, sender.transport.get_extra_info("ssl_object").session_reused
+
+
+def test_time_to_first_byte_with_session_resumption(localhost_cert):
+    asyncio.run(async_time_to_first_byte_with_session_resumption(*localhost_cert))
+
+
+async def async_time_to_first_byte_with_session_resumption(certfile: str, keyfile: str):
+    port = _free_port()
+    server_url = f"wss://localhost:{port}"
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, certfile=certfile, keyfile=keyfile))
+    try:
+        await asyncio.sleep(0.1)
+        results, reused = {}, {}
+        for resume_sessions in (False, True):
+            samples = [await _first_byte_latency(server_url, f"ttfb-{resume_sessions}-{i}", resume_sessions)
+                       for i in range(ROUNDS)]
+            results[resume_sessions] = statistics.median(s for s, _ in samples)
+            reused[resume_sessions] = sum(r for _, r in samples)
+    finally:
+        relay_task.cancel()
+
+    print(f"\n[bench] time to first byte over wss (median of {ROUNDS}): "
+          f"full handshake {results[False] * 1000:.2f} ms, resumed session {results[True] * 1000:.2f} ms "
+          f"({reused[True]}/{ROUNDS} resumed)")
+    assert reused[False] == 0
+    assert reused[True] == ROUNDS
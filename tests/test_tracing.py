@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List
+
+from p2p_copy import send as api_send, receive as api_receive
+from p2p_copy.protocol import Hello, Manifest
+from p2p_copy.tracing import Tracer, parse_traceparent
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _read_spans(path: Path) -> Dict[str, List[dict]]:
+    """Spans per service.name from an OTLP JSON-lines file."""
+    spans: Dict[str, List[dict]] = {}
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            service = resource["resource"]["attributes"][0]["value"]["stringValue"]
+            for scope in resource["scopeSpans"]:
+                spans.setdefault(service, []).extend(scope["spans"])
+    return spans
+
+
+def test_spans_of_all_processes_share_one_trace(tmp_path):
+    asyncio.run(async_spans_of_all_processes_share_one_trace(tmp_path))
+
+
+async def async_spans_of_all_processes_share_one_trace(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.bin").write_bytes(os.urandom(1_500_000))
+    (src / "b.bin").write_bytes(os.urandom(200_000))
+    out = tmp_path / "out" / "src"
+    out.mkdir(parents=True)
+    (out / "a.bin").write_bytes((src / "a.bin").read_bytes()[:500_000])  # resumed from here
+
+    trace_file = tmp_path / "trace.jsonl"
+    relay_tracer = Tracer(trace_file, service="relay")
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False, tracer=relay_tracer))
+    try:
+        await asyncio.sleep(0.1)
+        with Tracer(trace_file, service="receiver") as recv_tracer, Tracer(trace_file, service="sender") as tracer:
+            recv_task = asyncio.create_task(api_receive(server=server_url, code="trace", out=str(tmp_path / "out"),
+                                                        tracer=recv_tracer))
+            await asyncio.sleep(0.05)
+            assert await api_send(server=server_url, code="trace", files=[str(src)], resume=True, tracer=tracer) == 0
+            assert await asyncio.wait_for(recv_task, timeout=20) == 0
+        for _ in range(50):  # the relay flushes once the pair has ended
+            await asyncio.sleep(0.05)
+            if "relay" in _read_spans(trace_file):
+                break
+    finally:
+        relay_task.cancel()
+
+    spans = _read_spans(trace_file)
+    assert len({s["traceId"] for service in spans.values() for s in service}) == 1
+    names = {service: sorted({s["name"] for s in service_spans}) for service, service_spans in spans.items()}
+    assert names["sender"] == ["connect", "file", "manifest", "pairing", "resume_hash", "send"]
+    assert names["receiver"] == ["connect", "file", "manifest", "pairing", "receive", "resume_hash"]
+    assert names["relay"] == ["relay_pair", "relay_wait"]
+
+    root = next(s for s in spans["sender"] if s["name"] == "send")
+    assert "parentSpanId" not in root
+    for s in spans["relay"] + [next(s for s in spans["receiver"] if s["name"] == "receive")]:
+        assert s["parentSpanId"] == root["spanId"]
+    for service_spans in spans.values():
+        for s in service_spans:
+            assert int(s["startTimeUnixNano"]) <= int(s["endTimeUnixNano"])
+            assert s["status"] == {"code": 1}
+    sender_files = [s for s in spans["sender"] if s["name"] == "file"]
+    appended = next(s for s in sender_files if {"key": "path", "value": {"stringValue": "src/a.bin"}} in s["attributes"])
+    assert {"key": "append_from", "value": {"intValue": "500000"}} in appended["attributes"]
+
+
+def test_traceparent_is_optional_in_hello_and_manifest():
+    assert "traceparent" not in Hello(type="hello", code_hash_hex="00", role="sender").to_json()
+    assert "traceparent" not in Manifest(type="manifest", entries=[]).to_json()
+    assert parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01") == ("a" * 32, "b" * 16)
+    assert parse_traceparent("garbage") is None and parse_traceparent(None) is None
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import os
+import socket
+import time
+from contextlib import closing
+from pathlib import Path
+
+from p2p_copy import send as api_send, receive as api_receive, EventLog, TransferStats
+from p2p_copy.progress import Progress
+from p2p_copy.watchdog import LoopWatchdog
+from p2p_copy_server import run_relay
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def blocking_call(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def test_watchdog_reports_blocking_call():
+    asyncio.run(async_watchdog_reports_blocking_call())
+
+
+async def async_watchdog_reports_blocking_call():
+    stats = TransferStats()
+    async with LoopWatchdog(0.05, stats) as watchdog:
+        await asyncio.sleep(0.1)
+        blocking_call(0.3)
+        await asyncio.sleep(0.1)
+
+    assert len(watchdog.stalls) == stats.loop_stalls == 1
+    assert 0.2 < watchdog.stalls[0].seconds < 0.6
+    assert "blocking_call" in watchdog.stalls[0].stack
+    assert stats.loop_lag_max == watchdog.lag_max >= watchdog.stalls[0].seconds
+    assert "1 stalls" in stats.summary()
+
+
+def test_watchdog_disabled():
+    asyncio.run(async_watchdog_disabled())
+
+
+async def async_watchdog_disabled():
+    async with LoopWatchdog(None) as watchdog:
+        blocking_call(0.1)
+        await asyncio.sleep(0)
+    assert not watchdog.stalls and watchdog.lag_max == 0.0
+
+
+def test_transfer_reports_stall_in_stats_and_events(tmp_path):
+    asyncio.run(async_transfer_reports_stall_in_stats_and_events(tmp_path))
+
+
+async def async_transfer_reports_stall_in_stats_and_events(tmp_path: Path):
+    port = _free_port()
+    server_url = f"ws://localhost:{port}"
+    (tmp_path / "a.bin").write_bytes(os.urandom(3 * 2**20))
+
+    def slow_progress(p: Progress) -> None:
+        if not p.done:
+            blocking_call(0.25)
+
+    stats = TransferStats()
+    stream = io.StringIO()
+    relay_task = asyncio.create_task(run_relay(host="localhost", port=port, use_tls=False))
+    try:
+        await asyncio.sleep(0.1)
+        with EventLog(stream) as events:
+            recv_task = asyncio.create_task(api_receive(server=server_url, code="stall", out=str(tmp_path / "out"),
+                                                        stats=stats, events=events, stall_threshold=0.1,
+                                                        progress=slow_progress, progress_interval=0.05))
+            await asyncio.sleep(0.05)
+            assert await api_send(server=server_url, code="stall", files=[str(tmp_path / "a.bin")]) == 0
+            assert await asyncio.wait_for(recv_task, timeout=20) == 0
+    finally:
+        relay_task.cancel()
+
+    stalls = [e for e in map(json.loads, stream.getvalue().splitlines()) if e["event"] == "loop_stall"]
+    assert stats.loop_stalls == len(stalls) >= 1
+    assert stats.loop_lag_max >= 0.2
+    assert any("slow_progress" in e["stack"] for e in stalls)